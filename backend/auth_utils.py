@@ -1,12 +1,41 @@
 # auth_utils.py
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import jwt
 
 PWD_CTX = CryptContext(schemes=["bcrypt"], deprecated="auto")
-JWT_SECRET = "cambia-esta-clave-por-una-segura"  # en produccin: leer de env
+JWT_SECRET = "cambia-esta-clave-por-una-segura"  # en producción: leer de env
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRE_MINUTES = 60 * 24 * 7  # 7 das
+JWT_EXPIRE_MINUTES = 60 * 24 * 7  # 7 días
+
+# bcrypt tarda cientos de ms de CPU: se ejecuta en un pool acotado para no
+# bloquear el event loop, y si hay demasiadas peticiones en cola se rechaza
+# en lugar de acumular latencia para todos
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", 16))
+
+_pool_hash = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pendientes = 0
+
+# Caché LRU de tokens ya verificados: evita decodificar y validar la firma
+# en cada request del carrito. Una entrada vive TOKEN_CACHE_TTL segundos
+# como máximo y nunca más allá del "exp" del propio token.
+TOKEN_CACHE_MAX = int(os.getenv("TOKEN_CACHE_MAX", 2048))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+
+_cache_tokens = OrderedDict()  # token -> (expira_en, payload)
+_lock_tokens = threading.Lock()
+
+
+class HashSaturado(Exception):
+    """Hay demasiadas operaciones de hash en cola"""
+
 
 def hash_password(password: str) -> str:
     return PWD_CTX.hash(password)
@@ -14,15 +43,53 @@ def hash_password(password: str) -> str:
 def verify_password(plain: str, hashed: str) -> bool:
     return PWD_CTX.verify(plain, hashed)
 
+async def _en_pool_hash(fn, *args):
+    global _hash_pendientes
+    if _hash_pendientes >= HASH_MAX_PENDIENTES:
+        raise HashSaturado()
+    _hash_pendientes += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool_hash, fn, *args)
+    finally:
+        _hash_pendientes -= 1
+
+async def hash_password_async(password: str) -> str:
+    """hash_password en el pool de bcrypt. Lanza HashSaturado si está lleno"""
+    return await _en_pool_hash(hash_password, password)
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """verify_password en el pool de bcrypt. Lanza HashSaturado si está lleno"""
+    return await _en_pool_hash(verify_password, plain, hashed)
+
 def create_token(data: dict, expires_minutes: int = JWT_EXPIRE_MINUTES):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def decode_token(token: str):
+def _decode_token_jwt(token: str):
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         return payload
     except Exception:
         return None
+
+def decode_token(token: str):
+    """Decodifica y verifica el token, usando la caché de tokens verificados"""
+    ahora = time.time()
+    with _lock_tokens:
+        entrada = _cache_tokens.get(token)
+        if entrada:
+            if entrada[0] > ahora:
+                _cache_tokens.move_to_end(token)
+                return entrada[1]
+            del _cache_tokens[token]
+
+    payload = _decode_token_jwt(token)
+    if payload:
+        expira_en = min(ahora + TOKEN_CACHE_TTL, payload.get("exp", ahora + TOKEN_CACHE_TTL))
+        with _lock_tokens:
+            _cache_tokens[token] = (expira_en, payload)
+            while len(_cache_tokens) > TOKEN_CACHE_MAX:
+                _cache_tokens.popitem(last=False)
+    return payload
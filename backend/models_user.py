@@ -1,38 +1,130 @@
 # models_user.py
 import json
 import os
+import hashlib
+import threading
 from typing import Optional
 
+import escritura_segura
+import coordinacion
+
 DB_USERS = os.path.join(os.path.dirname(__file__), "data_users.json")
+CARRITOS_DIR = os.path.join(os.path.dirname(__file__), "carritos")
+
+# Caché en memoria indexada por correo; cada cambio se escribe inmediatamente
+# (write-through). Con varios workers otro proceso puede reescribir el
+# archivo: se recarga cuando cambia su firma (inodo, mtime, tamaño)
+_lock = threading.RLock()
+_cache: Optional[dict] = None
+_firma = None  # Firma de data_users.json cuando se leyó _cache
+
+# Cada carrito vive en su propio archivo (carritos/<hh>/<sha1>.json), así
+# leer o guardar un carrito no toca el archivo de usuarios ni los demás
+# carritos. Locks repartidos por hash para no serializar a todos los usuarios.
+_locks_carrito = [threading.Lock() for _ in range(64)]
+
+def _escribir_json(ruta, data, indent=None):
+    # Temporal + fsync + os.replace atómico (ver escritura_segura)
+    escritura_segura.escribir_texto(ruta, json.dumps(data, ensure_ascii=False, indent=indent))
+
+def _firma_archivo():
+    try:
+        st = os.stat(DB_USERS)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
 def _leer():
-    if not os.path.exists(DB_USERS):
-        return {}
-    with open(DB_USERS, "r", encoding="utf-8") as f:
-        return json.load(f)
+    global _cache, _firma
+    with _lock:
+        firma = _firma_archivo()
+        if _cache is None or firma != _firma:
+            if firma is not None:
+                with open(DB_USERS, "r", encoding="utf-8") as f:
+                    _cache = json.load(f)
+            else:
+                _cache = {}
+            _firma = firma
+        return _cache
 
 def _guardar(data):
-    with open(DB_USERS, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    global _firma
+    _escribir_json(DB_USERS, data, indent=2)
+    _firma = _firma_archivo()  # Es lo que acabamos de escribir: no hace falta releerlo
 
 def crear_usuario(correo: str, nombre: str, password_hashed: str):
-    data = _leer()
-    if correo in data:
-        return False
-    data[correo] = {"nombre": nombre, "password": password_hashed, "carrito": []}
-    _guardar(data)
+    # Entre workers: bajo el lock del diario nadie más escribe, y _leer()
+    # recarga el archivo si otro worker registró a alguien desde la última lectura
+    with coordinacion.exclusivo(), _lock:
+        data = _leer()
+        if correo in data:
+            return False
+        data[correo] = {"nombre": nombre, "password": password_hashed}
+        try:
+            _guardar(data)
+        except Exception:
+            del data[correo]
+            raise
     return True
 
 def obtener_usuario(correo: str) -> Optional[dict]:
     return _leer().get(correo)
 
+# =============================
+# 🛒 Carritos (un archivo por usuario)
+# =============================
+
+def _clave_carrito(correo: str):
+    return hashlib.sha1(correo.strip().lower().encode("utf-8")).hexdigest()
+
+def _ruta_carrito(clave: str):
+    return os.path.join(CARRITOS_DIR, clave[:2], f"{clave}.json")
+
+def _lock_carrito(clave: str):
+    return _locks_carrito[int(clave[:8], 16) % len(_locks_carrito)]
+
+def _leer_carrito(correo: str, clave: str):
+    ruta = _ruta_carrito(clave)
+    if os.path.exists(ruta):
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    # Usuarios anteriores guardaban el carrito dentro de data_users.json
+    u = obtener_usuario(correo)
+    return list(u.get("carrito", [])) if u else []
+
+def _escribir_carrito(clave: str, carrito: list):
+    ruta = _ruta_carrito(clave)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    _escribir_json(ruta, carrito)
+
 def guardar_carrito(correo: str, carrito: list):
-    data = _leer()
-    if correo not in data: return False
-    data[correo]["carrito"] = carrito
-    _guardar(data)
+    if not obtener_usuario(correo): return False
+    clave = _clave_carrito(correo)
+    with _lock_carrito(clave):
+        _escribir_carrito(clave, carrito)
     return True
 
+def actualizar_linea_carrito(correo: str, codigo: str, cantidad: int, datos: Optional[dict] = None):
+    """
+    Cambia una sola línea del carrito: cantidad > 0 la agrega o actualiza
+    (mezclando 'datos'), cantidad <= 0 la elimina. Devuelve el carrito
+    resultante o None si el usuario no existe.
+    """
+    if not obtener_usuario(correo): return None
+    clave = _clave_carrito(correo)
+    with _lock_carrito(clave):
+        carrito = _leer_carrito(correo, clave)
+        linea = next((p for p in carrito if p.get("Codigo") == codigo), None)
+        if cantidad <= 0:
+            carrito = [p for p in carrito if p.get("Codigo") != codigo]
+        elif linea:
+            linea.update(datos or {})
+            linea["cantidad"] = cantidad
+        else:
+            carrito.append({**(datos or {}), "Codigo": codigo, "cantidad": cantidad})
+        _escribir_carrito(clave, carrito)
+    return carrito
+
 def obtener_carrito(correo: str):
-    u = obtener_usuario(correo)
-    return u.get("carrito", []) if u else []
+    clave = _clave_carrito(correo)
+    return _leer_carrito(correo, clave)
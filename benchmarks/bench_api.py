@@ -0,0 +1,309 @@
+"""
+Benchmark de las rutas calientes de la API, en proceso (httpx + ASGI),
+con GitHub y el buscador de imágenes simulados. No usa red ni toca los
+archivos del proyecto: todo se escribe en un directorio temporal.
+
+Escenarios: GET /producto, listado de imágenes, consulta por código,
+admin-upload, lote de imágenes, polling de mensajes y CRUD de contactos.
+Reporta throughput, p50/p99 y RSS máximo, y compara contra una línea base.
+
+Uso:
+    python benchmarks/bench_api.py                           # 1k, 35k y 350k productos
+    python benchmarks/bench_api.py --tamanos 1000 35000
+    python benchmarks/bench_api.py --guardar-baseline        # guarda benchmarks/baseline.json
+    python benchmarks/bench_api.py --tolerancia 0.25         # falla (exit 1) si empeora >25%
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import platform
+from statistics import quantiles
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Antes de importar cualquier módulo del proyecto: bitacora fija el nivel al
+# importarse, y el log INFO de cada petición se mediría como parte de la ruta
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("GITHUB_TOKEN", "token-falso")
+os.environ.setdefault("GITHUB_OWNER", "bench")
+os.environ.setdefault("GITHUB_REPO", "bench")
+os.environ.setdefault("LIMITADOR_ACTIVO", "0")  # Se mide la app, no los límites por cliente
+
+import httpx
+
+import codec_json
+from bench_codec import generar_catalogo
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+# =============================
+# 🧪 GitHub y buscador simulados
+# =============================
+
+class RespuestaFalsa:
+    def __init__(self, status_code, contenido=b""):
+        self.status_code = status_code
+        self.content = contenido
+
+    def json(self):
+        return codec_json.loads(self.content) if self.content else {}
+
+
+class GitHubFalso:
+    """Reemplaza el módulo requests de github_persistence: guarda en memoria con latencia fija"""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.archivos: dict[str, bytes] = {}
+        self.llamadas = 0
+
+    def _nombre(self, url):
+        return url.split("/contents/", 1)[-1]
+
+    def get(self, url, headers=None, timeout=None):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        contenido = self.archivos.get(self._nombre(url))
+        if contenido is None:
+            return RespuestaFalsa(404)
+        if headers and headers.get("Accept", "").endswith("+json"):
+            return RespuestaFalsa(200, codec_json.dumps({"sha": f"{len(contenido):x}"}))
+        return RespuestaFalsa(200, contenido)
+
+    def put(self, url, headers=None, json=None, timeout=None):
+        import base64
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        self.archivos[self._nombre(url)] = base64.b64decode(json["content"])
+        return RespuestaFalsa(201)
+
+
+class GestorImagenesFalso:
+    """Misma interfaz que GestorImagenesProductos.procesar_lote, sin red"""
+
+    def __init__(self, latencia=0.01):
+        self.latencia = latencia
+
+    async def procesar_lote(self, productos):
+        await asyncio.sleep(self.latencia)
+        return [
+            {"Codigo": p.get("Codigo"), "imagen": {"existe": True, "url_github": f"https://img.test/{p.get('Codigo')}.jpg", "fuente": "falso"}}
+            for p in productos
+        ]
+
+
+# =============================
+# 🔧 Preparación de la app
+# =============================
+
+def preparar_app(directorio, latencia_github):
+    """Importa main apuntando todos los archivos a 'directorio' y con servicios simulados"""
+    import main
+    import github_persistence as gh
+    import productos_api
+    import contactos_persistencia
+    import gestor_backups
+    import usuarios_oauth
+
+    falso = GitHubFalso(latencia_github)
+    gh.requests = falso
+    gh.GITHUB_TOKEN, gh.GITHUB_OWNER, gh.GITHUB_REPO = "token-falso", "bench", "bench"
+
+    main.DATA_DIR = os.path.join(directorio, "data")
+    productos_api.PRODUCTOS_FILE = os.path.join(directorio, "productos.json")
+    contactos_persistencia.DIRECCIONES_FILE = os.path.join(directorio, "direcciones.json")
+    contactos_persistencia.TELEFONOS_FILE = os.path.join(directorio, "telefonos.json")
+    gestor_backups.BACKUP_DIR = os.path.join(directorio, "backups")
+    usuarios_oauth.USUARIOS_FILE = os.path.join(directorio, "usuarios.jsonl")
+    usuarios_oauth.USUARIOS_JSON_ANTERIOR = os.path.join(directorio, "usuarios.json")
+    os.makedirs(main.DATA_DIR, exist_ok=True)
+    return main, falso
+
+
+def rss_maximo_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+# =============================
+# ⏱️ Medición
+# =============================
+
+async def medir_escenario(nombre, fn, peticiones, concurrencia):
+    """Ejecuta fn() 'peticiones' veces con 'concurrencia' simultáneas"""
+    latencias = []
+    sem = asyncio.Semaphore(concurrencia)
+
+    async def una(i):
+        async with sem:
+            inicio = time.perf_counter()
+            await fn(i)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(i) for i in range(peticiones)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    if len(latencias) >= 2:
+        cortes = quantiles(latencias, n=100, method="inclusive")
+        p50, p99 = cortes[49], cortes[98]
+    else:
+        p50 = p99 = latencias[0]
+    return {
+        "escenario": nombre,
+        "peticiones": peticiones,
+        "rps": round(peticiones / total, 1),
+        "p50_ms": round(p50 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+    }
+
+
+async def correr_tamano(main, falso, n, args):
+    """Corre todos los escenarios con un catálogo de n productos"""
+    catalogo = generar_catalogo(n)
+    falso.archivos = {"productos.json": codec_json.dumps(catalogo)}
+    main.mensajes.clear()
+
+    await main.startup_event()
+    await main.tarea_refresco_catalogo
+    main.gestor_imagenes = GestorImagenesFalso(args.latencia_imagenes)
+
+    # Volumen de mensajes para el polling
+    for i in range(args.mensajes):
+        await main.enviar_mensaje(main.Mensaje(
+            usuario=f"cliente{i % 50}@test", tipo="cliente", mensaje=f"Mensaje {i}", destinatario="admin"
+        ))
+
+    # Peticiones que recorren todo el catálogo: menos repeticiones con catálogos grandes
+    pesadas = max(3, min(args.peticiones, 2_000_000 // max(n, 1)))
+    codigos = [p["Codigo"] for p in catalogo[:1000]]
+    transporte = httpx.ASGITransport(app=main.app)
+    resultados = []
+
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        async def get_producto(i):
+            r = await cliente.get("/producto")
+            r.raise_for_status()
+
+        async def todas_imagenes(i):
+            r = await cliente.get("/api/productos/todas-imagenes")
+            r.raise_for_status()
+
+        async def imagen_por_codigo(i):
+            r = await cliente.get(f"/api/productos/{codigos[i % len(codigos)]}/imagen")
+            r.raise_for_status()
+
+        async def admin_upload(i):
+            r = await cliente.post("/api/productos/admin-upload", json=catalogo)
+            r.raise_for_status()
+
+        async def lote_imagenes(i):
+            await main.procesar_imagenes_background(catalogo[i * 50:(i + 1) * 50])
+
+        async def polling_mensajes(i):
+            r = await cliente.get("/api/mensajes/recibir", params={"usuario": "admin", "since": max(0, args.mensajes - 20)})
+            r.raise_for_status()
+
+        async def crud_contactos(i):
+            r = await cliente.post("/telefonos", json={"numero": f"449{i:07d}", "descripcion": "bench"})
+            r.raise_for_status()
+            id_tel = r.json()["telefono"]["id"]
+            await cliente.put(f"/telefonos/{id_tel}", json={"numero": f"449{i:07d}", "descripcion": "editado"})
+            await cliente.delete(f"/telefonos/{id_tel}")
+
+        escenarios = [
+            ("GET /producto", get_producto, pesadas, args.concurrencia),
+            ("GET todas-imagenes", todas_imagenes, pesadas, args.concurrencia),
+            ("GET imagen por código", imagen_por_codigo, args.peticiones, args.concurrencia),
+            ("POST admin-upload", admin_upload, max(1, pesadas // 3), 1),
+            ("lote de imágenes (50)", lote_imagenes, max(1, min(5, n // 50)), 1),
+            ("polling mensajes", polling_mensajes, args.peticiones, args.concurrencia),
+            ("CRUD teléfonos", crud_contactos, min(args.peticiones, 50), args.concurrencia),
+        ]
+        for nombre, fn, peticiones, concurrencia in escenarios:
+            resultado = await medir_escenario(nombre, fn, peticiones, concurrencia)
+            resultado["productos"] = n
+            resultados.append(resultado)
+            print(f"{n:>8} {nombre:<24} {resultado['rps']:>9} {resultado['p50_ms']:>10} {resultado['p99_ms']:>10}")
+
+    return resultados
+
+
+# =============================
+# 📏 Línea base
+# =============================
+
+def comparar(resultados, baseline, tolerancia):
+    """Lista de regresiones: p50/p99 más lentos o rps más bajo que la línea base"""
+    previos = {(r["productos"], r["escenario"]): r for r in baseline.get("resultados", [])}
+    regresiones = []
+    for r in resultados:
+        b = previos.get((r["productos"], r["escenario"]))
+        if not b:
+            continue
+        for campo in ("p50_ms", "p99_ms"):
+            if b[campo] and r[campo] > b[campo] * (1 + tolerancia):
+                regresiones.append(f"{r['productos']} {r['escenario']}: {campo} {b[campo]} -> {r[campo]}")
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerancia):
+            regresiones.append(f"{r['productos']} {r['escenario']}: rps {b['rps']} -> {r['rps']}")
+    return regresiones
+
+
+async def correr(args):
+    with tempfile.TemporaryDirectory() as directorio:
+        main, falso = preparar_app(directorio, args.latencia_github)
+        print(f"Codec: {codec_json.BACKEND} | Python {platform.python_version()}")
+        print(f"{'productos':>8} {'escenario':<24} {'rps':>9} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        resultados = []
+        for n in args.tamanos:
+            resultados.extend(await correr_tamano(main, falso, n, args))
+
+    rss = rss_maximo_mb()
+    print(f"\nRSS máximo: {rss} MB | llamadas a GitHub simulado: {falso.llamadas}")
+    return {"resultados": resultados, "rss_max_mb": rss, "python": platform.python_version(), "codec": codec_json.BACKEND}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 35_000, 350_000])
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--mensajes", type=int, default=5_000)
+    parser.add_argument("--latencia-github", type=float, default=0.05, help="segundos por llamada simulada")
+    parser.add_argument("--latencia-imagenes", type=float, default=0.01, help="segundos por sublote simulado")
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+
+    reporte = asyncio.run(correr(args))
+
+    if args.guardar_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regresiones = comparar(reporte["resultados"], baseline, args.tolerancia)
+        if regresiones:
+            print("\n⚠️ Regresiones contra la línea base:")
+            for r in regresiones:
+                print(f"   {r}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones contra la línea base")
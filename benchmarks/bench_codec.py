@@ -0,0 +1,126 @@
+"""
+Benchmark de carga/guardado/respuesta del catálogo: ruta anterior
+(json indent=2 + doble re-parseo de verificación) contra codec_json
+(compacto + checksum).
+
+Uso:
+    python benchmarks/bench_codec.py                 # 35k y 350k productos
+    python benchmarks/bench_codec.py --tamanos 1000 35000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec_json
+
+
+def generar_catalogo(n, semilla=42):
+    """Productos sintéticos con la misma forma que productos.json"""
+    rnd = random.Random(semilla)
+    palabras = ["Tornillo", "Taquete", "Martillo", "Pinza", "Cable", "Foco", "Llave",
+                "Tubo", "Codo", "Brocha", "Pintura", "Cinta", "Candado", "Manguera"]
+    productos = []
+    for i in range(n):
+        nombre = " ".join(rnd.choice(palabras) for _ in range(3)) + f" {rnd.randint(1, 99)}mm"
+        con_imagen = rnd.random() < 0.6
+        productos.append({
+            "Codigo": f"P{i:07d}",
+            "Nombre": nombre,
+            "Precio": round(rnd.uniform(1, 5000), 2),
+            "Existencia": rnd.randint(0, 500),
+            "imagen": {
+                "existe": con_imagen,
+                "url_github": f"https://img.example.com/{i}.jpg" if con_imagen else None,
+                "fuente": "yandex" if con_imagen else ""
+            }
+        })
+    return productos
+
+
+def medir(fn, repeticiones=3):
+    """Mejor tiempo (s) de 'repeticiones' ejecuciones"""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+# =============================
+# Ruta anterior (json indent=2)
+# =============================
+
+def guardar_anterior(ruta, datos):
+    temp = ruta + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    with open(temp, "r", encoding="utf-8") as f:
+        json.load(f)
+    os.replace(temp, ruta)
+    with open(ruta, "r", encoding="utf-8") as f:
+        json.load(f)
+
+
+def cargar_anterior(ruta):
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.loads(f.read())
+
+
+def respuesta_anterior(datos):
+    return json.dumps(datos, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+# =============================
+# Ruta nueva (codec_json)
+# =============================
+
+def guardar_codec(ruta, datos):
+    codec_json.escribir_archivo(ruta, datos)
+
+
+def cargar_codec(ruta):
+    return codec_json.leer_archivo(ruta)
+
+
+def respuesta_codec(datos):
+    return codec_json.dumps(datos)
+
+
+def correr(tamanos, repeticiones):
+    print(f"Backend codec_json: {codec_json.BACKEND}")
+    print(f"{'productos':>10} {'operación':<10} {'anterior (ms)':>14} {'codec (ms)':>12} {'mejora':>8} {'tamaño':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in tamanos:
+            datos = generar_catalogo(n)
+            ruta_ant = os.path.join(tmp, f"anterior_{n}.json")
+            ruta_new = os.path.join(tmp, f"codec_{n}.json")
+
+            t_guardar_ant = medir(lambda: guardar_anterior(ruta_ant, datos), repeticiones)
+            t_guardar_new = medir(lambda: guardar_codec(ruta_new, datos), repeticiones)
+            t_cargar_ant = medir(lambda: cargar_anterior(ruta_ant), repeticiones)
+            t_cargar_new = medir(lambda: cargar_codec(ruta_new), repeticiones)
+            t_resp_ant = medir(lambda: respuesta_anterior(datos), repeticiones)
+            t_resp_new = medir(lambda: respuesta_codec(datos), repeticiones)
+
+            tam = f"{os.path.getsize(ruta_ant) // 1024}K/{os.path.getsize(ruta_new) // 1024}K"
+            for nombre, ant, new in (
+                ("guardar", t_guardar_ant, t_guardar_new),
+                ("cargar", t_cargar_ant, t_cargar_new),
+                ("respuesta", t_resp_ant, t_resp_new),
+            ):
+                print(f"{n:>10} {nombre:<10} {ant * 1000:>14.1f} {new * 1000:>12.1f} {ant / new:>7.1f}x {tam:>16}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[35_000, 350_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+    correr(args.tamanos, args.repeticiones)
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# =============================
+# ⚙️ Configuración (variables de entorno)
+# =============================
+# LOG_LEVEL: DEBUG, INFO, WARNING, ERROR (por defecto INFO)
+# LOG_FORMATO: "texto" (legible) o "json" (una línea JSON por evento)
+# LOG_MUESTREO: 1 de cada N eventos en rutas calientes se registra (por defecto 100)
+NIVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+FORMATO = os.getenv("LOG_FORMATO", "texto").lower()
+MUESTREO = max(1, int(os.getenv("LOG_MUESTREO", "100")))
+
+RAIZ = "ferre"
+
+# =============================
+# 🧾 Formatos
+# =============================
+ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento, con los campos de extra={...}"""
+
+    def format(self, record):
+        evento = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for clave, valor in record.__dict__.items():
+            if clave not in ATRIBUTOS_ESTANDAR and not clave.startswith("_"):
+                evento[clave] = valor
+        if record.exc_info:
+            evento["error"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    """Formato legible; los campos de extra={...} se agregan como clave=valor"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        texto = super().format(record)
+        campos = [
+            f"{clave}={valor}" for clave, valor in record.__dict__.items()
+            if clave not in ATRIBUTOS_ESTANDAR and not clave.startswith("_")
+        ]
+        return f"{texto} {' '.join(campos)}" if campos else texto
+
+
+# =============================
+# 🎲 Muestreo
+# =============================
+
+class _Muestreo:
+    """Contador por clave: deja pasar 1 de cada N llamadas"""
+
+    def __init__(self):
+        self._contadores: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, clave, cada=None):
+        cada = cada or MUESTREO
+        with self._lock:
+            n = self._contadores.get(clave, 0)
+            self._contadores[clave] = n + 1
+        return n % cada == 0
+
+
+muestrear = _Muestreo()
+
+# =============================
+# 🚀 Configuración de handlers
+# =============================
+_listener = None
+_lock_config = threading.Lock()
+
+
+def configurar():
+    """
+    Configura el logger raíz de la app con un QueueHandler: quien registra
+    solo encola el evento y un hilo aparte hace la escritura a stderr
+    """
+    global _listener
+    with _lock_config:
+        if _listener is not None:
+            return
+
+        salida = logging.StreamHandler(sys.stderr)
+        salida.setFormatter(FormatoJSON() if FORMATO == "json" else FormatoTexto())
+
+        cola = queue.SimpleQueue()
+        raiz = logging.getLogger(RAIZ)
+        raiz.setLevel(NIVEL)
+        raiz.addHandler(logging.handlers.QueueHandler(cola))
+        raiz.propagate = False
+
+        _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=False)
+        _listener.start()
+        atexit.register(detener)
+
+
+def detener():
+    """Vacía la cola y detiene el hilo de escritura"""
+    global _listener
+    with _lock_config:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def obtener_logger(nombre):
+    """Logger hijo de la raíz de la app ("ferre.<nombre>")"""
+    configurar()
+    return logging.getLogger(f"{RAIZ}.{nombre}")
+
+
+def debug_muestreado(logger, clave, msg, *args, cada=None):
+    """logger.debug para rutas calientes: solo si DEBUG está activo y 1 de cada N llamadas"""
+    if logger.isEnabledFor(logging.DEBUG) and muestrear(clave, cada):
+        logger.debug(msg, *args)
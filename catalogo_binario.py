@@ -0,0 +1,378 @@
+"""
+Snapshot binario del catálogo, pensado para abrirse con mmap.
+
+Formato (little-endian):
+    cabecera    MAGIA, versión, n registros, n cadenas, desplazamientos de cada sección
+    registros   n × REGISTRO (columnas de ancho fijo, 48 bytes)
+    índice      n × uint32: posiciones de registro ordenadas por Codigo
+    offsets     (n cadenas + 1) × uint64: inicio de cada cadena en la tabla
+    cadenas     UTF-8 concatenado, sin duplicados (la cadena 0 es "")
+
+Los campos que no tienen columna propia, o cuyo valor no cabe exacto en
+ella (null, otro tipo, enteros fuera de ±2**53 en Precio), se guardan
+como JSON en 'extra' y solo se decodifican cuando se lee ese registro.
+
+Uso:
+    python catalogo_binario.py a-binario productos.json productos.fcat
+    python catalogo_binario.py a-json productos.fcat productos.json
+    python catalogo_binario.py info productos.fcat
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+from bisect import bisect_left
+
+import bitacora
+import codec_json
+
+log = bitacora.obtener_logger("catalogo_binario")
+
+# =============================
+# ⚙️ Formato
+# =============================
+MAGIA = b"FCCAT\x00\x00\x01"
+VERSION = 1
+CABECERA = struct.Struct("<8sIIIQQQQ")  # magia, versión, registros, cadenas, off_registros, off_indice, off_offsets, off_cadenas
+# codigo, nombre, url_github, fuente, forma, extra (índices de cadena), banderas, precio, existencia
+REGISTRO = struct.Struct("<IIIIIIB3xdq")
+SIN_CADENA = 0xFFFFFFFF
+
+# Banderas por registro
+PRECIO_NUMERO = 1       # Precio es número (si no, va en 'extra')
+PRECIO_ENTERO = 2       # Precio era int
+EXISTENCIA_ENTERO = 4   # Existencia es int (si no, va en 'extra')
+TIENE_IMAGEN = 8        # 'imagen' es dict con columnas propias
+IMAGEN_EXISTE = 16
+
+COLUMNAS = ("Codigo", "Nombre", "Precio", "Existencia", "imagen")
+COLUMNAS_IMAGEN = ("existe", "url_github", "fuente")
+
+# =============================
+# 💾 Escritura
+# =============================
+
+class _TablaCadenas:
+    def __init__(self):
+        self.indices = {"": 0}
+        self.cadenas = [b""]
+
+    def agregar(self, texto):
+        if texto is None:
+            return SIN_CADENA
+        indice = self.indices.get(texto)
+        if indice is None:
+            indice = self.indices[texto] = len(self.cadenas)
+            self.cadenas.append(texto.encode("utf-8"))
+        return indice
+
+
+def _es_entero(valor, limite=2**63):
+    return isinstance(valor, int) and not isinstance(valor, bool) and -limite <= valor < limite
+
+
+def _imagen_en_columnas(imagen):
+    """La imagen cabe en columnas si sus campos conocidos tienen el tipo esperado"""
+    return (
+        isinstance(imagen, dict)
+        and isinstance(imagen.get("existe", False), bool)
+        and isinstance(imagen.get("url_github"), (str, type(None)))
+        and isinstance(imagen.get("fuente"), (str, type(None)))
+    )
+
+
+def serializar(productos):
+    """Convierte la lista de productos (dicts) a bytes en formato binario"""
+    tabla = _TablaCadenas()
+    registros = bytearray()
+
+    for p in productos:
+        extra = {k: v for k, v in p.items() if k not in COLUMNAS}
+        banderas = 0
+
+        # Sin columna = SIN_CADENA; un null explícito va en 'extra'
+        codigo = p.get("Codigo")
+        if "Codigo" in p and not isinstance(codigo, str):
+            extra["Codigo"], codigo = codigo, None
+        nombre = p.get("Nombre")
+        if "Nombre" in p and not isinstance(nombre, str):
+            extra["Nombre"], nombre = nombre, None
+
+        # Precio va como double: un int solo si se representa exacto
+        precio = p.get("Precio")
+        if _es_entero(precio, 2**53) or isinstance(precio, float):
+            banderas |= PRECIO_NUMERO | (PRECIO_ENTERO if isinstance(precio, int) else 0)
+        elif "Precio" in p:
+            extra["Precio"] = precio
+
+        existencia = p.get("Existencia")
+        if _es_entero(existencia):
+            banderas |= EXISTENCIA_ENTERO
+        elif "Existencia" in p:
+            extra["Existencia"] = existencia
+
+        # 'forma' = orden de claves del producto y de su imagen. Se repite en
+        # casi todos los registros, así que la tabla de cadenas la guarda una vez.
+        forma = {"orden": list(p)}
+        url = fuente = None
+        imagen = p.get("imagen")
+        if _imagen_en_columnas(imagen):
+            banderas |= TIENE_IMAGEN | (IMAGEN_EXISTE if imagen.get("existe") else 0)
+            url, fuente = imagen.get("url_github"), imagen.get("fuente")
+            forma["imagen"] = list(imagen)
+            extra_imagen = {k: v for k, v in imagen.items() if k not in COLUMNAS_IMAGEN}
+            if extra_imagen:
+                extra["__imagen__"] = extra_imagen
+        elif "imagen" in p:
+            extra["imagen"] = imagen
+
+        registros += REGISTRO.pack(
+            tabla.agregar(codigo),
+            tabla.agregar(nombre),
+            tabla.agregar(url),
+            tabla.agregar(fuente),
+            tabla.agregar(codec_json.dumps(forma).decode("utf-8")),
+            tabla.agregar(codec_json.dumps(extra).decode("utf-8")) if extra else SIN_CADENA,
+            banderas,
+            float(precio) if banderas & PRECIO_NUMERO else 0.0,
+            existencia if banderas & EXISTENCIA_ENTERO else 0,
+        )
+
+    n = len(productos)
+    codigos = [p.get("Codigo") if isinstance(p.get("Codigo"), str) else "" for p in productos]
+    indice = sorted(range(n), key=codigos.__getitem__)
+
+    offsets = [0]
+    for c in tabla.cadenas:
+        offsets.append(offsets[-1] + len(c))
+
+    off_registros = CABECERA.size
+    off_indice = off_registros + len(registros)
+    off_offsets = off_indice + 4 * n
+    off_cadenas = off_offsets + 8 * len(offsets)
+
+    return b"".join((
+        CABECERA.pack(MAGIA, VERSION, n, len(tabla.cadenas), off_registros, off_indice, off_offsets, off_cadenas),
+        bytes(registros),
+        struct.pack(f"<{n}I", *indice),
+        struct.pack(f"<{len(offsets)}Q", *offsets),
+        b"".join(tabla.cadenas),
+    ))
+
+
+def escribir(productos, ruta):
+    """Escribe el snapshot de forma atómica (temporal + fsync + os.replace)"""
+    return codec_json.escribir_bytes(ruta, serializar(productos))
+
+
+# =============================
+# 📖 Lectura (mmap, decodificación perezosa)
+# =============================
+
+class CatalogoBinario:
+    """
+    Catálogo abierto con mmap. Abrirlo solo lee la cabecera; cada registro
+    se decodifica cuando se accede a él.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._archivo = open(ruta, "rb")
+        try:
+            self._mm = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Archivo vacío
+            self._archivo.close()
+            raise ValueError(f"Snapshot vacío: {ruta}")
+
+        magia, version, self._n, self._n_cadenas, self._off_reg, self._off_idx, self._off_offs, self._off_cad = \
+            CABECERA.unpack_from(self._mm, 0)
+        if magia != MAGIA or version != VERSION:
+            self.cerrar()
+            raise ValueError(f"Formato de snapshot no reconocido: {ruta}")
+        self._vista = memoryview(self._mm)
+        self._formas = {}  # índice de cadena -> (orden, claves de imagen) ya decodificados
+
+    # ---- Cadenas ----
+    def _cadena(self, indice):
+        if indice == SIN_CADENA:
+            return None
+        inicio, fin = struct.unpack_from("<QQ", self._mm, self._off_offs + 8 * indice)
+        return str(self._vista[self._off_cad + inicio:self._off_cad + fin], "utf-8")
+
+    def _codigo_en(self, posicion):
+        return self._cadena(struct.unpack_from("<I", self._mm, self._off_reg + REGISTRO.size * posicion)[0])
+
+    # ---- Registros ----
+    def _forma(self, indice):
+        forma = self._formas.get(indice)
+        if forma is None:
+            datos = codec_json.loads(self._cadena(indice))
+            forma = self._formas[indice] = (tuple(datos["orden"]), tuple(datos.get("imagen", ())))
+        return forma
+
+    def _decodificar(self, i):
+        codigo, nombre, url, fuente, forma, extra, banderas, precio, existencia = \
+            REGISTRO.unpack_from(self._mm, self._off_reg + REGISTRO.size * i)
+        orden, claves_imagen = self._forma(forma)
+        campos = codec_json.loads(self._cadena(extra)) if extra != SIN_CADENA else {}
+
+        if codigo != SIN_CADENA:
+            campos["Codigo"] = self._cadena(codigo)
+        if nombre != SIN_CADENA:
+            campos["Nombre"] = self._cadena(nombre)
+        if banderas & PRECIO_NUMERO:
+            campos["Precio"] = int(precio) if banderas & PRECIO_ENTERO else precio
+        if banderas & EXISTENCIA_ENTERO:
+            campos["Existencia"] = existencia
+        if banderas & TIENE_IMAGEN:
+            valores = campos.pop("__imagen__", {})
+            valores["existe"] = bool(banderas & IMAGEN_EXISTE)
+            valores["url_github"] = self._cadena(url)
+            valores["fuente"] = self._cadena(fuente)
+            campos["imagen"] = {k: valores[k] for k in claves_imagen}
+        return {k: campos[k] for k in orden}
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._decodificar(i)
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self._decodificar(i)
+
+    def buscar(self, codigo):
+        """Producto por Codigo (búsqueda binaria en el índice) o None"""
+        idx = self._off_idx
+
+        class _Codigos:
+            def __len__(_):
+                return self._n
+
+            def __getitem__(_, k):
+                return self._codigo_en(struct.unpack_from("<I", self._mm, idx + 4 * k)[0]) or ""
+
+        k = bisect_left(_Codigos(), codigo)
+        if k < self._n:
+            posicion = struct.unpack_from("<I", self._mm, idx + 4 * k)[0]
+            if self._codigo_en(posicion) == codigo:
+                return self._decodificar(posicion)
+        return None
+
+    def a_lista(self):
+        """
+        Decodifica todo el catálogo a una lista de dicts. Desempaca todas las
+        columnas y cadenas de una vez en lugar de registro por registro.
+        """
+        n_offsets = self._n_cadenas + 1
+        offsets = struct.unpack_from(f"<{n_offsets}Q", self._mm, self._off_offs)
+        tabla = self._mm[self._off_cad:self._off_cad + offsets[-1]]
+        cadenas = {i: tabla[a:b].decode("utf-8") for i, (a, b) in enumerate(zip(offsets, offsets[1:]))}
+        cadenas[SIN_CADENA] = None
+
+        productos = []
+        for codigo, nombre, url, fuente, forma, extra, banderas, precio, existencia in \
+                REGISTRO.iter_unpack(self._mm[self._off_reg:self._off_idx]):
+            orden, claves_imagen = self._forma(forma)
+            campos = codec_json.loads(cadenas[extra]) if extra != SIN_CADENA else {}
+            if codigo != SIN_CADENA:
+                campos["Codigo"] = cadenas[codigo]
+            if nombre != SIN_CADENA:
+                campos["Nombre"] = cadenas[nombre]
+            if banderas & PRECIO_NUMERO:
+                campos["Precio"] = int(precio) if banderas & PRECIO_ENTERO else precio
+            if banderas & EXISTENCIA_ENTERO:
+                campos["Existencia"] = existencia
+            if banderas & TIENE_IMAGEN:
+                valores = campos.pop("__imagen__", {})
+                valores["existe"] = bool(banderas & IMAGEN_EXISTE)
+                valores["url_github"] = cadenas[url]
+                valores["fuente"] = cadenas[fuente]
+                campos["imagen"] = {k: valores[k] for k in claves_imagen}
+            productos.append({k: campos[k] for k in orden})
+        return productos
+
+    def cerrar(self):
+        if getattr(self, "_vista", None) is not None:
+            self._vista.release()
+            self._vista = None
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def abrir(ruta):
+    return CatalogoBinario(ruta)
+
+
+def cargar_si_vigente(ruta, origen):
+    """
+    Lista de productos desde el snapshot si existe y no es más viejo que
+    'origen' (el JSON del que se generó); None si hay que leer el JSON.
+    """
+    if not os.path.exists(ruta):
+        return None
+    if os.path.exists(origen) and os.path.getmtime(ruta) < os.path.getmtime(origen):
+        return None
+    try:
+        with abrir(ruta) as catalogo:
+            return catalogo.a_lista()
+    except Exception as e:
+        # Cualquier snapshot ilegible se ignora: el JSON sigue siendo la fuente
+        log.warning("Snapshot binario inválido %s: %s", ruta, e)
+        return None
+
+
+# =============================
+# 🖥️ Línea de comandos
+# =============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("a-binario", help="productos.json -> snapshot binario")
+    p.add_argument("origen")
+    p.add_argument("destino")
+
+    p = sub.add_parser("a-json", help="snapshot binario -> productos.json")
+    p.add_argument("origen")
+    p.add_argument("destino")
+
+    p = sub.add_parser("info", help="resumen del snapshot")
+    p.add_argument("ruta")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "a-binario":
+        productos = codec_json.leer_archivo(args.origen)
+        escribir(productos, args.destino)
+        print(f"✅ {len(productos)} productos -> {args.destino} ({os.path.getsize(args.destino) // 1024} KB)")
+    elif args.comando == "a-json":
+        with abrir(args.origen) as catalogo:
+            productos = catalogo.a_lista()
+        codec_json.escribir_archivo(args.destino, productos)
+        print(f"✅ {len(productos)} productos -> {args.destino} ({os.path.getsize(args.destino) // 1024} KB)")
+    elif args.comando == "info":
+        with abrir(args.ruta) as catalogo:
+            print(f"Productos: {len(catalogo)}")
+            print(f"Cadenas: {catalogo._n_cadenas}")
+            print(f"Tamaño: {os.path.getsize(args.ruta) // 1024} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime, date
+
+import escritura_segura
+
+# =============================
+# ⚙️ Backend de serialización
+# =============================
+# orjson es 5-10x más rápido que json y produce UTF-8 compacto directamente.
+# Si no está instalado se usa json de la librería estándar con la misma salida.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def _default(obj):
+    """Tipos que json estándar no sabe serializar (orjson ya los maneja)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+# =============================
+# 🔄 Codificar / decodificar
+# =============================
+
+def dumps(obj, ordenar_claves=False):
+    """Serializa a bytes UTF-8 compactos"""
+    if orjson:
+        opciones = orjson.OPT_SORT_KEYS if ordenar_claves else 0
+        return orjson.dumps(obj, option=opciones)
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=ordenar_claves,
+        default=_default
+    ).encode("utf-8")
+
+
+def loads(data):
+    """Deserializa bytes o str"""
+    if orjson:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8-sig")
+    return json.loads(data)
+
+
+checksum = escritura_segura.checksum  # CRC32: verificación barata sin volver a parsear
+
+
+# =============================
+# 💾 Archivos
+# =============================
+
+def leer_archivo(ruta):
+    """
+    Lee y deserializa un archivo JSON. Si tiene checksum se verifica antes
+    de parsear: un archivo que no coincide nunca se parsea ni se usa, se
+    lanza escritura_segura.ArchivoCorrupto (quien llama recurre al backup
+    o a GitHub).
+    """
+    return loads(escritura_segura.leer_bytes(ruta))
+
+
+def escribir_archivo(ruta, datos, con_checksum=False):
+    """
+    Serializa y escribe 'datos' con escribir_bytes(). Devuelve los bytes
+    escritos para reutilizarlos (p. ej. al subirlos a GitHub).
+    """
+    return escribir_bytes(ruta, dumps(datos), con_checksum=con_checksum)
+
+
+def escribir_bytes(ruta, contenido, con_checksum=False):
+    """
+    Escribe bytes ya serializados de forma atómica y durable (ver
+    escritura_segura); con_checksum=True guarda el checksum en un sidecar
+    para verificar el archivo al leerlo
+    """
+    return escritura_segura.escribir_bytes(ruta, contenido, con_checksum=con_checksum)
@@ -4,6 +4,13 @@ import threading
 from datetime import datetime
 from uuid import uuid4
 
+import codec_json
+import escritura_segura
+import gestor_backups
+import bitacora
+
+log = bitacora.obtener_logger("contactos")
+
 # =============================
 # 📁 Configuración de archivos
 # =============================
@@ -18,122 +25,132 @@ os.makedirs(BACKUP_DIR, exist_ok=True)
 # =============================
 # 🧠 Estado global
 # =============================
-direcciones = []
-telefonos = []
-lock = threading.RLock()  # Lock para thread-safety
+# Indexados por id (dict conserva el orden de inserción): búsqueda,
+# actualización y borrado en O(1)
+direcciones: dict[str, dict] = {}
+telefonos: dict[str, dict] = {}
+lock = threading.RLock()  # Lock para thread-safety del estado en memoria
+lock_escritura = threading.Lock()  # Serializa escrituras a disco (la última siempre gana)
+pendientes_backup = set()  # Colecciones modificadas desde el último backup
 
 # =============================
 # 📝 Funciones auxiliares
 # =============================
 
-def crear_backup(archivo_path, tipo="archivo"):
-    """Crea un backup antes de guardar"""
-    if os.path.exists(archivo_path):
+def marcar_pendiente(nombre):
+    """
+    Marca una colección para el próximo respaldo. main la llama con cada
+    evento de contactos del diario compartido, así el worker que respalda
+    se entera también de lo editado en los demás.
+    """
+    if nombre in ("direcciones", "telefonos"):
+        pendientes_backup.add(nombre)
+
+
+def respaldar_pendientes():
+    """
+    Crea un punto de restauración (gestor_backups) de las colecciones
+    modificadas desde el último respaldo. Se llama periódicamente desde
+    main, no en cada escritura.
+    """
+    colecciones = {"direcciones": direcciones, "telefonos": telefonos}
+    with lock_escritura:
+        nombres = list(pendientes_backup)
+        pendientes_backup.clear()
+    for nombre in nombres:
+        with lock:
+            datos = list(colecciones[nombre].values())
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            nombre_archivo = os.path.basename(archivo_path).replace(".json", "")
-            backup_path = os.path.join(BACKUP_DIR, f"{nombre_archivo}_backup_{timestamp}.json")
-            
-            with open(archivo_path, "r", encoding="utf-8") as f:
-                backup_data = f.read()
-            
-            with open(backup_path, "w", encoding="utf-8") as f:
-                f.write(backup_data)
-            
-            print(f"💾 Backup creado ({tipo}): {os.path.basename(backup_path)}")
+            gestor_backups.respaldar(nombre, datos, clave="id", forzar=True)
         except Exception as e:
-            print(f"⚠️ Error creando backup ({tipo}): {e}")
+            log.exception("Error creando backup (%s): %s", nombre, e)
+    return len(nombres)
 
 
-def _guardar_archivo(archivo_path, datos, tipo="datos"):
+def _guardar_archivo(archivo_path, datos, tipo="datos", nombre_backup=None):
     """
-    Guarda datos a un archivo de forma SEGURA (atomic write)
+    Guarda datos a un archivo de forma SEGURA: escribe un temporal,
+    hace fsync y lo reemplaza de forma atómica con os.replace (con
+    checksum en un sidecar para detectar un archivo dañado al cargar)
     """
     try:
-        print(f"\n{'='*60}")
-        print(f"💾 GUARDANDO {tipo.upper()}")
-        print(f"   Archivo: {os.path.basename(archivo_path)}")
-        print(f"   Items: {len(datos)}")
-        
-        # 1️⃣ Backup del anterior
-        crear_backup(archivo_path, tipo=tipo)
-        
-        # 2️⃣ Escribir a temporal
-        temp_file = archivo_path + ".tmp"
-        
-        with open(temp_file, "w", encoding="utf-8") as f:
-            json.dump(datos, f, indent=2, ensure_ascii=False)
-        
-        print(f"   ✅ Escrito a temporal")
-        
-        # 3️⃣ Verificar temporal
-        with open(temp_file, "r", encoding="utf-8") as f:
-            verificacion = json.load(f)
-        
-        print(f"   ✅ Verificación: {len(verificacion)} items")
-        
-        # 4️⃣ Reemplazar original
-        if os.path.exists(archivo_path):
-            os.remove(archivo_path)
-        
-        os.rename(temp_file, archivo_path)
-        print(f"   ✅ Archivo guardado exitosamente")
-        
-        # 5️⃣ Verificación final
-        with open(archivo_path, "r", encoding="utf-8") as f:
-            verificacion_final = json.load(f)
-        
-        print(f"✅ {tipo.upper()} GUARDADO: {len(verificacion_final)} items")
-        print(f"{'='*60}\n")
+        codec_json.escribir_archivo(archivo_path, datos, con_checksum=True)
+        if nombre_backup:
+            pendientes_backup.add(nombre_backup)
+        log.info("%s guardados: %d items (%s)", tipo.capitalize(), len(datos), os.path.basename(archivo_path))
         
     except Exception as e:
-        print(f"❌ ERROR guardando {tipo}: {e}")
-        # Limpiar temporal si existe
-        if os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-            except:
-                pass
+        log.error("Error guardando %s: %s", tipo, e)
         raise
 
 
-def _cargar_archivo(archivo_path, tipo="datos"):
+def _persistir(archivo_path, coleccion, tipo, nombre_backup):
+    """Toma una foto del estado actual bajo el lock y la escribe a disco"""
+    with lock_escritura:
+        with lock:
+            datos = list(coleccion.values())
+        _guardar_archivo(archivo_path, datos, tipo=tipo, nombre_backup=nombre_backup)
+
+
+def _cargar_archivo(archivo_path, tipo="datos", nombre_backup=None):
     """
-    Carga datos de un archivo de forma segura
+    Carga datos de un archivo de forma segura. Si no coincide con su
+    checksum y tampoco se puede parsear se restaura el último backup en
+    lugar de empezar vacío.
     """
-    print(f"\n🔍 CARGANDO {tipo.upper()}")
-    print(f"   Ruta: {archivo_path}")
-    print(f"   Existe: {os.path.exists(archivo_path)}")
+    log.debug("Cargando %s desde %s", tipo, archivo_path)
     
     if os.path.exists(archivo_path):
         try:
-            with open(archivo_path, "r", encoding="utf-8") as f:
-                contenido = f.read()
-                
-            if not contenido.strip():
-                print(f"   ⚠️ Archivo vacío")
+            if os.path.getsize(archivo_path) == 0:
+                log.warning("Archivo de %s vacío", tipo)
                 return []
             
-            datos = json.loads(contenido)
+            datos = codec_json.leer_archivo(archivo_path)
             resultado = datos if isinstance(datos, list) else []
             
-            print(f"✅ Cargados {len(resultado)} {tipo}s")
-            if resultado and isinstance(resultado[0], dict):
-                print(f"   Campos disponibles: {list(resultado[0].keys())}")
+            log.info("Cargados %d %ss", len(resultado), tipo)
             
             return resultado
             
+        except escritura_segura.ArchivoCorrupto as e:
+            log.error("Archivo de %s dañado: %s", tipo, e)
+            return _restaurar_backup(nombre_backup, tipo)
         except json.JSONDecodeError as e:
-            print(f"❌ Error de JSON en {tipo}: {e}")
+            log.error("Error de JSON en %s: %s", tipo, e)
             return []
         except Exception as e:
-            print(f"❌ Error cargando {tipo}: {e}")
+            log.error("Error cargando %s: %s", tipo, e)
             return []
     else:
-        print(f"⚠️ Archivo no existe - se creará en primer guardado")
+        log.info("Archivo de %s no existe - se creará en primer guardado", tipo)
+        return []
+
+
+def _restaurar_backup(nombre_backup, tipo):
+    if not nombre_backup:
+        return []
+    try:
+        datos = gestor_backups.restaurar(nombre_backup)
+        log.warning("Restaurados %d %ss del último backup", len(datos), tipo)
+        return datos
+    except Exception as e:
+        log.error("No se pudo restaurar el backup de %s: %s", tipo, e)
         return []
 
 
+def _indexar(lista):
+    """Convierte la lista del archivo en un dict {id: registro}"""
+    indice = {}
+    for item in lista:
+        if not isinstance(item, dict):
+            continue
+        if not item.get("id"):
+            item["id"] = str(uuid4())
+        indice[item["id"]] = item
+    return indice
+
+
 # =============================
 # 📍 FUNCIONES PARA DIRECCIONES
 # =============================
@@ -142,26 +159,28 @@ def cargar_direcciones():
     """Carga direcciones desde archivo"""
     global direcciones
     with lock:
-        direcciones = _cargar_archivo(DIRECCIONES_FILE, tipo="dirección")
+        direcciones = _indexar(_cargar_archivo(DIRECCIONES_FILE, tipo="dirección", nombre_backup="direcciones"))
 
 
 def guardar_direcciones():
     """Guarda direcciones al archivo"""
-    global direcciones
-    with lock:
-        _guardar_archivo(DIRECCIONES_FILE, direcciones, tipo="direcciones")
+    _persistir(DIRECCIONES_FILE, direcciones, tipo="direcciones", nombre_backup="direcciones")
 
 
 def obtener_direcciones():
     """Devuelve copia de direcciones (thread-safe)"""
     with lock:
-        return direcciones.copy()
+        return list(direcciones.values())
+
+
+def obtener_direccion(id_dir):
+    """Devuelve una dirección por id o None"""
+    with lock:
+        return direcciones.get(id_dir)
 
 
 def agregar_direccion(calle, numero, colonia, ciudad, estado, cp):
     """Agrega una dirección y la guarda"""
-    global direcciones
-    
     nueva_dir = {
         "id": str(uuid4()),
         "calle": calle,
@@ -174,19 +193,17 @@ def agregar_direccion(calle, numero, colonia, ciudad, estado, cp):
     }
     
     with lock:
-        direcciones.append(nueva_dir)
+        direcciones[nueva_dir["id"]] = nueva_dir
     
     guardar_direcciones()
-    print(f"✅ Dirección agregada: {nueva_dir['id']}")
+    log.info("Dirección agregada: %s", nueva_dir["id"])
     return nueva_dir
 
 
 def actualizar_direccion(id_dir, calle, numero, colonia, ciudad, estado, cp):
     """Actualiza una dirección existente"""
-    global direcciones
-    
     with lock:
-        direccion = next((d for d in direcciones if d.get("id") == id_dir), None)
+        direccion = direcciones.get(id_dir)
         if not direccion:
             return None
         
@@ -201,28 +218,27 @@ def actualizar_direccion(id_dir, calle, numero, colonia, ciudad, estado, cp):
         })
     
     guardar_direcciones()
-    print(f"✅ Dirección actualizada: {id_dir}")
+    log.info("Dirección actualizada: %s", id_dir)
     return direccion
 
 
 def eliminar_direccion(id_dir):
-    """Elimina una dirección"""
-    global direcciones
-    
+    """Elimina una dirección. Devuelve False si no existía"""
     with lock:
-        direcciones = [d for d in direcciones if d.get("id") != id_dir]
+        if direcciones.pop(id_dir, None) is None:
+            return False
     
     guardar_direcciones()
-    print(f"✅ Dirección eliminada: {id_dir}")
+    log.info("Dirección eliminada: %s", id_dir)
+    return True
 
 
 def limpiar_direcciones():
     """Limpia todas las direcciones"""
-    global direcciones
     with lock:
-        direcciones = []
+        direcciones.clear()
     guardar_direcciones()
-    print(f"🗑️ Direcciones limpiadas")
+    log.info("Direcciones limpiadas")
 
 
 # =============================
@@ -233,26 +249,28 @@ def cargar_telefonos():
     """Carga teléfonos desde archivo"""
     global telefonos
     with lock:
-        telefonos = _cargar_archivo(TELEFONOS_FILE, tipo="teléfono")
+        telefonos = _indexar(_cargar_archivo(TELEFONOS_FILE, tipo="teléfono", nombre_backup="telefonos"))
 
 
 def guardar_telefonos():
     """Guarda teléfonos al archivo"""
-    global telefonos
-    with lock:
-        _guardar_archivo(TELEFONOS_FILE, telefonos, tipo="teléfonos")
+    _persistir(TELEFONOS_FILE, telefonos, tipo="teléfonos", nombre_backup="telefonos")
 
 
 def obtener_telefonos():
     """Devuelve copia de teléfonos (thread-safe)"""
     with lock:
-        return telefonos.copy()
+        return list(telefonos.values())
+
+
+def obtener_telefono(id_tel):
+    """Devuelve un teléfono por id o None"""
+    with lock:
+        return telefonos.get(id_tel)
 
 
 def agregar_telefono(numero, descripcion=""):
     """Agrega un teléfono y lo guarda"""
-    global telefonos
-    
     nuevo_tel = {
         "id": str(uuid4()),
         "numero": numero,
@@ -261,19 +279,17 @@ def agregar_telefono(numero, descripcion=""):
     }
     
     with lock:
-        telefonos.append(nuevo_tel)
+        telefonos[nuevo_tel["id"]] = nuevo_tel
     
     guardar_telefonos()
-    print(f"✅ Teléfono agregado: {nuevo_tel['id']}")
+    log.info("Teléfono agregado: %s", nuevo_tel["id"])
     return nuevo_tel
 
 
 def actualizar_telefono(id_tel, numero, descripcion=""):
     """Actualiza un teléfono existente"""
-    global telefonos
-    
     with lock:
-        telefono = next((t for t in telefonos if t.get("id") == id_tel), None)
+        telefono = telefonos.get(id_tel)
         if not telefono:
             return None
         
@@ -284,37 +300,30 @@ def actualizar_telefono(id_tel, numero, descripcion=""):
         })
     
     guardar_telefonos()
-    print(f"✅ Teléfono actualizado: {id_tel}")
+    log.info("Teléfono actualizado: %s", id_tel)
     return telefono
 
 
 def eliminar_telefono(id_tel):
-    """Elimina un teléfono"""
-    global telefonos
-    
+    """Elimina un teléfono. Devuelve False si no existía"""
     with lock:
-        telefonos = [t for t in telefonos if t.get("id") != id_tel]
+        if telefonos.pop(id_tel, None) is None:
+            return False
     
     guardar_telefonos()
-    print(f"✅ Teléfono eliminado: {id_tel}")
+    log.info("Teléfono eliminado: %s", id_tel)
+    return True
 
 
 def limpiar_telefonos():
     """Limpia todos los teléfonos"""
-    global telefonos
     with lock:
-        telefonos = []
+        telefonos.clear()
     guardar_telefonos()
-    print(f"🗑️ Teléfonos limpiados")
+    log.info("Teléfonos limpiados")
 
 
 # =============================
 # 🚀 INICIALIZACIÓN
 # =============================
-print(f"\n{'#'*70}")
-print(f"# MÓDULO contactos_persistencia INICIALIZADO")
-print(f"# Script dir: {SCRIPT_DIR}")
-print(f"# Direcciones: {DIRECCIONES_FILE}")
-print(f"# Teléfonos: {TELEFONOS_FILE}")
-print(f"# Backups: {BACKUP_DIR}")
-print(f"{'#'*70}\n")
\ No newline at end of file
+log.debug("Módulo inicializado: direcciones=%s telefonos=%s backups=%s", DIRECCIONES_FILE, TELEFONOS_FILE, BACKUP_DIR)
\ No newline at end of file
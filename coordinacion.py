@@ -0,0 +1,403 @@
+"""
+Coordinación entre workers de uvicorn (WEB_CONCURRENCY > 1).
+
+- Líder: el worker que obtiene el flock de 'lider.lock' corre las tareas de
+  fondo (refresco desde GitHub, backups, limpieza, procesamiento de
+  imágenes). Si muere, el sistema libera el lock y otro worker lo toma.
+- Diario: archivo JSONL compartido. Cada cambio de estado (mensajes,
+  catálogo, contactos, proceso de imágenes) se agrega como un evento
+  numerado bajo flock y todos los workers lo siguen y lo aplican en el
+  mismo orden, incluido el que lo escribió.
+- Catálogo: cada versión publicada es un snapshot binario inmutable
+  (catalogo_binario); el evento solo lleva el nombre del archivo.
+
+Con un solo worker no hay archivos ni locks: publicar() aplica el evento
+directamente en el proceso.
+
+Las secciones críticas que escriben a disco se corren con
+ejecutar_exclusivo() en un hilo: esperar el flock de otro worker o un
+fsync no frena el event loop. Los manejadores pueden correr entonces en
+ese hilo; lo que necesite el event loop (tareas, colas SSE) lo agendan
+con en_loop() / tarea_en_loop().
+"""
+import os
+import glob
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, solo un worker
+    fcntl = None
+
+import codec_json
+import catalogo_binario
+import bitacora
+
+log = bitacora.obtener_logger("coordinacion")
+
+# =============================
+# ⚙️ Configuración
+# =============================
+WORKERS_SOLICITADOS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+WORKERS = WORKERS_SOLICITADOS if fcntl else 1
+MULTIPROCESO = WORKERS > 1
+INTERVALO_DIARIO = int(os.getenv("INTERVALO_DIARIO_MS", "100")) / 1000  # Cada cuánto se leen eventos nuevos
+INTERVALO_ELECCION = 5  # Segundos entre intentos de tomar el liderazgo
+CATALOGOS_CONSERVADOS = 3  # Snapshots de catálogo que se conservan al limpiar
+EDAD_MINIMA_CATALOGO = 60  # Segundos antes de poder borrar un snapshot viejo
+
+# =============================
+# 🧠 Estado global
+# =============================
+directorio = None
+_manejadores: dict[str, callable] = {}
+_al_reiniciar: list = []
+_secuencia = itertools.count(1)  # Numeración de eventos con un solo worker
+_diario = None
+_lider = not MULTIPROCESO
+_archivo_lider = None
+_tareas: list[asyncio.Task] = []
+_loop = None  # Event loop del worker (los manejadores que corren en hilos agendan ahí)
+
+# =============================
+# 📬 Eventos
+# =============================
+
+def manejador(evento):
+    """
+    Decorador: registra fn(ev, reproduciendo) para un tipo de evento.
+    'reproduciendo' es True al reconstruir el estado desde el diario
+    (arranque o compactación): aplicar el cambio pero no notificar a nadie.
+    Pueden correr en el event loop o en el hilo de ejecutar_exclusivo():
+    lo que dependa del loop va por en_loop() / tarea_en_loop(). No deben
+    publicar eventos.
+    """
+    def registrar(fn):
+        _manejadores[evento] = fn
+        return fn
+    return registrar
+
+
+def al_reiniciar(fn):
+    """Decorador: fn() se llama antes de reproducir un diario compactado"""
+    _al_reiniciar.append(fn)
+    return fn
+
+
+def _en_hilo_del_loop():
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+def en_loop(fn, *args):
+    """Llama fn(*args) en el event loop: ya mismo si estamos en él, si no lo agenda (en orden)"""
+    if _loop is None or _en_hilo_del_loop():
+        fn(*args)
+    else:
+        _loop.call_soon_threadsafe(fn, *args)
+
+
+def tarea_en_loop(coro):
+    """Crea una tarea del event loop para 'coro' desde el loop o desde un hilo"""
+    if _loop is None or _en_hilo_del_loop():
+        return asyncio.create_task(coro)
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+def es_propio(ev):
+    return ev.get("pid") == os.getpid()
+
+
+def es_lider():
+    return _lider
+
+
+def _despachar(ev, reproduciendo=False):
+    fn = _manejadores.get(ev.get("evento"))
+    if fn is None:
+        return
+    try:
+        fn(ev, reproduciendo)
+    except Exception as e:
+        log.exception("Error aplicando evento %s #%s: %s", ev.get("evento"), ev.get("n"), e)
+
+
+def publicar(evento, **datos):
+    """
+    Publica un evento para todos los workers (este incluido); devuelve su
+    número. Toma el flock del diario y escribe: desde el event loop se
+    llama con asyncio.to_thread() (o dentro de ejecutar_exclusivo()).
+    """
+    ev = {"evento": evento, "pid": os.getpid(), **datos}
+    if _diario is None:
+        ev["n"] = next(_secuencia)
+        _despachar(ev)
+        return ev["n"]
+    return _diario.anexar(ev)
+
+
+def exclusivo():
+    """
+    Sección crítica entre workers: se pone al día con el diario y bloquea
+    a los demás escritores. Usar para leer-modificar-publicar (sin await dentro).
+    """
+    return _diario.exclusivo() if _diario else nullcontext()
+
+
+def _en_exclusivo(fn, args):
+    with exclusivo():
+        return fn(*args)
+
+
+async def ejecutar_exclusivo(fn, *args):
+    """fn(*args) dentro de exclusivo(), en un hilo (el flock y los fsync bloquean)"""
+    return await asyncio.to_thread(_en_exclusivo, fn, args)
+
+
+def compactar(generar_eventos):
+    """
+    Reescribe el diario con los eventos que devuelve generar_eventos()
+    (el estado vigente). Se llama dentro del lock, ya al día.
+    """
+    if _diario:
+        _diario.compactar(generar_eventos)
+
+
+# =============================
+# 📒 Diario compartido
+# =============================
+
+class Diario:
+    """
+    Archivo JSONL al que todos los workers agregan bajo flock. Cada worker
+    guarda su posición de lectura y despacha los eventos nuevos en orden.
+    El lock va en un archivo aparte para que sobreviva a la compactación.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.ultimo = 0  # Último número de evento visto
+        self._lock = open(f"{ruta}.lock", "a+b")
+        self._hilos = threading.RLock()  # El flock es por proceso: entre hilos se excluye con este
+        self._profundidad = 0
+        self._lector = None
+        self._inodo = None
+        self._posicion = 0
+
+    @contextmanager
+    def exclusivo(self):
+        with self._hilos:
+            if self._profundidad == 0:
+                fcntl.flock(self._lock, fcntl.LOCK_EX)
+            self._profundidad += 1
+            try:
+                self.sincronizar()
+                yield
+            finally:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+    def sincronizar(self, reproduciendo=False, esperar=True):
+        """
+        Despacha los eventos agregados desde la última lectura; devuelve
+        cuántos. Con esperar=False no hace nada si otro hilo está leyendo.
+        """
+        if not self._hilos.acquire(blocking=esperar):
+            return 0
+        try:
+            return self._sincronizar(reproduciendo)
+        finally:
+            self._hilos.release()
+
+    def _sincronizar(self, reproduciendo):
+        try:
+            inodo = os.stat(self.ruta).st_ino
+        except FileNotFoundError:
+            return 0
+
+        if inodo != self._inodo:
+            # Primera lectura o diario compactado: empezar desde el inicio
+            compactado = self._lector is not None
+            if self._lector:
+                self._lector.close()
+            self._lector = open(self.ruta, "rb")
+            self._inodo = os.fstat(self._lector.fileno()).st_ino
+            self._posicion = 0
+            if compactado:
+                log.info("Diario compactado: reconstruyendo estado desde el archivo nuevo")
+                for fn in _al_reiniciar:
+                    fn()
+                reproduciendo = True
+
+        self._lector.seek(self._posicion)
+        datos = self._lector.read()
+        fin = datos.rfind(b"\n") + 1  # Una línea a medio escribir se lee la próxima vez
+        if not fin:
+            return 0
+        self._posicion += fin
+
+        n = 0
+        for linea in datos[:fin].splitlines():
+            if not linea.strip():
+                continue
+            try:
+                ev = codec_json.loads(linea)
+            except ValueError:
+                log.warning("Línea inválida en el diario (posición %d)", self._posicion)
+                continue
+            self.ultimo = max(self.ultimo, ev.get("n", 0))
+            _despachar(ev, reproduciendo)
+            n += 1
+        return n
+
+    def anexar(self, ev):
+        with self.exclusivo():
+            ev["n"] = self.ultimo + 1
+            linea = codec_json.dumps(ev) + b"\n"
+            fd = os.open(self.ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                escrito = 0
+                while escrito < len(linea):
+                    escrito += os.write(fd, linea[escrito:])
+            finally:
+                os.close(fd)
+            self.sincronizar()  # Aplica el propio evento en su lugar de la secuencia
+        return ev["n"]
+
+    def compactar(self, generar_eventos):
+        with self.exclusivo():
+            lineas = [codec_json.dumps(ev) for ev in generar_eventos()]
+            lineas.append(codec_json.dumps({"evento": "compactado", "pid": os.getpid(), "n": self.ultimo}))
+            codec_json.escribir_bytes(self.ruta, b"\n".join(lineas) + b"\n")
+            self.sincronizar()
+        log.info("Diario compactado: %d eventos vigentes", len(lineas) - 1)
+
+    def cerrar(self):
+        if self._lector:
+            self._lector.close()
+        self._lock.close()
+
+
+async def _seguir_diario():
+    while True:
+        await asyncio.sleep(INTERVALO_DIARIO)
+        try:
+            _diario.sincronizar(esperar=False)  # Si un hilo tiene el diario, ya lo está leyendo
+        except Exception as e:
+            log.exception("Error leyendo el diario: %s", e)
+
+
+# =============================
+# 👑 Elección de líder
+# =============================
+
+def _intentar_liderazgo():
+    global _lider, _archivo_lider
+    archivo = open(os.path.join(directorio, "lider.lock"), "a+b")
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        archivo.close()
+        return False
+    # El lock vive mientras el archivo siga abierto (hasta que el proceso muera)
+    _archivo_lider = archivo
+    _lider = True
+    return True
+
+
+async def _buscar_liderazgo(al_ser_lider):
+    while not _intentar_liderazgo():
+        await asyncio.sleep(INTERVALO_ELECCION)
+    log.info("Worker %d elegido líder", os.getpid())
+    al_ser_lider()
+
+
+# =============================
+# 🚀 Arranque / apagado
+# =============================
+
+def iniciar(directorio_datos):
+    """
+    Abre el diario y reconstruye el estado a partir de él (llamar en el
+    startup, desde el event loop, antes de cargar el catálogo)
+    """
+    global directorio, _diario, _loop
+    _loop = asyncio.get_running_loop()
+    if not MULTIPROCESO:
+        if WORKERS_SOLICITADOS > 1:
+            log.warning("WEB_CONCURRENCY=%d sin soporte de flock: se usa un solo worker", WORKERS_SOLICITADOS)
+        return
+    if _diario is not None:
+        return
+
+    directorio = os.path.join(directorio_datos, "compartido")
+    os.makedirs(directorio, exist_ok=True)
+    _diario = Diario(os.path.join(directorio, "diario.jsonl"))
+    eventos = _diario.sincronizar(reproduciendo=True)
+    _tareas.append(asyncio.create_task(_seguir_diario()))
+    log.info("Worker %d de %d: %d eventos reproducidos del diario", os.getpid(), WORKERS, eventos)
+
+
+def iniciar_liderazgo(al_ser_lider):
+    """al_ser_lider() arranca las tareas de fondo; corre en un solo worker"""
+    if not MULTIPROCESO:
+        al_ser_lider()
+        return
+    _tareas.append(asyncio.create_task(_buscar_liderazgo(al_ser_lider)))
+
+
+def detener():
+    global _diario
+    for tarea in _tareas:
+        tarea.cancel()
+    _tareas.clear()
+    if _diario:
+        _diario.cerrar()
+        _diario = None
+
+
+def estado():
+    return {"pid": os.getpid(), "workers": WORKERS, "lider": _lider}
+
+
+# =============================
+# 📦 Snapshots del catálogo
+# =============================
+
+def _ruta_catalogo(nombre):
+    return os.path.join(directorio, nombre)
+
+
+def escribir_catalogo(productos):
+    """Escribe un snapshot inmutable del catálogo y devuelve su nombre"""
+    nombre = f"catalogo-{time.time_ns()}-{os.getpid()}.fcat"
+    catalogo_binario.escribir(productos, _ruta_catalogo(nombre))
+    return nombre
+
+
+def leer_catalogo(nombre):
+    with catalogo_binario.abrir(_ruta_catalogo(nombre)) as catalogo:
+        return catalogo.a_lista()
+
+
+def limpiar_catalogos(vigente):
+    """Borra snapshots viejos (solo el líder), conservando el vigente y los más recientes"""
+    archivos = sorted(glob.glob(_ruta_catalogo("catalogo-*.fcat")), key=os.path.getmtime)
+    limite = time.time() - EDAD_MINIMA_CATALOGO
+    borrados = 0
+    for ruta in archivos[:-CATALOGOS_CONSERVADOS]:
+        if os.path.basename(ruta) == vigente or os.path.getmtime(ruta) > limite:
+            continue
+        try:
+            os.remove(ruta)
+            borrados += 1
+        except OSError:
+            pass
+    return borrados
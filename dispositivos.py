@@ -0,0 +1,43 @@
+import re
+from functools import lru_cache
+
+# =============================
+# ⚙️ Patrones de User-Agent
+# =============================
+# Mismos criterios que tenía static/redirect.html: las tablets ven la versión laptop
+PATRON_MOVIL = re.compile(r"Android|webOS|iPhone|iPad|iPod|BlackBerry|IEMobile|Opera Mini", re.IGNORECASE)
+PATRON_TABLET = re.compile(r"iPad|Tablet|Kindle|Silk|PlayBook|Android(?!.*Mobile)", re.IGNORECASE)
+
+MOVIL = "mobile"
+LAPTOP = "laptop"
+
+# Headers que afectan la respuesta de "/" (para Vary y para pedir Client Hints)
+HEADERS_VARY = "Accept-Encoding, User-Agent, Sec-CH-UA-Mobile"
+HEADERS_ACCEPT_CH = "Sec-CH-UA-Mobile"
+
+
+@lru_cache(maxsize=4096)
+def clasificar(user_agent, ch_mobile=""):
+    """
+    Devuelve MOVIL o LAPTOP. Sec-CH-UA-Mobile ("?1"/"?0") tiene prioridad
+    sobre el User-Agent cuando el navegador lo envía.
+    """
+    if ch_mobile == "?1":
+        return MOVIL
+    if ch_mobile == "?0":
+        return LAPTOP
+    if not user_agent:
+        return LAPTOP
+    if PATRON_TABLET.search(user_agent):
+        return LAPTOP
+    if PATRON_MOVIL.search(user_agent):
+        return MOVIL
+    return LAPTOP
+
+
+def clasificar_peticion(request):
+    """Clasifica una petición de Starlette/FastAPI"""
+    return clasificar(
+        request.headers.get("user-agent", ""),
+        request.headers.get("sec-ch-ua-mobile", "").strip()
+    )
@@ -0,0 +1,202 @@
+"""
+Escritura durable de archivos para todo el proyecto.
+
+escribir_bytes() escribe en un temporal, hace fsync y lo reemplaza de
+forma atómica (os.replace + fsync del directorio): un lector o una caída a
+media escritura ven el archivo anterior completo o el nuevo completo,
+nunca uno truncado.
+
+Con con_checksum=True el archivo sigue siendo JSON plano (lo leen GitHub,
+los backups y cualquier herramienta) y el checksum va en '<archivo>.crc':
+una línea '<crc32> <tamaño>' por contenido aceptado. Antes de reemplazar
+los datos el sidecar acepta el contenido nuevo y el actual, y después
+solo el nuevo: en ningún momento (ni tras una caída) hay datos válidos
+con un sidecar que no los acepte. Al leer, leer_bytes() compara: un
+archivo truncado se detecta por tamaño y uno dañado con un CRC32 (mucho
+más barato que parsearlo). Los archivos sin sidecar se leen sin verificar
+(quien reemplace uno a mano debe borrar su .crc).
+"""
+import os
+import zlib
+import threading
+
+EXTENSION_SIDECAR = ".crc"
+ENCABEZADO_ANTERIOR = b"#crc32 "  # Formato previo con el checksum dentro del archivo: se quita al leer
+MAX_ACEPTADOS = 3  # Contenidos que acepta el sidecar a la vez (el nuevo y los anteriores a una caída)
+
+_locks_rutas: dict[str, threading.Lock] = {}
+_lock_locks = threading.Lock()
+
+
+class ArchivoCorrupto(IOError):
+    """El contenido no coincide con su sidecar (truncado o dañado)"""
+
+
+def checksum(data):
+    """CRC32 de los bytes: verificación barata sin volver a parsear"""
+    return f"{zlib.crc32(data) & 0xFFFFFFFF:08x}"
+
+
+def ruta_sidecar(ruta):
+    return ruta + EXTENSION_SIDECAR
+
+
+# =============================
+# 💾 Escritura
+# =============================
+
+def _fsync_directorio(ruta):
+    """Hace durable el os.replace (la entrada del directorio); no existe en Windows"""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(ruta)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _reemplazar(ruta, *partes):
+    # Temporal por proceso e hilo: dos escritores no se pisan el temporal
+    temp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            for parte in partes:
+                f.write(parte)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, ruta)
+    except Exception:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def _lock_de(ruta):
+    """Lock por archivo: los tres pasos de una escritura con checksum no se intercalan"""
+    clave = os.path.abspath(ruta)
+    with _lock_locks:
+        return _locks_rutas.setdefault(clave, threading.Lock())
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def _entrada(contenido):
+    return f"{checksum(contenido)} {len(contenido)}"
+
+
+def _aceptados_actuales(ruta):
+    """Entradas que aceptan lo que hay hoy en 'ruta' (se calcula si no tiene sidecar)"""
+    try:
+        aceptados = _leer_sidecar(ruta)
+    except ArchivoCorrupto:
+        aceptados = None
+    if aceptados is not None:
+        return [f"{crc} {tamano}" for crc, tamano in aceptados]
+    try:
+        with open(ruta, "rb") as f:
+            return [_entrada(f.read())]
+    except FileNotFoundError:
+        return []
+
+
+def escribir_bytes(ruta, contenido, con_checksum=False):
+    """
+    Escribe 'contenido' de forma atómica y durable; con con_checksum=True
+    actualiza también '<ruta>.crc'. Devuelve los bytes escritos.
+    """
+    contenido = bytes(contenido)
+    if not con_checksum:
+        # Un sidecar viejo marcaría como corrupto el archivo nuevo
+        _borrar(ruta_sidecar(ruta))
+        _reemplazar(ruta, contenido)
+    else:
+        with _lock_de(ruta):
+            nueva = _entrada(contenido)
+            anteriores = [e for e in _aceptados_actuales(ruta) if e != nueva]
+            # 1️⃣ El sidecar acepta el contenido nuevo y el actual
+            aceptados = [nueva] + anteriores[:MAX_ACEPTADOS - 1]
+            _reemplazar(ruta_sidecar(ruta), "\n".join(aceptados).encode() + b"\n")
+            # 2️⃣ Datos nuevos
+            _reemplazar(ruta, contenido)
+            # 3️⃣ Solo el nuevo
+            _reemplazar(ruta_sidecar(ruta), nueva.encode() + b"\n")
+    _fsync_directorio(ruta)
+    return contenido
+
+
+def escribir_texto(ruta, texto, con_checksum=False, encoding="utf-8"):
+    return escribir_bytes(ruta, texto.encode(encoding), con_checksum=con_checksum)
+
+
+# =============================
+# 🔍 Lectura con verificación
+# =============================
+
+def _leer_sidecar(ruta):
+    """[(crc, tamaño), ...] aceptados por el sidecar, o None si no hay sidecar"""
+    try:
+        with open(ruta_sidecar(ruta), "rb") as f:
+            lineas = f.read().split(b"\n")
+        aceptados = [(crc.decode("ascii"), int(tamano)) for crc, tamano in (l.split() for l in lineas if l.strip())]
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        raise ArchivoCorrupto(f"Sidecar ilegible: {ruta_sidecar(ruta)}")
+    if not aceptados:
+        raise ArchivoCorrupto(f"Sidecar vacío: {ruta_sidecar(ruta)}")
+    return aceptados
+
+
+def _sin_encabezado_anterior(datos):
+    if datos.startswith(ENCABEZADO_ANTERIOR):
+        return datos[datos.find(b"\n") + 1:] if b"\n" in datos else b""
+    return datos
+
+
+def leer_bytes(ruta):
+    """
+    Lee el archivo completo; si tiene sidecar lo verifica antes de
+    devolverlo (ArchivoCorrupto si no coincide). El tamaño se compara con
+    un stat antes de leer. Si otro proceso lo estaba reemplazando se
+    vuelve a intentar una vez.
+    """
+    for intento in range(2):
+        aceptados = _leer_sidecar(ruta)
+        if aceptados is None:
+            with open(ruta, "rb") as f:
+                return _sin_encabezado_anterior(f.read())
+        tamano = os.path.getsize(ruta)
+        if any(t == tamano for _, t in aceptados):
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+            crc = checksum(contenido)
+            if (crc, len(contenido)) in aceptados:
+                return contenido
+            error = f"{ruta}: checksum {crc}, se esperaba {aceptados[0][0]}"
+        else:
+            error = f"{ruta}: tamaño {tamano}, se esperaban {aceptados[0][1]} bytes"
+    raise ArchivoCorrupto(error)
+
+
+def verificar(ruta):
+    """
+    True si el archivo coincide con su sidecar, None si no tiene sidecar.
+    Lanza ArchivoCorrupto si no coincide (FileNotFoundError si no existe).
+    """
+    if _leer_sidecar(ruta) is None:
+        return None
+    leer_bytes(ruta)
+    return True
@@ -0,0 +1,361 @@
+import os
+import sys
+import gzip
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import codec_json
+import escritura_segura
+import bitacora
+
+log = bitacora.obtener_logger("backups")
+
+# =============================
+# 📁 Configuración
+# =============================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKUP_DIR = os.path.join(SCRIPT_DIR, "backups")
+
+FORMATO_TS = "%Y%m%d_%H%M%S_%f"
+
+# Separación mínima entre backups de una misma colección. Con ediciones
+# frecuentes sólo se respalda una vez por ventana, así el costo por
+# guardado queda acotado.
+INTERVALO_MINIMO = timedelta(seconds=int(os.getenv("BACKUP_INTERVALO_MINIMO", 600)))
+
+# Cada cuánto se fuerza un snapshot completo (los deltas se calculan
+# contra el último completo) y a partir de qué proporción de cambios
+# conviene más un completo que un delta.
+EDAD_MAXIMA_FULL = timedelta(hours=24)
+PROPORCION_MAXIMA_DELTA = 0.5
+
+# Retención escalonada: el más reciente de cada hora, de cada día y de
+# cada semana dentro de su ventana. Lo demás se elimina.
+RETENCION_HORAS = int(os.getenv("BACKUP_RETENCION_HORAS", 48))
+RETENCION_DIAS = int(os.getenv("BACKUP_RETENCION_DIAS", 14))
+RETENCION_SEMANAS = int(os.getenv("BACKUP_RETENCION_SEMANAS", 8))
+
+# Backups planos anteriores (backups/<nombre>_backup_<ts>.json) que se conservan al compactar
+LEGACY_CONSERVAR = 3
+
+# =============================
+# 🧠 Estado global
+# =============================
+lock = threading.RLock()
+_ultimo_full = {}  # nombre -> (ts, {clave: json del registro}) del último snapshot completo
+_ultimo_backup = {}  # nombre -> datetime
+_en_curso = set()  # colecciones con un backup corriendo en segundo plano
+
+# =============================
+# 🔧 Funciones auxiliares
+# =============================
+
+def _dir_coleccion(nombre):
+    ruta = os.path.join(BACKUP_DIR, nombre)
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def _escribir_gz(ruta, contenido):
+    """Escribe JSON comprimido de forma atómica (gzip ya trae su propio CRC)"""
+    escritura_segura.escribir_bytes(ruta, gzip.compress(codec_json.dumps(contenido), compresslevel=6))
+
+
+def _leer_gz(ruta):
+    with gzip.open(ruta, "rb") as f:
+        return codec_json.loads(f.read())
+
+
+def _parsear_nombre(archivo):
+    """
+    full_<ts>.json.gz          -> ("full", ts, None)
+    delta_<ts>__<base>.json.gz -> ("delta", ts, base)
+    """
+    if not archivo.endswith(".json.gz"):
+        return None
+    base = archivo[:-len(".json.gz")]
+    try:
+        if base.startswith("full_"):
+            return "full", datetime.strptime(base[5:], FORMATO_TS), None
+        if base.startswith("delta_"):
+            ts, ts_base = base[6:].split("__")
+            return "delta", datetime.strptime(ts, FORMATO_TS), datetime.strptime(ts_base, FORMATO_TS)
+    except ValueError:
+        return None
+    return None
+
+
+def listar(nombre):
+    """Puntos de restauración de la colección, del más viejo al más nuevo"""
+    ruta = os.path.join(BACKUP_DIR, nombre)
+    if not os.path.isdir(ruta):
+        return []
+    puntos = []
+    for archivo in os.listdir(ruta):
+        info = _parsear_nombre(archivo)
+        if info:
+            tipo, ts, base = info
+            puntos.append({
+                "tipo": tipo,
+                "ts": ts,
+                "base": base,
+                "archivo": os.path.join(ruta, archivo),
+                "bytes": os.path.getsize(os.path.join(ruta, archivo))
+            })
+    puntos.sort(key=lambda p: p["ts"])
+    return puntos
+
+
+def _indexar(datos, clave):
+    """{clave: json del registro}; None si algún registro no tiene clave única"""
+    indice = {}
+    for item in datos:
+        k = item.get(clave) if isinstance(item, dict) else None
+        if k is None or k in indice:
+            return None
+        indice[k] = codec_json.dumps(item, ordenar_claves=True)
+    return indice
+
+
+def _cargar_ultimo_full(nombre):
+    """Recupera (ts, indice) del último completo en disco (tras un reinicio)"""
+    fulls = [p for p in listar(nombre) if p["tipo"] == "full"]
+    if not fulls:
+        return None
+    ultimo = fulls[-1]
+    try:
+        contenido = _leer_gz(ultimo["archivo"])
+        indice = _indexar(contenido["datos"], contenido["clave"])
+        return (ultimo["ts"], indice) if indice is not None else None
+    except Exception as e:
+        log.warning("No se pudo leer el último backup completo de %s: %s", nombre, e)
+        return None
+
+
+# =============================
+# 💾 Crear backups
+# =============================
+
+def respaldar(nombre, datos, clave="id", forzar=False):
+    """
+    Guarda un punto de restauración de 'datos' (lista de dicts con 'clave').
+    Escribe un delta comprimido contra el último snapshot completo o un
+    completo nuevo si no hay base, la base es vieja o cambió demasiado.
+    Devuelve la ruta escrita o None si se omitió por el intervalo mínimo.
+    """
+    ahora = datetime.now()
+    with lock:
+        ultimo = _ultimo_backup.get(nombre)
+        if not forzar and ultimo and ahora - ultimo < INTERVALO_MINIMO:
+            return None
+
+        if nombre not in _ultimo_full:
+            _ultimo_full[nombre] = _cargar_ultimo_full(nombre)
+
+        indice = _indexar(datos, clave)
+        base = _ultimo_full.get(nombre)
+        ruta_dir = _dir_coleccion(nombre)
+        ts = ahora.strftime(FORMATO_TS)
+
+        delta = None
+        if indice is not None and base and ahora - base[0] < EDAD_MAXIMA_FULL:
+            ts_base, indice_base = base
+            cambiados = [k for k, v in indice.items() if indice_base.get(k) != v]
+            borrados = [k for k in indice_base if k not in indice]
+            if len(cambiados) + len(borrados) <= len(indice_base) * PROPORCION_MAXIMA_DELTA:
+                delta = {
+                    "clave": clave,
+                    "base": ts_base.strftime(FORMATO_TS),
+                    "upsert": [codec_json.loads(indice[k]) for k in cambiados],
+                    "borrar": borrados
+                }
+
+        if delta is not None:
+            ruta = os.path.join(ruta_dir, f"delta_{ts}__{delta['base']}.json.gz")
+            _escribir_gz(ruta, delta)
+            log.info("Backup incremental (%s): %d cambios, %d borrados", nombre, len(delta["upsert"]), len(delta["borrar"]))
+        else:
+            ruta = os.path.join(ruta_dir, f"full_{ts}.json.gz")
+            _escribir_gz(ruta, {"clave": clave, "datos": datos})
+            _ultimo_full[nombre] = (ahora, indice) if indice is not None else None
+            log.info("Backup completo (%s): %d items", nombre, len(datos))
+
+        _ultimo_backup[nombre] = ahora
+        aplicar_retencion(nombre, ahora)
+        return ruta
+
+
+def respaldar_en_segundo_plano(nombre, datos, clave="id"):
+    """Igual que respaldar() pero en un hilo, para no sumar latencia al guardado"""
+    with lock:
+        if nombre in _en_curso:
+            return
+        ultimo = _ultimo_backup.get(nombre)
+        if ultimo and datetime.now() - ultimo < INTERVALO_MINIMO:
+            return
+        _en_curso.add(nombre)
+
+    copia = list(datos)
+
+    def _trabajo():
+        try:
+            respaldar(nombre, copia, clave=clave)
+        except Exception as e:
+            log.exception("Error creando backup (%s): %s", nombre, e)
+        finally:
+            with lock:
+                _en_curso.discard(nombre)
+
+    threading.Thread(target=_trabajo, name=f"backup-{nombre}", daemon=True).start()
+
+
+# =============================
+# 🧹 Retención y compactación
+# =============================
+
+def aplicar_retencion(nombre, ahora=None):
+    """Elimina los puntos que no son el más reciente de su hora/día/semana"""
+    ahora = ahora or datetime.now()
+    puntos = listar(nombre)
+    if not puntos:
+        return 0
+
+    conservar = {puntos[-1]["archivo"]}
+    cubetas = {}
+    for p in puntos:  # en orden ascendente: el último de cada cubeta gana
+        edad = ahora - p["ts"]
+        if edad <= timedelta(hours=RETENCION_HORAS):
+            cubetas[("h", p["ts"].strftime("%Y%m%d%H"))] = p["archivo"]
+        if edad <= timedelta(days=RETENCION_DIAS):
+            cubetas[("d", p["ts"].strftime("%Y%m%d"))] = p["archivo"]
+        if edad <= timedelta(weeks=RETENCION_SEMANAS):
+            cubetas[("s", p["ts"].strftime("%G%V"))] = p["archivo"]
+    conservar.update(cubetas.values())
+
+    # Un delta necesita su snapshot completo base
+    bases = {p["base"] for p in puntos if p["archivo"] in conservar and p["tipo"] == "delta"}
+    conservar.update(p["archivo"] for p in puntos if p["tipo"] == "full" and p["ts"] in bases)
+
+    # El último completo es la base de los próximos deltas
+    fulls = [p for p in puntos if p["tipo"] == "full"]
+    if fulls:
+        conservar.add(fulls[-1]["archivo"])
+
+    eliminados = 0
+    for p in puntos:
+        if p["archivo"] not in conservar:
+            try:
+                os.remove(p["archivo"])
+                eliminados += 1
+            except OSError as e:
+                log.warning("No se pudo eliminar %s: %s", p["archivo"], e)
+    return eliminados
+
+
+def compactar():
+    """
+    Aplica la retención a todas las colecciones y elimina los backups
+    planos antiguos, conservando los LEGACY_CONSERVAR más nuevos de cada tipo
+    """
+    if not os.path.isdir(BACKUP_DIR):
+        return {}
+
+    resultado = {}
+    for entrada in os.listdir(BACKUP_DIR):
+        if os.path.isdir(os.path.join(BACKUP_DIR, entrada)):
+            with lock:
+                resultado[entrada] = aplicar_retencion(entrada)
+
+    legacy = {}
+    for entrada in os.listdir(BACKUP_DIR):
+        if "_backup_" in entrada and entrada.endswith(".json"):
+            legacy.setdefault(entrada.split("_backup_")[0], []).append(entrada)
+    for nombre, archivos in legacy.items():
+        archivos.sort()
+        for archivo in archivos[:-LEGACY_CONSERVAR]:
+            os.remove(os.path.join(BACKUP_DIR, archivo))
+        resultado[f"{nombre} (legacy)"] = max(0, len(archivos) - LEGACY_CONSERVAR)
+    return resultado
+
+
+# =============================
+# ♻️ Restaurar
+# =============================
+
+def restaurar(nombre, punto=None):
+    """
+    Reconstruye la lista de la colección en el punto indicado (timestamp
+    con FORMATO_TS; por defecto el más reciente). Los deltas se aplican
+    sobre su snapshot completo base.
+    """
+    puntos = listar(nombre)
+    if not puntos:
+        raise FileNotFoundError(f"No hay backups de '{nombre}'")
+
+    if punto:
+        ts = datetime.strptime(punto, FORMATO_TS)
+        elegido = next((p for p in puntos if p["ts"] == ts), None)
+        if not elegido:
+            raise FileNotFoundError(f"No existe el punto {punto} de '{nombre}'")
+    else:
+        elegido = puntos[-1]
+
+    if elegido["tipo"] == "full":
+        return _leer_gz(elegido["archivo"])["datos"]
+
+    base = next((p for p in puntos if p["tipo"] == "full" and p["ts"] == elegido["base"]), None)
+    if not base:
+        raise FileNotFoundError(f"Falta el snapshot base de {os.path.basename(elegido['archivo'])}")
+
+    completo = _leer_gz(base["archivo"])
+    delta = _leer_gz(elegido["archivo"])
+    clave = delta["clave"]
+
+    registros = {item[clave]: item for item in completo["datos"]}
+    for k in delta["borrar"]:
+        registros.pop(k, None)
+    for item in delta["upsert"]:
+        registros[item[clave]] = item
+    return list(registros.values())
+
+
+# =============================
+# 🖥️ Línea de comandos
+# =============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backups de Ferre-Calvillito")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_listar = sub.add_parser("listar", help="Lista los puntos de restauración")
+    p_listar.add_argument("nombre", help="productos, direcciones, telefonos...")
+
+    p_restaurar = sub.add_parser("restaurar", help="Restaura una colección a un archivo JSON")
+    p_restaurar.add_argument("nombre")
+    p_restaurar.add_argument("--punto", help=f"Timestamp ({FORMATO_TS}); por defecto el más reciente")
+    p_restaurar.add_argument("--destino", required=True, help="Archivo JSON a escribir")
+
+    sub.add_parser("compactar", help="Aplica la retención y limpia backups antiguos")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "listar":
+        for p in listar(args.nombre):
+            base = f" (base {p['base'].strftime(FORMATO_TS)})" if p["base"] else ""
+            print(f"{p['ts'].strftime(FORMATO_TS)}  {p['tipo']:<5}  {p['bytes']:>10} bytes{base}")
+
+    elif args.comando == "restaurar":
+        datos = restaurar(args.nombre, args.punto)
+        codec_json.escribir_archivo(args.destino, datos)
+        print(f"✅ {len(datos)} registros restaurados en {args.destino}")
+
+    elif args.comando == "compactar":
+        for nombre, eliminados in compactar().items():
+            print(f"🧹 {nombre}: {eliminados} eliminados")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
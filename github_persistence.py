@@ -1,10 +1,19 @@
 import os
-import json
+import time
 import base64
+import threading
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
 
+import codec_json
+import escritura_segura
+import catalogo_binario
+import bitacora
+import metricas
+
+log = bitacora.obtener_logger("github")
+
 # =============================
 # 🔐 Configuración GitHub
 # =============================
@@ -20,6 +29,7 @@ GITHUB_API_URL = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/con
 # =============================
 data_dir = None
 PRODUCTOS_LOCAL_FILE = None
+PRODUCTOS_BINARIO_FILE = None  # Snapshot mmap de la copia local (catalogo_binario)
 DIRECCIONES_LOCAL_FILE = None
 TELEFONOS_LOCAL_FILE = None
 IMAGENES_LOCAL_DIR = None
@@ -31,27 +41,20 @@ IMAGENES_GITHUB_DIR = "imagenes"  # Carpeta en GitHub
 
 def inicializar_github(directorio_datos):
     """Inicializa las variables globales de GitHub"""
-    global data_dir, PRODUCTOS_LOCAL_FILE, DIRECCIONES_LOCAL_FILE, TELEFONOS_LOCAL_FILE, IMAGENES_LOCAL_DIR
+    global data_dir, PRODUCTOS_LOCAL_FILE, PRODUCTOS_BINARIO_FILE, DIRECCIONES_LOCAL_FILE, TELEFONOS_LOCAL_FILE, IMAGENES_LOCAL_DIR
     
     data_dir = directorio_datos
     PRODUCTOS_LOCAL_FILE = os.path.join(data_dir, "productos_github.json")
+    PRODUCTOS_BINARIO_FILE = os.path.join(data_dir, "productos_github.fcat")
     DIRECCIONES_LOCAL_FILE = os.path.join(data_dir, "direcciones_github.json")
     TELEFONOS_LOCAL_FILE = os.path.join(data_dir, "telefonos_github.json")
     IMAGENES_LOCAL_DIR = os.path.join(data_dir, "imagenes")
     
-    print(f"\n{'='*70}")
-    print(f"🔐 INICIALIZANDO GITHUB PERSISTENCE")
-    print(f"   Token: {'✅' if GITHUB_TOKEN else '❌'}")
-    print(f"   Owner: {GITHUB_OWNER}")
-    print(f"   Repo: {GITHUB_REPO}")
-    print(f"   Productos: {PRODUCTOS_LOCAL_FILE}")
-    print(f"   Direcciones: {DIRECCIONES_LOCAL_FILE}")
-    print(f"   Teléfonos: {TELEFONOS_LOCAL_FILE}")
-    print(f"   Imágenes: {IMAGENES_LOCAL_DIR}")
-    print(f"{'='*70}\n")
+    log.info("GitHub persistence inicializado: repo=%s/%s token=%s datos=%s",
+             GITHUB_OWNER, GITHUB_REPO, bool(GITHUB_TOKEN), data_dir)
     
     if not GITHUB_TOKEN:
-        print("⚠️ GITHUB_TOKEN no configurado - usando solo persistencia local")
+        log.warning("GITHUB_TOKEN no configurado - usando solo persistencia local")
 
 
 # =============================
@@ -70,19 +73,116 @@ def cargar_telefonos_github():
     """Carga los teléfonos desde GitHub"""
     return _cargar_desde_github("telefonos.json", TELEFONOS_LOCAL_FILE)
 
+def cargar_productos_local():
+    """
+    Última copia local de productos.json de GitHub, sin red (None si no hay).
+    Usa el snapshot binario si está al día con la copia JSON.
+    """
+    if PRODUCTOS_BINARIO_FILE:
+        datos = catalogo_binario.cargar_si_vigente(PRODUCTOS_BINARIO_FILE, PRODUCTOS_LOCAL_FILE)
+        if datos is not None:
+            return datos
+    return _cargar_copia_local(PRODUCTOS_LOCAL_FILE)
+
+
+def guardar_snapshot_productos(productos):
+    """Regenera el snapshot binario del catálogo (tras refrescar desde GitHub)"""
+    if not PRODUCTOS_BINARIO_FILE:
+        return None
+    try:
+        return catalogo_binario.escribir(productos, PRODUCTOS_BINARIO_FILE)
+    except Exception as e:
+        log.warning("Error guardando snapshot binario %s: %s", PRODUCTOS_BINARIO_FILE, e)
+        return None
+
+
+def _cargar_copia_local(archivo_local):
+    """Lee la copia local guardada en la última carga/guardado; None si no existe o está dañada"""
+    if not archivo_local or not os.path.exists(archivo_local):
+        return None
+    try:
+        datos = codec_json.leer_archivo(archivo_local)  # Verifica el checksum antes de parsear
+        return datos if isinstance(datos, list) else []
+    except escritura_segura.ArchivoCorrupto as e:
+        log.error("Copia local dañada, se ignora: %s", e)
+        return None
+    except Exception as e:
+        log.warning("Error leyendo copia local %s: %s", archivo_local, e)
+        return None
+
+
+# =============================
+# 🛫 Descargas compartidas (singleflight)
+# =============================
+
+class _Vuelo:
+    """Descarga en curso: los que llegan mientras tanto esperan su resultado"""
+    __slots__ = ("listo", "resultado", "error", "esperando")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.esperando = 0
+
+
+_vuelos: dict[str, _Vuelo] = {}
+_lock_vuelos = threading.Lock()
+descargas_compartidas = 0  # Llamadas que se ahorraron esperando una descarga ya en curso
+
+
+def _una_sola_vez(clave, fn):
+    """
+    Ejecuta fn() una sola vez para todas las llamadas concurrentes con la
+    misma clave; todas reciben el mismo resultado (la misma lista: no
+    modificarla) o la misma excepción.
+    """
+    global descargas_compartidas
+    with _lock_vuelos:
+        vuelo = _vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _vuelos[clave] = _Vuelo()
+        else:
+            vuelo.esperando += 1
+            descargas_compartidas += 1
+
+    if not lider:
+        vuelo.listo.wait()
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    try:
+        vuelo.resultado = fn()
+    except Exception as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _lock_vuelos:
+            _vuelos.pop(clave, None)
+        vuelo.listo.set()
+        if vuelo.esperando:
+            log.debug("%s: %d llamadas compartieron una descarga", clave, vuelo.esperando)
+    return vuelo.resultado
+
 
 def _cargar_desde_github(nombre_archivo, archivo_local):
     """
-    Función genérica para cargar desde GitHub con fallback local
+    Carga desde GitHub con fallback local. Las llamadas simultáneas por el
+    mismo archivo comparten una sola descarga (y una sola escritura de la
+    copia local).
     """
-    print(f"\n{'='*70}")
-    print(f"📥 CARGANDO {nombre_archivo.upper()} DESDE GITHUB")
-    print(f"   Timestamp: {datetime.now().isoformat()}")
+    return _una_sola_vez(nombre_archivo, lambda: _descargar_de_github(nombre_archivo, archivo_local))
+
+
+def _descargar_de_github(nombre_archivo, archivo_local):
+    log.debug("Cargando %s desde GitHub", nombre_archivo)
     
     # Intentar desde GitHub
     if GITHUB_TOKEN and GITHUB_OWNER and GITHUB_REPO:
+        inicio = time.perf_counter()
         try:
-            print(f"   Intentando GitHub...")
             url = f"{GITHUB_API_URL}/{nombre_archivo}"
             headers = {
                 "Authorization": f"token {GITHUB_TOKEN}",
@@ -90,40 +190,33 @@ def _cargar_desde_github(nombre_archivo, archivo_local):
             }
             
             response = requests.get(url, headers=headers, timeout=10)
+            metricas.registrar_github("cargar", inicio, response.status_code)
             
             if response.status_code == 200:
-                datos = response.json()
-                print(f"✅ Cargados desde GitHub")
+                datos = codec_json.loads(response.content)
+                log.info("%s cargado desde GitHub (%d bytes)", nombre_archivo, len(response.content))
                 
-                # Guardar copia local como fallback
-                _guardar_copia_local(datos, archivo_local)
-                
-                print(f"{'='*70}\n")
+                # Guardar copia local como fallback (los bytes tal cual, sin re-serializar)
+                _guardar_copia_local(datos, archivo_local, contenido=response.content)
                 return datos if isinstance(datos, list) else []
             
             elif response.status_code == 404:
-                print(f"   ⚠️ Archivo no existe en GitHub (404)")
+                log.warning("%s no existe en GitHub (404)", nombre_archivo)
             else:
-                print(f"   ⚠️ Error GitHub ({response.status_code})")
+                log.warning("Error GitHub cargando %s (%d)", nombre_archivo, response.status_code)
         
         except Exception as e:
-            print(f"   ⚠️ Error conectando a GitHub: {e}")
+            metricas.registrar_github("cargar", inicio, "error")
+            log.warning("Error conectando a GitHub (%s): %s", nombre_archivo, e)
     
     # Fallback a copia local
-    print(f"   Intentando copia local...")
-    if os.path.exists(archivo_local):
-        try:
-            with open(archivo_local, "r", encoding="utf-8") as f:
-                datos = json.load(f)
-            print(f"✅ Cargados desde copia local")
-            print(f"{'='*70}\n")
-            return datos if isinstance(datos, list) else []
-        except Exception as e:
-            print(f"   ⚠️ Error: {e}")
+    datos = _cargar_copia_local(archivo_local)
+    if datos is not None:
+        log.info("%s cargado desde copia local", nombre_archivo)
+        return datos
     
     # Todo falló
-    print(f"❌ No se pudo cargar - devolviendo lista vacía")
-    print(f"{'='*70}\n")
+    log.error("No se pudo cargar %s - devolviendo lista vacía", nombre_archivo)
     return []
 
 
@@ -148,31 +241,24 @@ def _guardar_en_github(datos, nombre_archivo, archivo_local):
     """
     Función genérica para guardar en GitHub con fallback local
     """
-    print(f"\n{'='*70}")
-    print(f"📤 GUARDANDO {nombre_archivo.upper()} EN GITHUB")
-    print(f"   Total items: {len(datos)}")
-    print(f"   Timestamp: {datetime.now().isoformat()}")
-    
-    # 1️⃣ Guardar copia local primero (siempre)
-    _guardar_copia_local(datos, archivo_local)
-    print(f"   ✅ Copia local guardada")
+    # 1️⃣ Guardar copia local primero (siempre); sus bytes se reutilizan para GitHub
+    contenido = _guardar_copia_local(datos, archivo_local)
     
     # 2️⃣ Si no hay token, no hacer más
     if not GITHUB_TOKEN or not GITHUB_OWNER or not GITHUB_REPO:
-        print(f"⚠️ Sin credenciales de GitHub - solo persistencia local")
-        print(f"{'='*70}\n")
+        log.debug("Sin credenciales de GitHub - %s solo en persistencia local", nombre_archivo)
         return False
     
     # 3️⃣ Intentar guardar en GitHub
+    inicio = time.perf_counter()
     try:
-        print(f"   Intentando GitHub...")
-        
         # Obtener SHA del archivo actual
         sha = _obtener_sha_archivo(nombre_archivo)
         
-        # Preparar contenido
-        contenido_json = json.dumps(datos, indent=2, ensure_ascii=False)
-        contenido_b64 = base64.b64encode(contenido_json.encode()).decode()
+        # Preparar contenido (sin volver a serializar si ya se hizo al guardar local)
+        if contenido is None:
+            contenido = codec_json.dumps(datos)
+        contenido_b64 = base64.b64encode(contenido).decode()
         
         url = f"{GITHUB_API_URL}/{nombre_archivo}"
         headers = {
@@ -189,21 +275,20 @@ def _guardar_en_github(datos, nombre_archivo, archivo_local):
         if sha:
             payload["sha"] = sha
         
+        inicio = time.perf_counter()
         response = requests.put(url, headers=headers, json=payload, timeout=10)
+        metricas.registrar_github("guardar", inicio, response.status_code)
         
         if response.status_code in [200, 201]:
-            print(f"✅ Guardado en GitHub exitosamente")
-            print(f"{'='*70}\n")
+            log.info("%s guardado en GitHub (%d items)", nombre_archivo, len(datos))
             return True
         else:
-            print(f"⚠️ Error GitHub ({response.status_code})")
-            print(f"{'='*70}\n")
+            log.warning("Error GitHub guardando %s (%d)", nombre_archivo, response.status_code)
             return False
     
     except Exception as e:
-        print(f"❌ Error: {e}")
-        print(f"⚠️ Persistencia local disponible")
-        print(f"{'='*70}\n")
+        metricas.registrar_github("guardar", inicio, "error")
+        log.error("Error guardando %s en GitHub (persistencia local disponible): %s", nombre_archivo, e)
         return False
 
 
@@ -224,16 +309,15 @@ def guardar_imagen_github(codigo_producto, ruta_imagen_local):
     """
     
     if not os.path.exists(ruta_imagen_local):
-        print(f"⚠️ Imagen no encontrada: {ruta_imagen_local}")
+        log.warning("Imagen no encontrada: %s", ruta_imagen_local)
         return False
     
     if not GITHUB_TOKEN or not GITHUB_OWNER or not GITHUB_REPO:
-        print(f"⚠️ Sin credenciales de GitHub - imagen no guardada en repositorio")
+        log.debug("Sin credenciales de GitHub - imagen %s no guardada en repositorio", codigo_producto)
         return False
     
+    inicio = time.perf_counter()
     try:
-        print(f"\n📤 Subiendo imagen: {codigo_producto}.jpg a GitHub...")
-        
         # Leer imagen
         with open(ruta_imagen_local, "rb") as f:
             contenido_img = f.read()
@@ -262,17 +346,20 @@ def guardar_imagen_github(codigo_producto, ruta_imagen_local):
         if sha:
             payload["sha"] = sha
         
+        inicio = time.perf_counter()
         response = requests.put(url, headers=headers, json=payload, timeout=15)
+        metricas.registrar_github("guardar_imagen", inicio, response.status_code)
         
         if response.status_code in [200, 201]:
-            print(f"✅ Imagen guardada en GitHub")
+            log.info("Imagen %s guardada en GitHub", codigo_producto)
             return True
         else:
-            print(f"⚠️ Error GitHub al guardar imagen ({response.status_code})")
+            log.warning("Error GitHub al guardar imagen %s (%d)", codigo_producto, response.status_code)
             return False
     
     except Exception as e:
-        print(f"❌ Error guardando imagen: {e}")
+        metricas.registrar_github("guardar_imagen", inicio, "error")
+        log.error("Error guardando imagen %s: %s", codigo_producto, e)
         return False
 
 
@@ -286,11 +373,6 @@ def guardar_lote_imagenes_github(imagenes_dict):
     Returns:
         Dict con resultados {codigo_producto: True/False}
     """
-    print(f"\n{'='*70}")
-    print(f"🖼️ GUARDANDO LOTE DE IMÁGENES EN GITHUB")
-    print(f"   Total: {len(imagenes_dict)}")
-    print(f"{'='*70}")
-    
     resultados = {}
     
     for codigo, ruta in imagenes_dict.items():
@@ -298,8 +380,7 @@ def guardar_lote_imagenes_github(imagenes_dict):
         resultados[codigo] = resultado
     
     exitosas = sum(1 for v in resultados.values() if v)
-    print(f"\n✅ {exitosas}/{len(imagenes_dict)} imágenes guardadas")
-    print(f"{'='*70}\n")
+    log.info("Lote de imágenes: %d/%d guardadas en GitHub", exitosas, len(imagenes_dict))
     
     return resultados
 
@@ -310,6 +391,7 @@ def guardar_lote_imagenes_github(imagenes_dict):
 
 def _obtener_sha_archivo(nombre_archivo):
     """Obtiene el SHA del archivo actual en GitHub"""
+    inicio = time.perf_counter()
     try:
         url = f"{GITHUB_API_URL}/{nombre_archivo}"
         headers = {
@@ -318,6 +400,7 @@ def _obtener_sha_archivo(nombre_archivo):
         }
         
         response = requests.get(url, headers=headers, timeout=5)
+        metricas.registrar_github("obtener_sha", inicio, response.status_code)
         
         if response.status_code == 200:
             return response.json().get("sha")
@@ -325,21 +408,24 @@ def _obtener_sha_archivo(nombre_archivo):
         return None
     
     except Exception as e:
-        print(f"   ⚠️ No se pudo obtener SHA: {e}")
+        metricas.registrar_github("obtener_sha", inicio, "error")
+        log.warning("No se pudo obtener SHA de %s: %s", nombre_archivo, e)
         return None
 
 
-def _guardar_copia_local(datos, archivo_local):
-    """Guarda una copia local como fallback"""
+def _guardar_copia_local(datos, archivo_local, contenido=None):
+    """Guarda una copia local como fallback. Devuelve los bytes escritos o None"""
     try:
         if not os.path.exists(data_dir):
             os.makedirs(data_dir, exist_ok=True)
         
-        with open(archivo_local, "w", encoding="utf-8") as f:
-            json.dump(datos, f, indent=2, ensure_ascii=False)
+        if contenido is not None:
+            return codec_json.escribir_bytes(archivo_local, contenido, con_checksum=True)
+        return codec_json.escribir_archivo(archivo_local, datos, con_checksum=True)
     
     except Exception as e:
-        print(f"   ⚠️ Error guardando local: {e}")
+        log.warning("Error guardando copia local %s: %s", archivo_local, e)
+        return None
 
 
 # =============================
@@ -353,18 +439,10 @@ def debug_estado_github():
         "owner": GITHUB_OWNER,
         "repo": GITHUB_REPO,
         "productos_local": os.path.exists(PRODUCTOS_LOCAL_FILE) if PRODUCTOS_LOCAL_FILE else False,
+        "productos_binario": os.path.exists(PRODUCTOS_BINARIO_FILE) if PRODUCTOS_BINARIO_FILE else False,
         "direcciones_local": os.path.exists(DIRECCIONES_LOCAL_FILE) if DIRECCIONES_LOCAL_FILE else False,
         "telefonos_local": os.path.exists(TELEFONOS_LOCAL_FILE) if TELEFONOS_LOCAL_FILE else False,
-        "imagenes_local": os.path.exists(IMAGENES_LOCAL_DIR) if IMAGENES_LOCAL_DIR else False
+        "imagenes_local": os.path.exists(IMAGENES_LOCAL_DIR) if IMAGENES_LOCAL_DIR else False,
+        "descargas_en_curso": list(_vuelos),
+        "descargas_compartidas": descargas_compartidas
     }
-
-
-# =============================
-# 🧹 Inicialización automática
-# =============================
-print(f"\n{'#'*70}")
-print(f"# MÓDULO github_persistence CARGADO")
-print(f"# GitHub Owner: {GITHUB_OWNER}")
-print(f"# GitHub Repo: {GITHUB_REPO}")
-print(f"# Token disponible: {'✅' if GITHUB_TOKEN else '❌'}")
-print(f"{'#'*70}\n")
\ No newline at end of file
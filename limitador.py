@@ -0,0 +1,241 @@
+"""
+Control de admisión para endpoints caros (middleware ASGI puro).
+
+Por cada ruta configurada con una Regla:
+- Cubetas de tokens por cliente y para la ruta completa: si se vacían se
+  responde 429 con Retry-After en lugar de encolar trabajo.
+- Límite de peticiones simultáneas con una cola corta: si la cola está
+  llena o la espera pasa de 'espera_max' se responde 503 (Retry-After).
+- Agrupación de GETs idénticos en curso: la primera petición hace el
+  trabajo y las que llegan mientras tanto reciben la misma respuesta.
+
+Se registra antes que CORS y Sesión (queda dentro de ellos): esas capas
+agregan sus encabezados a cada respuesta, también a las agrupadas. Aun
+así la clave incluye Origin y Authorization, y una respuesta repetida
+nunca lleva el Set-Cookie de otro cliente.
+"""
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import codec_json
+import bitacora
+import metricas
+
+log = bitacora.obtener_logger("limitador")
+
+# =============================
+# ⚙️ Configuración
+# =============================
+ACTIVO = os.getenv("LIMITADOR_ACTIVO", "1") != "0"
+# Proxies de confianza delante de la app (Render pone uno): cada uno agrega al
+# final de X-Forwarded-For la IP que vio. El cliente es la entrada que agregó
+# el más externo; las de la izquierda las puede inventar el cliente. 0 = sin proxy
+PROXIES_CONFIABLES = max(0, int(os.getenv("LIMITADOR_PROXIES_CONFIABLES", "1")))
+MAX_CLIENTES = 10000  # Cubetas por cliente que se recuerdan (las más viejas se descartan)
+
+RECHAZOS = metricas.Contador("limitador_rechazos_total", "Peticiones rechazadas por el limitador", ("ruta", "motivo"))
+AGRUPADAS = metricas.Contador("limitador_agrupadas_total", "Peticiones respondidas con el resultado de otra idéntica en curso", ("ruta",))
+
+# Encabezados de la petición que distinguen respuestas agrupables
+HEADERS_CLAVE = (b"if-none-match", b"accept-encoding", b"origin", b"authorization")
+
+
+# =============================
+# 🪣 Cubeta de tokens
+# =============================
+
+class CubetaTokens:
+    """
+    'capacidad' tokens que se reponen a 'por_segundo'. Con clave, una
+    cubeta por clave (cliente); las menos usadas se olvidan al pasar de
+    max_claves.
+    """
+
+    def __init__(self, capacidad, por_segundo, max_claves=MAX_CLIENTES):
+        self.capacidad = float(capacidad)
+        self.por_segundo = float(por_segundo)
+        self.max_claves = max_claves
+        self._cubetas: OrderedDict = OrderedDict()  # clave -> [tokens, último instante]
+
+    def tomar(self, clave=None):
+        """Consume un token; devuelve 0 si había o los segundos hasta el próximo"""
+        ahora = time.monotonic()
+        cubeta = self._cubetas.get(clave)
+        if cubeta is None:
+            cubeta = self._cubetas[clave] = [self.capacidad, ahora]
+            if len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+        else:
+            self._cubetas.move_to_end(clave)
+            cubeta[0] = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.por_segundo)
+            cubeta[1] = ahora
+
+        if cubeta[0] >= 1:
+            cubeta[0] -= 1
+            return 0.0
+        return (1 - cubeta[0]) / self.por_segundo if self.por_segundo > 0 else float("inf")
+
+
+# =============================
+# 📏 Reglas
+# =============================
+
+@dataclass
+class Regla:
+    """
+    por_cliente / total: (capacidad, tokens por segundo) o None.
+    concurrencia: peticiones atendidas a la vez (None = sin límite);
+    cola / espera_max: cuántas pueden esperar turno y cuánto.
+    agrupar: GETs idénticos en curso comparten la respuesta.
+    """
+    por_cliente: tuple | None = None
+    total: tuple | None = None
+    concurrencia: int | None = None
+    cola: int = 8
+    espera_max: float = 10.0
+    agrupar: bool = False
+
+
+class _Ruta:
+    """Estado de una ruta con regla: cubetas, turnos y peticiones en curso"""
+
+    def __init__(self, nombre, regla):
+        self.nombre = nombre
+        self.regla = regla
+        self.por_cliente = CubetaTokens(*regla.por_cliente) if regla.por_cliente else None
+        self.total = CubetaTokens(*regla.total, max_claves=1) if regla.total else None
+        self.turnos = asyncio.Semaphore(regla.concurrencia) if regla.concurrencia else None
+        self.esperando = 0
+        self.en_curso: dict[tuple, asyncio.Future] = {}  # clave de agrupación -> respuesta
+
+
+# =============================
+# 🧩 Middleware ASGI
+# =============================
+
+def _cliente(scope):
+    if PROXIES_CONFIABLES:
+        saltos = [
+            ip.strip()
+            for nombre, valor in scope.get("headers", ())
+            if nombre == b"x-forwarded-for"
+            for ip in valor.split(b",")
+            if ip.strip()
+        ]
+        if len(saltos) >= PROXIES_CONFIABLES:
+            return saltos[-PROXIES_CONFIABLES].decode("latin-1")
+    cliente = scope.get("client")
+    return cliente[0] if cliente else "desconocido"
+
+
+async def _responder_error(send, codigo, mensaje, reintentar):
+    cuerpo = codec_json.dumps({"ok": False, "error": mensaje})
+    await send({
+        "type": "http.response.start",
+        "status": codigo,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+            (b"retry-after", str(max(1, math.ceil(reintentar))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+def _sin_cookies(mensaje):
+    """Copia del inicio de respuesta sin Set-Cookie (las cookies son de quien la pidió)"""
+    if mensaje["type"] != "http.response.start":
+        return mensaje
+    return {**mensaje, "headers": [(n, v) for n, v in mensaje.get("headers", ()) if n.lower() != b"set-cookie"]}
+
+
+class MiddlewareLimitador:
+    """
+    Aplica las reglas {ruta: Regla} (ruta exacta, cualquier método). Las
+    rutas sin regla pasan sin costo.
+    """
+
+    def __init__(self, app, reglas=None):
+        self.app = app
+        self.rutas = {ruta: _Ruta(ruta, regla) for ruta, regla in (reglas or {}).items()}
+
+    async def __call__(self, scope, receive, send):
+        ruta = self.rutas.get(scope.get("path")) if scope["type"] == "http" and ACTIVO else None
+        if ruta is None:
+            await self.app(scope, receive, send)
+            return
+
+        # 1️⃣ Tasa: primero por cliente, luego la ruta completa
+        cliente = _cliente(scope)
+        for cubeta, id_cubeta, motivo in ((ruta.por_cliente, cliente, "cliente"), (ruta.total, None, "total")):
+            if cubeta is None:
+                continue
+            espera = cubeta.tomar(id_cubeta)
+            if espera:
+                RECHAZOS.incrementar(ruta=ruta.nombre, motivo=motivo)
+                bitacora.debug_muestreado(log, f"limite_{ruta.nombre}", "Límite de tasa (%s) en %s para %s", motivo, ruta.nombre, cliente)
+                await _responder_error(send, 429, "Demasiadas peticiones, intenta más tarde", espera)
+                return
+
+        # 2️⃣ Agrupación: si ya hay una idéntica en curso, esperar su respuesta;
+        #    si no, esta queda registrada para que las siguientes la esperen
+        futuro = None
+        if ruta.regla.agrupar and scope["method"] in ("GET", "HEAD"):
+            headers = dict(scope.get("headers", ()))
+            clave = (scope["method"], scope.get("query_string", b""), *(headers.get(h, b"") for h in HEADERS_CLAVE))
+            pendiente = ruta.en_curso.get(clave)
+            if pendiente is not None:
+                mensajes = await asyncio.shield(pendiente)
+                if mensajes is not None:
+                    AGRUPADAS.incrementar(ruta=ruta.nombre)
+                    for mensaje in mensajes:
+                        await send(_sin_cookies(mensaje))
+                    return
+                # La original no terminó bien: atender esta por su cuenta
+            else:
+                futuro = ruta.en_curso[clave] = asyncio.get_running_loop().create_future()
+
+        mensajes = []
+
+        async def send_guardando(mensaje):
+            mensajes.append(mensaje)
+            await send(mensaje)
+
+        completa = False
+        try:
+            # 3️⃣ Concurrencia: esperar turno en una cola acotada
+            if not await self._esperar_turno(ruta, send):
+                return
+            try:
+                await self.app(scope, receive, send_guardando if futuro is not None else send)
+                completa = True
+            finally:
+                if ruta.turnos is not None:
+                    ruta.turnos.release()
+        finally:
+            if futuro is not None:
+                ruta.en_curso.pop(clave, None)
+                futuro.set_result(mensajes if completa else None)
+
+    async def _esperar_turno(self, ruta, send):
+        """True con el turno tomado; False si se respondió 503"""
+        if ruta.turnos is None:
+            return True
+        if ruta.turnos.locked() and ruta.esperando >= ruta.regla.cola:
+            RECHAZOS.incrementar(ruta=ruta.nombre, motivo="cola_llena")
+            await _responder_error(send, 503, "Servidor ocupado, intenta más tarde", ruta.regla.espera_max)
+            return False
+        ruta.esperando += 1
+        try:
+            await asyncio.wait_for(ruta.turnos.acquire(), ruta.regla.espera_max)
+            return True
+        except asyncio.TimeoutError:
+            RECHAZOS.incrementar(ruta=ruta.nombre, motivo="espera")
+            await _responder_error(send, 503, "Servidor ocupado, intenta más tarde", ruta.regla.espera_max)
+            return False
+        finally:
+            ruta.esperando -= 1
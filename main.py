@@ -1,32 +1,43 @@
 ﻿"123"
 import os
-import json
+import hmac
+import time
 import threading
+from bisect import bisect_right
 from datetime import datetime, timedelta
 from uuid import uuid4
 import asyncio
-import traceback
 
 # Importar módulos de persistencia
 import productos_api as productos_module
 import contactos_persistencia as contactos
 import github_persistence as gh
+import mensajes_tiempo_real as tiempo_real
+import codec_json
+import usuarios_oauth
+import paginas_cache
+import dispositivos
+import bitacora
+import metricas
+import gestor_backups
+import perfilador
+import coordinacion
+import limitador
+import escritura_segura
+from routers import auth as rutas_auth
+from backend.auth_utils import decode_token
 from fastapi import FastAPI, Request, Body
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel, Field
-from authlib.integrations.starlette_client import OAuth
 from dotenv import load_dotenv
-import fdb
-import asyncio
-from gestor_imagenes import GestorImagenesProductos
 
 # =============================
 # 🚀 Inicialización principal
 # =============================
 load_dotenv()
+log = bitacora.obtener_logger("api")
 
 # =============================
 # 📁 Rutas de archivos (PRIMERO)
@@ -52,8 +63,26 @@ os.makedirs(static_dir, exist_ok=True)
 # =============================
 # 🚀 Crear aplicación FastAPI
 # =============================
-app = FastAPI(title="Ferre-Calvillito API")
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+class RespuestaJSON(JSONResponse):
+    """JSONResponse que serializa con codec_json (orjson si está instalado)"""
+    def render(self, content) -> bytes:
+        return codec_json.dumps(content)
+
+app = FastAPI(title="Ferre-Calvillito API", default_response_class=RespuestaJSON)
+app.mount("/static", paginas_cache.StaticFilesCacheados(directory=static_dir), name="static")
+app.include_router(rutas_auth.router)  # /auth/registro, /auth/login y /usuario/carrito*
+
+# =============================
+# 🚦 Límites para endpoints caros (descargas de GitHub / catálogo completo)
+# =============================
+# Se agrega antes que CORS y Sesión para quedar dentro de ellos: cada
+# respuesta agrupada recibe los encabezados y la cookie de su propio cliente
+app.add_middleware(limitador.MiddlewareLimitador, reglas={
+    "/producto": limitador.Regla(por_cliente=(20, 0.5), total=(60, 5), concurrencia=4, agrupar=True),
+    "/api/productos/todas-imagenes": limitador.Regla(por_cliente=(5, 0.1), concurrencia=2, agrupar=True),
+    "/debug/productos-estado": limitador.Regla(por_cliente=(10, 0.5)),
+    "/api/productos/admin-upload": limitador.Regla(por_cliente=(3, 1 / 60), concurrencia=1, cola=2, espera_max=60),
+})
 
 # =============================
 # 🔒 Configuración de CORS
@@ -74,6 +103,11 @@ app.add_middleware(
     secret_key=os.getenv("SESSION_SECRET", "clave_super_secreta_123")
 )
 
+# =============================
+# 📈 Middleware de métricas (el más externo: mide todo el stack)
+# =============================
+app.add_middleware(metricas.MiddlewareMetricas, sin_latencia={"stream_mensajes"})
+
 # =============================
 # 🖼️ CONFIGURACIÓN DE IMÁGENES
 # =============================
@@ -83,38 +117,59 @@ GITHUB_REPO = os.getenv("GITHUB_REPO")  # formato: usuario/repo
 
 gestor_imagenes = None
 
+def obtener_gestor_imagenes():
+    """Crea el gestor en el primer uso (importar bs4/aiohttp cuesta en el arranque)"""
+    global gestor_imagenes
+    if gestor_imagenes is None:
+        try:
+            from gestor_imagenes import GestorImagenesProductos
+            gestor_imagenes = GestorImagenesProductos()
+        except Exception as e:
+            log.warning("Error inicializando gestor de imágenes: %s", e)
+    return gestor_imagenes
+
 # =============================
-# 🔐 Configuración OAuth con Google
+# 🔐 Configuración OAuth con Google (se crea en el primer login)
 # =============================
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=os.getenv("GOOGLE_CLIENT_ID"),
-    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'}
-)
+_oauth = None
+
+def obtener_oauth():
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        _oauth = OAuth()
+        _oauth.register(
+            name='google',
+            client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={'scope': 'openid email profile'}
+        )
+    return _oauth
 
 # =============================
-# 🔥 Cargar cliente Firebird
+# 🔥 Cargar cliente Firebird (en segundo plano, después del arranque)
 # =============================
-try:
-    dll_path = os.path.join(SCRIPT_DIR, "fbclient.dll")
-    if os.path.exists(dll_path):
-        fdb.load_api(dll_path)
-        print(f"🧩 fbclient.dll cargado desde: {dll_path}")
-    else:
-        print("⚠️ No se encontró fbclient.dll en el directorio del proyecto.")
-except Exception as e:
-    print("❌ Error al cargar fbclient.dll:", e)
+def cargar_cliente_firebird():
+    try:
+        import fdb
+        dll_path = os.path.join(SCRIPT_DIR, "fbclient.dll")
+        if os.path.exists(dll_path):
+            fdb.load_api(dll_path)
+            log.info("fbclient.dll cargado desde: %s", dll_path)
+        else:
+            log.warning("No se encontró fbclient.dll en el directorio del proyecto")
+    except Exception as e:
+        log.error("Error al cargar fbclient.dll: %s", e)
 
 # =============================
 # 🧠 Estado Global
 # =============================
-mensajes: list[dict] = []
+mensajes: list[dict] = []  # El "seq" de cada mensaje es el número de su evento (ver coordinacion)
 direcciones: list[dict] = []
 telefonos: list[dict] = []
-productos_api: list[dict] = []
+# El catálogo vive en productos_module como versiones inmutables: leer con
+# productos_module.vigente() y publicar cambios con publicar_productos()
 
 proceso_activo = False
 detener_proceso_flag = False
@@ -148,106 +203,304 @@ def limpiar_mensajes_antiguos():
     
     cantidad_eliminada = cantidad_inicial - len(mensajes)
     if cantidad_eliminada > 0:
-        print(f"🗑️ Eliminados {cantidad_eliminada} mensajes antiguos (>30 días)")
+        log.info("Eliminados %d mensajes antiguos (>30 días)", cantidad_eliminada)
     
     return cantidad_eliminada
 
+def compactar_diario():
+    """
+    Con varios workers: reescribe el diario compartido solo con los mensajes
+    vigentes (ya con su estado de leído) y el último catálogo publicado
+    """
+    def eventos_vigentes():
+        limpiar_mensajes_antiguos()
+        eventos = [
+            {"evento": "mensaje", "pid": 0, "n": m["seq"], "registro": {k: v for k, v in m.items() if k != "seq"}}
+            for m in mensajes
+        ]
+        if catalogo_compartido["vigente"]:
+            eventos.append({
+                "evento": "catalogo", "pid": 0, "n": 0,
+                "archivo": catalogo_compartido["vigente"], "version": catalogo_compartido["version"],
+            })
+        return eventos
+    coordinacion.compactar(eventos_vigentes)
+
 async def tarea_limpieza_periodica():
-    """Ejecuta la limpieza cada 24 horas"""
+    """Ejecuta la limpieza cada 24 horas (solo en el worker líder)"""
     while True:
         await asyncio.sleep(86400)  # 24 horas
         limpiar_mensajes_antiguos()
+        await asyncio.to_thread(compactar_diario)
 
 # =============================
-# 🚀 EVENTO DE STARTUP (CORREGIDO)
+# 💾 Backups y sincronización de contactos
 # =============================
+INTERVALO_BACKUP_CONTACTOS = int(os.getenv("INTERVALO_BACKUP_CONTACTOS", 3600))  # segundos
+RETRASO_SYNC_GITHUB = 2  # segundos para agrupar cambios seguidos en un solo envío
 
-@app.on_event("startup")
-async def startup_event():
-    """✅ STARTUP COMPLETAMENTE FUNCIONAL"""
-    global productos_api, direcciones, telefonos, mensajes, gestor_imagenes
-    
-    print("\n" + "="*80)
-    print("🚀 INICIANDO FERRE-CALVILLITO API")
-    print("="*80)
-    
-    try:
-        # 1️⃣ Inicializar GitHub
-        print("\n📦 PASO 1: Inicializando GitHub Persistence...")
-        gh.inicializar_github(DATA_DIR)
-        print("   ✅ GitHub Persistence inicializado")
-        
-        # 1.5️⃣ Inicializar Gestor de Imágenes
-        print("\n🖼️ PASO 1.5: Inicializando Gestor de Imágenes...")
+_sync_github_tareas: dict[str, asyncio.Task] = {}
+_sync_github_locks: dict[str, asyncio.Lock] = {}
+
+async def tarea_backup_contactos():
+    """Respalda direcciones/teléfonos modificados cada INTERVALO_BACKUP_CONTACTOS"""
+    while True:
+        await asyncio.sleep(INTERVALO_BACKUP_CONTACTOS)
         try:
-          gestor_imagenes = GestorImagenesProductos()
-          print(f"   ✅ Gestor de Imágenes inicializado")
+            await asyncio.to_thread(contactos.respaldar_pendientes)
         except Exception as e:
-          print(f"   ⚠️ Error inicializando imágenes: {e}")
-          gestor_imagenes = None
-        
-        # 2️⃣ Inicializar módulo de productos
-        print("\n📊 PASO 2: Inicializando módulo de productos...")
+            log.exception("Error en backup programado de contactos: %s", e)
+
+def programar_sync_github(tipo):
+    """
+    Envía la lista completa de 'direcciones' o 'telefonos' a GitHub en
+    segundo plano. Varias modificaciones dentro de RETRASO_SYNC_GITHUB se
+    agrupan en un solo envío y el request no espera a GitHub.
+    """
+    tarea = _sync_github_tareas.get(tipo)
+    if tarea and not tarea.done():
+        return
+    _sync_github_tareas[tipo] = asyncio.create_task(_sync_github(tipo))
+
+async def _sync_github(tipo):
+    await asyncio.sleep(RETRASO_SYNC_GITHUB)
+    # Cambios posteriores a este punto programan un nuevo envío
+    _sync_github_tareas.pop(tipo, None)
+
+    lock_tipo = _sync_github_locks.setdefault(tipo, asyncio.Lock())
+    async with lock_tipo:  # Evita dos PUT simultáneos con el mismo SHA
         try:
-            productos_module.cargar_productos_api()
-            print(f"   ✅ Módulo de productos inicializado")
+            if tipo == "direcciones":
+                await asyncio.to_thread(gh.guardar_direcciones_github, contactos.obtener_direcciones())
+            elif tipo == "telefonos":
+                await asyncio.to_thread(gh.guardar_telefonos_github, contactos.obtener_telefonos())
         except Exception as e:
-            print(f"   ⚠️ Error: {e}")
-        
-        # 2B️⃣ Cargar productos desde GitHub
-        print("\n📊 PASO 2B: Cargando productos...")
+            log.exception("Error sincronizando %s con GitHub: %s", tipo, e)
+
+# =============================
+# 🔗 COORDINACIÓN ENTRE WORKERS
+# =============================
+# Con WEB_CONCURRENCY > 1 cada worker tiene su propia memoria: los cambios
+# viajan como eventos por el diario compartido (ver coordinacion.py) y cada
+# worker los aplica. El catálogo viaja como snapshot binario inmutable.
+catalogo_compartido = {
+    "vigente": None,   # Último snapshot publicado
+    "version": 0,      # Número de versión de ese snapshot
+    "cargado": None,   # Snapshot que está en memoria en este worker
+    "activo": False,   # False mientras el startup no cargue el catálogo
+    "tarea": None,
+}
+
+async def publicar_productos(productos=None, cambios=None):
+    """
+    Publica una versión nueva del catálogo: 'productos' lo reemplaza completo
+    y 'cambios' ({Codigo: producto}) solo esos productos. Con varios workers
+    el número de versión se decide dentro del lock del diario, así todos los
+    workers tienen el mismo número para el mismo contenido.
+    """
+    if not coordinacion.MULTIPROCESO:
+        if cambios is not None:
+            return productos_module.reemplazar_productos(cambios)
+        return await asyncio.to_thread(productos_module.publicar, productos)
+
+    if cambios is not None:
+        productos = [cambios.get(p.get("Codigo"), p) for p in productos_module.obtener_productos_api()]
+    try:
+        nombre = await asyncio.to_thread(coordinacion.escribir_catalogo, productos)
+    except Exception as e:
+        log.warning("Error escribiendo el catálogo para los demás workers: %s", e)
+        return await asyncio.to_thread(productos_module.publicar, productos)
+
+    def anunciar():
+        numero = productos_module.siguiente_numero(catalogo_compartido["version"])
+        catalogo_compartido["cargado"] = nombre
+        coordinacion.publicar("catalogo", archivo=nombre, version=numero)
+        return numero
+
+    numero = await coordinacion.ejecutar_exclusivo(anunciar)
+    version = await asyncio.to_thread(productos_module.publicar, productos, numero)
+    if coordinacion.es_lider():
+        await asyncio.to_thread(coordinacion.limpiar_catalogos, nombre)
+    return version
+
+@coordinacion.manejador("catalogo")
+def _al_publicarse_catalogo(ev, reproduciendo):
+    catalogo_compartido["vigente"] = ev["archivo"]
+    catalogo_compartido["version"] = ev.get("version") or 0
+    if not catalogo_compartido["activo"] or ev["archivo"] == catalogo_compartido["cargado"]:
+        return
+    coordinacion.en_loop(_programar_recarga_catalogo)
+
+def _programar_recarga_catalogo():
+    tarea = catalogo_compartido["tarea"]
+    if tarea is None or tarea.done():
+        catalogo_compartido["tarea"] = asyncio.create_task(_recargar_catalogo())
+
+async def _recargar_catalogo():
+    """Carga el snapshot vigente; si llega otro mientras se lee, carga ese"""
+    while catalogo_compartido["vigente"] != catalogo_compartido["cargado"]:
+        archivo, numero = catalogo_compartido["vigente"], catalogo_compartido["version"]
         try:
-            productos_api = gh.cargar_productos_github()
-            print(f"   ✅ {len(productos_api)} productos cargados")
+            datos = await asyncio.to_thread(coordinacion.leer_catalogo, archivo)
         except Exception as e:
-            print(f"   ⚠️ Error: {e}")
-            productos_api = []
-        
-        # 3️⃣ Cargar direcciones
-        print("\n📍 PASO 3: Cargando direcciones...")
+            log.warning("Error cargando catálogo compartido %s: %s", archivo, e)
+            return
+        await asyncio.to_thread(productos_module.publicar, datos, numero or None)
+        catalogo_compartido["cargado"] = archivo
+        log.info("Catálogo v%d actualizado por otro worker: %d productos", numero, len(datos))
+
+@coordinacion.manejador("contactos")
+def _al_cambiar_contactos(ev, reproduciendo):
+    # Pendiente de backup en todos los workers: el líder respalda también
+    # lo que se editó en los demás
+    contactos.marcar_pendiente(ev["tipo"])
+    if reproduciendo or coordinacion.es_propio(ev):
+        return
+    if ev["tipo"] == "direcciones":
+        contactos.cargar_direcciones()
+    else:
+        contactos.cargar_telefonos()
+
+@coordinacion.al_reiniciar
+def _al_compactarse_diario():
+    """Otro worker compactó el diario: se reconstruye desde él"""
+    mensajes.clear()
+    contactos.cargar_direcciones()
+    contactos.cargar_telefonos()
+
+def _al_ser_lider():
+    """Tareas de fondo: corren en un solo worker"""
+    global tarea_refresco_catalogo
+    tarea_refresco_catalogo = asyncio.create_task(refrescar_catalogo_github())
+    asyncio.create_task(tarea_limpieza_periodica())
+    asyncio.create_task(tarea_backup_contactos())
+    if proceso_activo:
+        # El líder anterior terminó con un lote de imágenes a medias
+        asyncio.create_task(asyncio.to_thread(coordinacion.publicar, "proceso_imagenes", activo=False))
+
+# =============================
+# 🚀 EVENTO DE STARTUP
+# =============================
+# Fase 1 (bloquea el arranque, solo disco local y en paralelo): catálogo desde
+# la última copia local, contactos y usuarios. Con eso la API ya está lista.
+# Fase 2 (segundo plano): refrescar el catálogo desde GitHub y cargar Firebird.
+estado_inicio = {
+    "iniciado": None,
+    "listo": False,
+    "listo_en_ms": None,
+    "fuente_catalogo": None,
+    "github_sincronizado": False,
+}
+tarea_refresco_catalogo = None
+
+def _cargar_snapshot_productos():
+    """
+    Catálogo local más reciente: el último publicado por otro worker, la
+    copia de GitHub y, si no hay, productos.json
+    """
+    vigente = catalogo_compartido["vigente"]
+    if vigente:
         try:
-            contactos.cargar_direcciones()
-            direcciones = contactos.obtener_direcciones()
-            print(f"   ✅ {len(direcciones)} direcciones cargadas")
+            return coordinacion.leer_catalogo(vigente), "compartido"
         except Exception as e:
-            print(f"   ⚠️ Error: {e}")
-            direcciones = []
+            log.warning("Error cargando catálogo compartido %s: %s", vigente, e)
+    datos = gh.cargar_productos_local()
+    if datos is not None:
+        return datos, "copia_github"
+    return productos_module.cargar_productos_api().productos, "productos.json"
+
+async def refrescar_catalogo_github():
+    """Trae el catálogo de GitHub sin bloquear el arranque y lo publica en memoria"""
+    try:
+        datos = await asyncio.to_thread(gh.cargar_productos_github)
+        if datos or not len(productos_module.vigente()):
+            await publicar_productos(datos)
+        estado_inicio["github_sincronizado"] = True
+        if datos:
+            # Snapshot binario para que el siguiente arranque solo mapee el archivo
+            await asyncio.to_thread(gh.guardar_snapshot_productos, datos)
+        log.info("Catálogo refrescado desde GitHub: %d productos", len(productos_module.vigente()))
+    except Exception as e:
+        log.warning("Error refrescando catálogo desde GitHub: %s", e)
+
+@app.on_event("startup")
+async def startup_event():
+    """Carga local en paralelo y deja la red para segundo plano"""
+    global direcciones, telefonos
+    
+    inicio = time.perf_counter()
+    estado_inicio["iniciado"] = datetime.now().isoformat()
+    log.info("Iniciando Ferre-Calvillito API")
+    
+    try:
+        # 1️⃣ Inicializar GitHub (solo rutas y configuración) y reconstruir
+        # el estado compartido con los demás workers (mensajes, catálogo vigente)
+        gh.inicializar_github(DATA_DIR)
+        coordinacion.iniciar(DATA_DIR)
         
-        # 4️⃣ Cargar teléfonos
-        print("\n📞 PASO 4: Cargando teléfonos...")
-        try:
-            contactos.cargar_telefonos()
-            telefonos = contactos.obtener_telefonos()
-            print(f"   ✅ {len(telefonos)} teléfonos cargados")
-        except Exception as e:
-            print(f"   ⚠️ Error: {e}")
-            telefonos = []
+        # 2️⃣ Cargas locales en paralelo
+        snapshot, r_dir, r_tel, r_usr = await asyncio.gather(
+            asyncio.to_thread(_cargar_snapshot_productos),
+            asyncio.to_thread(contactos.cargar_direcciones),
+            asyncio.to_thread(contactos.cargar_telefonos),
+            asyncio.to_thread(usuarios_oauth.cargar_usuarios),
+            return_exceptions=True
+        )
+        
+        if isinstance(snapshot, Exception):
+            log.warning("Error cargando catálogo local: %s", snapshot)
+            productos_module.publicar([])
+        else:
+            datos, estado_inicio["fuente_catalogo"] = snapshot
+            if estado_inicio["fuente_catalogo"] == "compartido":
+                productos_module.publicar(datos, catalogo_compartido["version"] or None)
+                catalogo_compartido["cargado"] = catalogo_compartido["vigente"]
+            elif datos is not productos_module.obtener_productos_api():  # productos.json ya se publicó al cargarse
+                productos_module.publicar(datos)
+        catalogo_compartido["activo"] = True
         
-        # 5️⃣ Limpiar mensajes
-        print("\n💬 PASO 5: Limpiando mensajes...")
+        for nombre, resultado in (("direcciones", r_dir), ("teléfonos", r_tel), ("usuarios OAuth", r_usr)):
+            if isinstance(resultado, Exception):
+                log.warning("Error cargando %s: %s", nombre, resultado)
+        direcciones = contactos.obtener_direcciones()
+        telefonos = contactos.obtener_telefonos()
+        
+        # 3️⃣ Limpiar mensajes
         limpiar_mensajes_antiguos()
-        print(f"   ✅ Mensajes: {len(mensajes)} activos")
         
-        # 6️⃣ Iniciar tareas periódicas
-        print("\n⏱️ PASO 6: Iniciando tareas periódicas...")
-        asyncio.create_task(tarea_limpieza_periodica())
-        print("   ✅ Tarea de limpieza programada (cada 24h)")
+        # 4️⃣ Tareas en segundo plano (las compartidas solo en el worker líder)
+        coordinacion.iniciar_liderazgo(_al_ser_lider)
+        asyncio.create_task(asyncio.to_thread(cargar_cliente_firebird))
+        perfilador.iniciar_vigilante()
         
-        # 7️⃣ Resumen
-        print("\n" + "="*80)
-        print("✅ API LISTA PARA USAR")
-        print("="*80)
-        print(f"📊 Productos: {len(productos_api)}")
-        print(f"🖼️ Imágenes descargadas: {len([p for p in productos_api if p.get('imagen', {}).get('url_github')])}")
-        print(f"📍 Direcciones: {len(direcciones)}")
-        print(f"📞 Teléfonos: {len(telefonos)}")
-        print(f"💬 Mensajes: {len(mensajes)}")
-        print(f"📁 Base: {SCRIPT_DIR}")
-        print("="*80 + "\n")
+        estado_inicio["listo"] = True
+        estado_inicio["listo_en_ms"] = round((time.perf_counter() - inicio) * 1000)
+        log.info(
+            "API lista en %d ms: productos=%d (%s) direcciones=%d telefonos=%d mensajes=%d",
+            estado_inicio["listo_en_ms"], len(productos_module.vigente()), estado_inicio["fuente_catalogo"],
+            len(direcciones), len(telefonos), len(mensajes)
+        )
         
     except Exception as e:
-        print(f"\n❌ ERROR EN STARTUP:")
-        print(f"{traceback.format_exc()}\n")
+        log.exception("Error en startup: %s", e)
+
+# =============================
+# 🩺 SONDAS (liveness / readiness)
+# =============================
+
+@app.get("/health/live")
+async def sonda_vivo():
+    """El proceso responde (no depende de datos ni de GitHub)"""
+    return {"ok": True}
+
+@app.get("/health/ready")
+async def sonda_listo():
+    """Listo para atender: catálogo local y contactos cargados"""
+    codigo = 200 if estado_inicio["listo"] else 503
+    return JSONResponse(
+        {"ok": estado_inicio["listo"], **estado_inicio, "worker": coordinacion.estado()},
+        status_code=codigo
+    )
 
 # =============================
 # 🛌 EVENTO DE SHUTDOWN
@@ -256,8 +509,11 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Se ejecuta al apagar la API"""
-    print("\n🛑 APAGANDO FERRE-CALVILLITO API")
-    print("   ✅ Limpieza completada\n")
+    log.info("Apagando Ferre-Calvillito API")
+    contactos.respaldar_pendientes()
+    perfilador.detener_vigilante()
+    coordinacion.detener()
+    bitacora.detener()
 
 # =============================
 # 🏠 ENDPOINTS BÁSICOS
@@ -265,13 +521,11 @@ async def shutdown_event():
 
 @app.post("/api/productos/detener-proceso")
 async def detener_proceso():
-    """Detiene el procesamiento de imágenes"""
-    global detener_proceso_flag, proceso_activo
-    
+    """Detiene el procesamiento de imágenes (el proceso corre en el worker líder)"""
     if not proceso_activo:
         return {"ok": False, "error": "No hay proceso activo"}
     
-    detener_proceso_flag = True
+    await asyncio.to_thread(coordinacion.publicar, "detener_imagenes")
     
     return {
         "ok": True,
@@ -279,36 +533,42 @@ async def detener_proceso():
     }
 
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    """Página de redirección automática"""
-    html_path = os.path.join(static_dir, "redirect.html")
-    if os.path.exists(html_path):
-        with open(html_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read(), media_type="text/html; charset=utf-8")
+async def index(request: Request):
+    """Sirve directamente la versión móvil o laptop según el dispositivo (sin redirección)"""
+    dispositivo = dispositivos.clasificar_peticion(request)
+    pagina = "index-mobile.html" if dispositivo == dispositivos.MOVIL else "index.html"
+    headers = {"Vary": dispositivos.HEADERS_VARY, "Accept-CH": dispositivos.HEADERS_ACCEPT_CH}
     
-    laptop_path = os.path.join(static_dir, "index.html")
-    if os.path.exists(laptop_path):
-        with open(laptop_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read(), media_type="text/html; charset=utf-8")
+    # redirect.html queda como respaldo (detección en el cliente) si falta la página
+    for nombre in (pagina, "redirect.html"):
+        respuesta = await paginas_cache.responder(request, os.path.join(static_dir, nombre), headers_extra=headers)
+        if respuesta is not None:
+            return respuesta
     
     return HTMLResponse("<h1>Bienvenido a Ferre-Calvillito API</h1>")
 
+@app.get("/sw.js")
+async def service_worker(request: Request):
+    """Service worker de la tienda: se sirve desde la raíz para que su alcance sea todo el sitio"""
+    respuesta = await paginas_cache.responder(request, os.path.join(static_dir, "sw.js"), headers_extra={"Service-Worker-Allowed": "/"})
+    if respuesta is not None:
+        return respuesta
+    return Response(status_code=404)
+
 @app.get("/mobile", response_class=HTMLResponse)
-async def index_mobile():
+async def index_mobile(request: Request):
     """Versión móvil"""
-    html_path = os.path.join(static_dir, "index-mobile.html")
-    if os.path.exists(html_path):
-        with open(html_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read(), media_type="text/html; charset=utf-8")
+    respuesta = await paginas_cache.responder(request, os.path.join(static_dir, "index-mobile.html"))
+    if respuesta is not None:
+        return respuesta
     return HTMLResponse("<h1>Error: index-mobile.html no encontrado</h1>", status_code=404)
 
 @app.get("/desktop", response_class=HTMLResponse)
-async def index_desktop():
+async def index_desktop(request: Request):
     """Versión desktop"""
-    html_path = os.path.join(static_dir, "index.html")
-    if os.path.exists(html_path):
-        with open(html_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read(), media_type="text/html; charset=utf-8")
+    respuesta = await paginas_cache.responder(request, os.path.join(static_dir, "index.html"))
+    if respuesta is not None:
+        return respuesta
     return HTMLResponse("<h1>Error: index.html no encontrado</h1>", status_code=404)
 
 # =============================
@@ -316,35 +576,53 @@ async def index_desktop():
 # =============================
 
 @app.get("/producto")
-async def obtener_productos():
-    """Devuelve todos los productos CON IMÁGENES desde GitHub"""
-    productos = gh.cargar_productos_github()
+async def obtener_productos(request: Request):
+    """Devuelve todos los productos CON IMÁGENES (catálogo publicado en memoria)"""
+    # Cuerpo y encabezados salen de la misma versión: el service worker guarda
+    # esta foto con ese número y le aplica después los cambios desde él
+    version = productos_module.vigente()
+    headers = {"ETag": f'"catalogo-{version.numero}"', "X-Catalogo-Version": str(version.numero), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
     
-    # Asegurar que cada producto tenga estructura de imagen
-    for prod in productos:
-        if not prod.get('imagen'):
-            prod['imagen'] = {
-                'existe': False,
-                'url_github': None
-            }
+    # Asegurar que cada producto tenga estructura de imagen (dicts nuevos:
+    # los de la versión publicada no se modifican)
+    productos = [
+        prod if prod.get('imagen') else {**prod, 'imagen': {'existe': False, 'url_github': None}}
+        for prod in version.productos
+    ]
     
-    cant_con_imagen = len([p for p in productos if p.get('imagen', {}).get('existe')])
-    print(f"🔍 GET /producto")
-    print(f"   Total: {len(productos)}")
-    print(f"   Con imagen: {cant_con_imagen}")
+    bitacora.debug_muestreado(log, "get_producto", "GET /producto: %d productos", len(productos))
     
-    return JSONResponse(
+    return RespuestaJSON(
         content=productos,
-        media_type="application/json; charset=utf-8"
+        media_type="application/json; charset=utf-8",
+        headers=headers
     )
 
+@app.get("/api/productos/cambios")
+async def cambios_productos(desde: int = 0):
+    """
+    Productos agregados/modificados y códigos eliminados desde la versión
+    'desde' (la de X-Catalogo-Version). Con resync=True esa versión no se
+    puede poner al día con cambios (registro recortado, versión de antes de
+    un reinicio o desconocida) y hay que volver a descargar /producto.
+    """
+    resultado = productos_module.cambios_desde(desde)
+    if resultado is None:
+        return {"version": productos_module.vigente().numero, "resync": True}
+    version, actualizados, eliminados = resultado
+    return RespuestaJSON({
+        "version": version.numero,
+        "resync": False,
+        "actualizados": list(actualizados.values()),
+        "eliminados": eliminados,
+    })
+
 @app.get("/api/productos/{codigo}/imagen")
 async def obtener_imagen_producto(codigo: str):
     """Obtiene la URL de imagen de un producto específico"""
-    producto = next(
-        (p for p in productos_api if p.get('Codigo') == codigo),
-        None
-    )
+    producto = productos_module.vigente().buscar(codigo)
     
     if not producto:
         return JSONResponse({"error": "Producto no encontrado"}, status_code=404)
@@ -364,12 +642,12 @@ async def obtener_imagen_producto(codigo: str):
 async def procesar_imagenes_manual():
     """Procesa imágenes manualmente de productos sin imagen"""
     
-    if not gestor_imagenes:
+    if not obtener_gestor_imagenes():
         return {"ok": False, "error": "Gestor de imágenes no inicializado"}
     
     try:
         # Cargar productos desde GitHub
-        productos = gh.cargar_productos_github()
+        productos = await asyncio.to_thread(gh.cargar_productos_github)
         
         # ✅ CORRECCIÓN: Filtrar productos SIN imagen que tengan Nombre
         # (tus productos NO tienen campo "Descripcion", solo "Nombre")
@@ -388,14 +666,10 @@ async def procesar_imagenes_manual():
         # Tomar solo los primeros 50
         lote = productos_sin_imagen[:50]
         
-        print(f"\n{'='*60}")
-        print(f"📦 PROCESANDO LOTE MANUAL")
-        print(f"   Productos a procesar: {len(lote)}")
-        print(f"   Pendientes totales: {len(productos_sin_imagen)}")
-        print(f"{'='*60}\n")
+        log.info("Procesando lote manual: %d productos (%d pendientes)", len(lote), len(productos_sin_imagen))
         
-        # Procesar en background
-        asyncio.create_task(procesar_imagenes_background(lote))
+        # Procesar en background (en el worker líder)
+        await asyncio.to_thread(coordinacion.publicar, "procesar_imagenes", lote=lote)
         
         return {
             "ok": True,
@@ -405,24 +679,20 @@ async def procesar_imagenes_manual():
         }
     
     except Exception as e:
-        print(f"❌ Error: {e}")
+        log.exception("Error procesando lote manual: %s", e)
         return {"ok": False, "error": str(e)}
 
 @app.post("/api/productos/admin-upload")
 async def admin_upload_productos(data: list[dict]):
     """Admin upload de productos PRESERVANDO imágenes existentes"""
-    global productos_api
-    
-    print(f"\n{'='*60}")
-    print(f"📤 ADMIN UPLOAD - PRODUCTOS (preservando imágenes)")
-    print(f"   Cantidad recibida: {len(data)}")
+    log.info("Admin upload de productos: %d recibidos", len(data))
     
     if not data:
         return {"ok": False, "error": "Lista vacía"}
     
     try:
         # 1️⃣ CARGAR PRODUCTOS ACTUALES DESDE GITHUB
-        productos_actuales = gh.cargar_productos_github()
+        productos_actuales = await asyncio.to_thread(gh.cargar_productos_github)
         
         # 2️⃣ CREAR DICCIONARIO DE IMÁGENES EXISTENTES
         imagenes_existentes = {}
@@ -431,8 +701,6 @@ async def admin_upload_productos(data: list[dict]):
             if codigo and prod.get('imagen'):
                 imagenes_existentes[codigo] = prod['imagen']
         
-        print(f"   📦 Imágenes existentes: {len(imagenes_existentes)}")
-        
         # 3️⃣ COMBINAR: datos nuevos + imágenes existentes
         for prod in data:
             codigo = prod.get('Codigo')
@@ -442,7 +710,6 @@ async def admin_upload_productos(data: list[dict]):
                 # Buscar si ya tiene una imagen guardada
                 if codigo in imagenes_existentes:
                     prod['imagen'] = imagenes_existentes[codigo]
-                    print(f"   ✅ {codigo}: Imagen preservada")
                 else:
                     # Producto nuevo sin imagen
                     prod['imagen'] = {
@@ -450,35 +717,28 @@ async def admin_upload_productos(data: list[dict]):
                         'url_github': None
                     }
         
-        # 4️⃣ Actualizar memoria y GitHub
-        productos_api = data
-        gh.guardar_productos_github(data)
+        # 4️⃣ Actualizar memoria, GitHub y los demás workers
+        await publicar_productos(data)
+        await asyncio.to_thread(gh.guardar_productos_github, data)
         
         # 5️⃣ PROCESAR IMÁGENES AUTOMÁTICAMENTE (solo para nuevos)
-        print(f"\n🖼️ Verificando productos sin imagen...")
-        
-        if gestor_imagenes:
+        if obtener_gestor_imagenes():
          productos_sin_imagen = [
          p for p in data 
          if p.get('Nombre') and p['Nombre'].strip()
          and not p.get('imagen', {}).get('url_github')
          ]
             
-         print(f"   📦 Productos sin imagen: {len(productos_sin_imagen)}")
-            
          if productos_sin_imagen:
                 try:
-                    asyncio.create_task(
-                        procesar_imagenes_background(productos_sin_imagen)
-                    )
-                    print(f"   ⏳ Procesando imágenes nuevas en segundo plano...")
+                    await asyncio.to_thread(coordinacion.publicar, "procesar_imagenes", lote=productos_sin_imagen)
+                    log.info("Procesando %d imágenes nuevas en segundo plano", len(productos_sin_imagen))
                 except Exception as e:
-                    print(f"   ⚠️ Error: {e}")
+                    log.warning("No se pudo iniciar el procesamiento de imágenes: %s", e)
         
         con_imagen = len([p for p in data if p.get('imagen', {}).get('url_github')])
-        print(f"✅ Productos guardados")
-        print(f"   Con imagen: {con_imagen}/{len(data)}")
-        print(f"{'='*60}\n")
+        log.info("Admin upload guardado: %d productos, %d con imagen, %d imágenes preservadas",
+                 len(data), con_imagen, len(imagenes_existentes))
         
         return {
             "ok": True,
@@ -490,24 +750,40 @@ async def admin_upload_productos(data: list[dict]):
         }
     
     except Exception as e:
-        print(f"❌ Error: {e}\n")
+        log.exception("Error en admin upload: %s", e)
         return {"ok": False, "error": str(e)}
     
+@coordinacion.manejador("procesar_imagenes")
+def _al_pedir_imagenes(ev, reproduciendo):
+    if not reproduciendo and coordinacion.es_lider():
+        coordinacion.tarea_en_loop(procesar_imagenes_background(ev["lote"]))
+
+@coordinacion.manejador("proceso_imagenes")
+def _al_cambiar_proceso_imagenes(ev, reproduciendo):
+    global proceso_activo, detener_proceso_flag
+    if not reproduciendo:
+        proceso_activo = ev["activo"]
+        detener_proceso_flag = False
+
+@coordinacion.manejador("detener_imagenes")
+def _al_detener_imagenes(ev, reproduciendo):
+    global detener_proceso_flag
+    if not reproduciendo and proceso_activo:
+        detener_proceso_flag = True
+
 async def procesar_imagenes_background(productos_lote):
     """Procesa un lote de productos en segundo plano CON OPCIÓN DE DETENER"""
-    global productos_api, proceso_activo, detener_proceso_flag
-
-    if not gestor_imagenes:
-        print("❌ Gestor no disponible")
+    gestor = obtener_gestor_imagenes()
+    if not gestor:
+        log.error("Gestor de imágenes no disponible")
         return
 
-    proceso_activo = True
-    detener_proceso_flag = False
+    await asyncio.to_thread(coordinacion.publicar, "proceso_imagenes", activo=True)
 
-    print(f"\n🖼️ INICIANDO PROCESAMIENTO - {len(productos_lote)} productos\n")
+    log.info("Iniciando procesamiento de imágenes: %d productos", len(productos_lote))
 
     try:
-        productos_github = gh.cargar_productos_github()
+        productos_github = await asyncio.to_thread(gh.cargar_productos_github)
         productos_dict = {p.get("Codigo"): p for p in productos_github}
         
         imagenes_encontradas = 0
@@ -515,37 +791,40 @@ async def procesar_imagenes_background(productos_lote):
         # Procesar de a 5 productos para poder detener rápido
         for i in range(0, len(productos_lote), 5):
          if detener_proceso_flag:
-            print(f"\n🛑 PROCESO DETENIDO - Procesados: {i}/{len(productos_lote)}\n")
+            log.info("Proceso de imágenes detenido: %d/%d procesados", i, len(productos_lote))
             break
     
          sublote = productos_lote[i:i+5]
-         resultados = await gestor_imagenes.procesar_lote(sublote)
+         resultados = await gestor.procesar_lote(sublote)
             
          for resultado in resultados:
                 codigo = resultado.get("Codigo")
                 imagen = resultado.get("imagen", {})
+                metricas.IMAGENES_PROCESADAS.incrementar(
+                    resultado="encontrada" if imagen.get("url_github") else "sin_imagen"
+                )
                 if imagen.get("url_github") and codigo in productos_dict:
-                    productos_dict[codigo]["imagen"] = imagen
+                    # Copia: la lista descargada puede estar compartida con otras peticiones
+                    productos_dict[codigo] = {**productos_dict[codigo], "imagen": imagen}
                     imagenes_encontradas += 1
         
         if imagenes_encontradas > 0:
             productos_actualizados = list(productos_dict.values())
-            gh.guardar_productos_github(productos_actualizados)
-            productos_api = productos_actualizados
-            print(f"✅ {imagenes_encontradas} imágenes guardadas\n")
+            await asyncio.to_thread(gh.guardar_productos_github, productos_actualizados)
+            await publicar_productos(productos_actualizados)
+            log.info("%d imágenes guardadas", imagenes_encontradas)
 
     except Exception as e:
-        print(f"❌ ERROR: {e}\n")
+        log.exception("Error procesando imágenes: %s", e)
     
     finally:
-        proceso_activo = False
-        detener_proceso_flag = False
+        await asyncio.to_thread(coordinacion.publicar, "proceso_imagenes", activo=False)
 
 @app.get("/api/productos/progreso-imagenes")
 async def progreso_imagenes():
 
     try:
-        productos = gh.cargar_productos_github()
+        productos = await asyncio.to_thread(gh.cargar_productos_github)
         total = len(productos)
         con_imagen = len([p for p in productos if p.get('imagen', {}).get('url_github')])
         sin_imagen = total - con_imagen
@@ -610,19 +889,23 @@ async def progreso_imagenes():
 
 @app.get("/debug/productos-estado")
 async def debug_productos_estado():
-    """Debug de estado de productos"""
-    productos = gh.cargar_productos_github()
+    """Debug de estado de productos (solo memoria, sin llamar a GitHub)"""
+    version = productos_module.vigente()
     return {
         "timestamp": datetime.now().isoformat(),
-        "productos_memoria": len(productos_api),
+        "productos_memoria": len(version),
+        "version": version.numero,
+        "publicada": datetime.fromtimestamp(version.publicada).isoformat(),
         "github_estado": gh.debug_estado_github(),
-        "primero": productos[0] if productos else None
+        "primero": version.productos[0] if len(version) else None
     }
 
 @app.delete("/api/productos/limpiar")
 async def limpiar_productos():
-    """⚠️ Elimina TODOS los productos"""
-    productos_module.limpiar_productos()
+    """⚠️ Elimina TODOS los productos (antes se respalda el catálogo actual)"""
+    anterior = productos_module.vigente()
+    await publicar_productos([])
+    await asyncio.to_thread(productos_module.guardar_productos_api, anterior)
     return {"ok": True, "mensaje": "Todos los productos han sido eliminados"}
 
 # =============================
@@ -632,12 +915,12 @@ async def limpiar_productos():
 @app.get("/auth/google/login")
 async def login_google(request: Request):
     redirect_uri = os.getenv("GOOGLE_REDIRECT_URI", "http://127.0.0.1:5000/auth/google/callback")
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return await obtener_oauth().google.authorize_redirect(request, redirect_uri)
 
 @app.get("/auth/google/callback")
 async def auth_google_callback(request: Request):
     try:
-        token = await oauth.google.authorize_access_token(request)
+        token = await obtener_oauth().google.authorize_access_token(request)
         user = token.get("userinfo")
     except Exception as e:
         return JSONResponse({"error": f"Error al autenticar: {str(e)}"}, status_code=500)
@@ -645,24 +928,10 @@ async def auth_google_callback(request: Request):
     if not user:
         return JSONResponse({"error": "No se pudo obtener el usuario"}, status_code=400)
 
-    # Guardar usuario localmente
-    users_path = os.path.join(SCRIPT_DIR, "usuarios.json")
-    users = []
-    if os.path.exists(users_path):
-        try:
-            with open(users_path, "r", encoding="utf-8") as f:
-                users = json.load(f)
-        except:
-            users = []
-
-    if not any(u["email"] == user["email"] for u in users):
-        users.append({
-            "nombre": user["name"],
-            "email": user["email"],
-            "foto": user.get("picture", "")
-        })
-        with open(users_path, "w", encoding="utf-8") as f:
-            json.dump(users, f, indent=2, ensure_ascii=False)
+    # Guardar usuario localmente (solo si es nuevo)
+    await usuarios_oauth.registrar_si_nuevo(user["name"], user["email"], user.get("picture", ""))
+    # La cookie de sesión (firmada) prueba el correo en los canales por usuario
+    request.session["correo"] = user["email"]
 
     html = f"""
     <script>
@@ -687,6 +956,60 @@ class Mensaje(BaseModel):
     origen: str = "usuario"
     destinatario: str = None
 
+LIMITE_MENSAJES_DEFAULT = 200
+LIMITE_MENSAJES_MAX = 1000
+
+def _mensajes_desde(since):
+    """Mensajes con seq mayor a 'since' (la lista está ordenada por seq)"""
+    if not since:
+        return mensajes
+    return mensajes[bisect_right(mensajes, since, key=lambda m: m["seq"]):]
+
+def _autenticado_como(request: Request, usuario):
+    """
+    True si la petición demuestra ser de 'usuario': sesión de Google
+    (cookie firmada) o token JWT de /auth/login en Authorization: Bearer o
+    en ?token= (EventSource no puede mandar encabezados)
+    """
+    if not usuario:
+        return False
+    correo = usuario.strip().lower()
+    if (request.session.get("correo") or "").lower() == correo:
+        return True
+    token = request.query_params.get("token")
+    partes = (request.headers.get("authorization") or "").split()
+    if len(partes) == 2 and partes[0].lower() == "bearer":
+        token = partes[1]
+    payload = decode_token(token) if token else None
+    return bool(payload) and str(payload.get("correo", "")).lower() == correo
+
+def _es_del_usuario(m, usuario):
+    return m.get("usuario") == usuario or m.get("destinatario") == usuario or m.get("origen") == usuario
+
+def _mensaje_a_json(m):
+    """Copia serializable de un mensaje (fecha en ISO)"""
+    msg_dict = m.copy()
+    if isinstance(msg_dict.get("fecha"), datetime):
+        msg_dict["fecha"] = msg_dict["fecha"].isoformat()
+    return msg_dict
+
+def _calcular_contadores(usuario):
+    """Cuenta los mensajes no leídos dirigidos al usuario por tipo"""
+    no_leidos_preguntas = 0
+    no_leidos_sugerencias = 0
+    for m in mensajes:
+        if m.get("destinatario") != usuario or m.get("leido"):
+            continue
+        if m.get("tipo") == "pregunta":
+            no_leidos_preguntas += 1
+        elif m.get("tipo") == "sugerencia":
+            no_leidos_sugerencias += 1
+    return {
+        "noLeidosPreguntas": no_leidos_preguntas,
+        "noLeidosSugerencias": no_leidos_sugerencias,
+        "total": no_leidos_preguntas + no_leidos_sugerencias
+    }
+
 @app.post("/api/mensajes/enviar")
 async def enviar_mensaje(data: Mensaje):
     origen = data.origen or "usuario"
@@ -704,50 +1027,96 @@ async def enviar_mensaje(data: Mensaje):
         "leido": False,
         "fecha": datetime.now()
     }
+    await asyncio.to_thread(coordinacion.publicar, "mensaje", registro=registro)
 
-    mensajes.append(registro)
-    print(f"📤 Mensaje enviado: {registro}")
     return {"ok": True, "mensaje": "Mensaje enviado correctamente"}
 
+@coordinacion.manejador("mensaje")
+def _al_recibir_mensaje(ev, reproduciendo):
+    """Agrega el mensaje (en todos los workers) y notifica a sus conexiones SSE"""
+    registro = dict(ev["registro"], seq=ev["n"])
+    if isinstance(registro.get("fecha"), str):
+        registro["fecha"] = datetime.fromisoformat(registro["fecha"])
+    mensajes.append(registro)
+    if reproduciendo:
+        return
+    log.debug("Mensaje %s enviado: %s -> %s (%s)", registro["id"], registro["origen"], registro["destinatario"], registro["tipo"])
+
+    # 📡 Notificar en tiempo real al remitente y al destinatario
+    destinatario = registro["destinatario"]
+    msg_json = _mensaje_a_json(registro)
+    for interesado in {registro["usuario"], destinatario}:
+        coordinacion.en_loop(tiempo_real.publicar, interesado, "mensaje", msg_json, registro["seq"])
+    coordinacion.en_loop(tiempo_real.publicar, destinatario, "contadores", _calcular_contadores(destinatario))
+
 @app.get("/api/mensajes/recibir")
-async def recibir_mensajes(usuario: str = None, tipo: str = None):
-    """Devuelve mensajes filtrados"""
-    print(f"🔍 Recibiendo mensajes - Usuario: {usuario}, Tipo: {tipo}")
-    
-    filtrados = mensajes.copy()
-    
-    if tipo:
-        filtrados = [m for m in filtrados if m.get("tipo") == tipo]
-    
-    if usuario:
-        filtrados = [
-            m for m in filtrados
-            if m.get("usuario") == usuario or m.get("destinatario") == usuario or m.get("origen") == usuario
-        ]
-    
+async def recibir_mensajes(usuario: str = None, tipo: str = None, since: int = 0, limite: int = None):
+    """
+    Devuelve mensajes filtrados con seq > since, en orden, hasta 'limite'.
+    El cursor para la siguiente llamada va en la cabecera X-Cursor y
+    X-Hay-Mas indica si quedaron mensajes pendientes por paginar.
+    Sin 'since' ni 'limite' devuelve todo el historial (compatibilidad).
+    """
+    bitacora.debug_muestreado(log, "recibir_mensajes", "Recibiendo mensajes: usuario=%s tipo=%s since=%s", usuario, tipo, since)
+
+    if limite is None:
+        limite = LIMITE_MENSAJES_DEFAULT if since else len(mensajes)
+    else:
+        limite = max(0, min(limite, LIMITE_MENSAJES_MAX))
+
     resultado = []
-    for m in filtrados:
-        msg_dict = m.copy()
-        if isinstance(msg_dict.get("fecha"), datetime):
-            msg_dict["fecha"] = msg_dict["fecha"].isoformat()
-        resultado.append(msg_dict)
-    
-    return resultado
+    cursor = since
+    hay_mas = False
+    for m in _mensajes_desde(since):
+        if tipo and m.get("tipo") != tipo:
+            continue
+        if usuario and not _es_del_usuario(m, usuario):
+            continue
+        if len(resultado) >= limite:
+            hay_mas = True
+            break
+        resultado.append(_mensaje_a_json(m))
+        cursor = m["seq"]
+
+    return JSONResponse(
+        content=resultado,
+        headers={"X-Cursor": str(cursor), "X-Hay-Mas": "1" if hay_mas else "0"}
+    )
 
 @app.get("/api/mensajes/contadores")
 async def contadores(usuario: str):
-    no_leidos_preguntas = sum(
-        1 for m in mensajes if m.get("destinatario") == usuario and not m.get("leido") and m.get("tipo") == "pregunta"
-    )
-    no_leidos_sugerencias = sum(
-        1 for m in mensajes if m.get("destinatario") == usuario and not m.get("leido") and m.get("tipo") == "sugerencia"
+    return _calcular_contadores(usuario)
+
+@app.get("/api/mensajes/stream")
+async def stream_mensajes(request: Request, usuario: str):
+    """
+    Canal Server-Sent Events por usuario: envía los mensajes nuevos
+    ("mensaje") y los contadores de no leídos ("contadores") al momento,
+    en lugar de que el cliente haga polling. Solo para el propio usuario
+    autenticado (401 si no): sin eso cualquiera leería los mensajes ajenos
+    """
+    if not _autenticado_como(request, usuario):
+        return JSONResponse({"ok": False, "error": "No autenticado"}, status_code=401)
+
+    iniciales = [("contadores", _calcular_contadores(usuario), None)]
+
+    # Al reconectar, EventSource manda el último id recibido: reenviar lo perdido
+    ultimo_id = request.headers.get("last-event-id", "")
+    if ultimo_id.isdigit():
+        iniciales += [
+            ("mensaje", _mensaje_a_json(m), m["seq"])
+            for m in _mensajes_desde(int(ultimo_id))
+            if _es_del_usuario(m, usuario)
+        ][-LIMITE_MENSAJES_MAX:]
+
+    return StreamingResponse(
+        tiempo_real.flujo_eventos(usuario, request, iniciales),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
     )
-    total = no_leidos_preguntas + no_leidos_sugerencias
-    return {
-        "noLeidosPreguntas": no_leidos_preguntas,
-        "noLeidosSugerencias": no_leidos_sugerencias,
-        "total": total
-    }
 
 @app.post("/api/mensajes/marcar-leido")
 async def marcar_leido(data: dict = Body(...)):
@@ -757,21 +1126,31 @@ async def marcar_leido(data: dict = Body(...)):
     if not usuario:
         return {"ok": False, "error": "Falta el campo 'usuario'"}
 
-    marcados = 0
-    for m in mensajes:
-        if (
-            m.get("destinatario") == usuario
-            and not m.get("leido")
-            and (not ids or m.get("id") in ids)
-        ):
-            m["leido"] = True
-            marcados += 1
+    ids = set(ids)
+    marcados = sum(1 for m in mensajes if _por_marcar(m, usuario, ids))
+    if marcados:
+        await asyncio.to_thread(coordinacion.publicar, "leido", usuario=usuario, ids=list(ids))
 
     return {"ok": True, "marcados": marcados}
 
+def _por_marcar(m, usuario, ids):
+    return m.get("destinatario") == usuario and not m.get("leido") and (not ids or m.get("id") in ids)
+
+@coordinacion.manejador("leido")
+def _al_marcar_leido(ev, reproduciendo):
+    usuario = ev["usuario"]
+    ids = set(ev["ids"])
+    for m in mensajes:
+        if _por_marcar(m, usuario, ids):
+            m["leido"] = True
+    if not reproduciendo:
+        coordinacion.en_loop(tiempo_real.publicar, usuario, "contadores", _calcular_contadores(usuario))
+
 @app.post("/api/mensajes/limpiar-antiguos")
 async def limpiar_antiguos_manual():
     cantidad = limpiar_mensajes_antiguos()
+    if cantidad:
+        await asyncio.to_thread(compactar_diario)
     return {
         "ok": True,
         "mensaje": f"Se eliminaron {cantidad} mensajes con más de 30 días",
@@ -800,8 +1179,7 @@ class ConexionRequest(BaseModel):
 
 @app.post("/configuracion/cambiarBD")
 async def cambiar_bd(data: ConexionRequest):
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        f.write(data.Cadena.strip())
+    await asyncio.to_thread(escritura_segura.escribir_texto, CONFIG_PATH, data.Cadena.strip())
     return {"mensaje": "Cadena de conexión guardada correctamente"}
 
 @app.get("/configuracion/rutaActual")
@@ -827,17 +1205,15 @@ class Direccion(BaseModel):
 async def obtener_direcciones():
     try:
         dirs = contactos.obtener_direcciones()
-        print(f"📍 GET /direcciones - Devolviendo {len(dirs)} direcciones")
         return JSONResponse(content=dirs, media_type="application/json; charset=utf-8")
     except Exception as e:
-        print(f"❌ Error: {e}")
+        log.exception("Error obteniendo direcciones: %s", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/direcciones/{id}")
 async def obtener_direccion(id: str):
     try:
-        dirs = contactos.obtener_direcciones()
-        direccion = next((d for d in dirs if d.get("id") == id), None)
+        direccion = contactos.obtener_direccion(id)
         if not direccion:
             return JSONResponse({"error": "No encontrada"}, status_code=404)
         return JSONResponse(content=direccion)
@@ -847,13 +1223,17 @@ async def obtener_direccion(id: str):
 @app.post("/direcciones")
 async def agregar_direccion(data: Direccion):
     try:
-        nueva_dir = contactos.agregar_direccion(
-            calle=data.calle, numero=data.numero, colonia=data.colonia,
-            ciudad=data.ciudad, estado=data.estado, cp=data.cp
-        )
-        # 🔄 Guardar en GitHub
-        dirs = contactos.obtener_direcciones()
-        gh.guardar_direcciones_github(dirs)
+        def agregar():
+            nueva = contactos.agregar_direccion(
+                calle=data.calle, numero=data.numero, colonia=data.colonia,
+                ciudad=data.ciudad, estado=data.estado, cp=data.cp
+            )
+            coordinacion.publicar("contactos", tipo="direcciones")
+            return nueva
+
+        nueva_dir = await coordinacion.ejecutar_exclusivo(agregar)
+        # 🔄 Guardar en GitHub (segundo plano)
+        programar_sync_github("direcciones")
         
         return JSONResponse(content={"ok": True, "direccion": nueva_dir}, status_code=201)
     except Exception as e:
@@ -862,16 +1242,21 @@ async def agregar_direccion(data: Direccion):
 @app.put("/direcciones/{id}")
 async def actualizar_direccion(id: str, data: Direccion):
     try:
-        direccion = contactos.actualizar_direccion(
-            id_dir=id, calle=data.calle, numero=data.numero, colonia=data.colonia,
-            ciudad=data.ciudad, estado=data.estado, cp=data.cp
-        )
+        def actualizar():
+            actualizada = contactos.actualizar_direccion(
+                id_dir=id, calle=data.calle, numero=data.numero, colonia=data.colonia,
+                ciudad=data.ciudad, estado=data.estado, cp=data.cp
+            )
+            if actualizada:
+                coordinacion.publicar("contactos", tipo="direcciones")
+            return actualizada
+
+        direccion = await coordinacion.ejecutar_exclusivo(actualizar)
         if not direccion:
             return JSONResponse({"error": "No encontrada"}, status_code=404)
         
-        # 🔄 Guardar en GitHub
-        dirs = contactos.obtener_direcciones()
-        gh.guardar_direcciones_github(dirs)
+        # 🔄 Guardar en GitHub (segundo plano)
+        programar_sync_github("direcciones")
         
         return JSONResponse(content={"ok": True, "direccion": direccion})
     except Exception as e:
@@ -880,14 +1265,18 @@ async def actualizar_direccion(id: str, data: Direccion):
 @app.delete("/direcciones/{id}")
 async def eliminar_direccion(id: str):
     try:
-        dirs = contactos.obtener_direcciones()
-        if not any(d.get("id") == id for d in dirs):
+        def eliminar():
+            ok = contactos.eliminar_direccion(id)
+            if ok:
+                coordinacion.publicar("contactos", tipo="direcciones")
+            return ok
+
+        eliminada = await coordinacion.ejecutar_exclusivo(eliminar)
+        if not eliminada:
             return JSONResponse({"error": "No encontrada"}, status_code=404)
-        contactos.eliminar_direccion(id)
         
-        # 🔄 Guardar en GitHub
-        dirs_actualizado = contactos.obtener_direcciones()
-        gh.guardar_direcciones_github(dirs_actualizado)
+        # 🔄 Guardar en GitHub (segundo plano)
+        programar_sync_github("direcciones")
         
         return JSONResponse(content={"ok": True, "mensaje": "Eliminada"})
     except Exception as e:
@@ -905,7 +1294,6 @@ class Telefono(BaseModel):
 async def obtener_telefonos():
     try:
         tels = contactos.obtener_telefonos()
-        print(f"📞 GET /telefonos - Devolviendo {len(tels)} teléfonos")
         return JSONResponse(content=tels, media_type="application/json; charset=utf-8")
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -913,8 +1301,7 @@ async def obtener_telefonos():
 @app.get("/telefonos/{id}")
 async def obtener_telefono(id: str):
     try:
-        tels = contactos.obtener_telefonos()
-        telefono = next((t for t in tels if t.get("id") == id), None)
+        telefono = contactos.obtener_telefono(id)
         if not telefono:
             return JSONResponse({"error": "No encontrado"}, status_code=404)
         return JSONResponse(content=telefono)
@@ -924,12 +1311,15 @@ async def obtener_telefono(id: str):
 @app.post("/telefonos")
 async def agregar_telefono(data: Telefono):
     try:
-        nuevo_tel = contactos.agregar_telefono(numero=data.numero, descripcion=data.descripcion)
+        def agregar():
+            nuevo = contactos.agregar_telefono(numero=data.numero, descripcion=data.descripcion)
+            coordinacion.publicar("contactos", tipo="telefonos")
+            return nuevo
+
+        nuevo_tel = await coordinacion.ejecutar_exclusivo(agregar)
         
-        # 🔄 GUARDAR EN GITHUB
-        tels = contactos.obtener_telefonos()
-        gh.guardar_telefonos_github(tels)
-        print(f"✅ Teléfono guardado en GitHub")
+        # 🔄 GUARDAR EN GITHUB (segundo plano)
+        programar_sync_github("telefonos")
         
         return JSONResponse(content={"ok": True, "telefono": nuevo_tel}, status_code=201)
     except Exception as e:
@@ -938,14 +1328,18 @@ async def agregar_telefono(data: Telefono):
 @app.put("/telefonos/{id}")
 async def actualizar_telefono(id: str, data: Telefono):
     try:
-        telefono = contactos.actualizar_telefono(id_tel=id, numero=data.numero, descripcion=data.descripcion)
+        def actualizar():
+            actualizado = contactos.actualizar_telefono(id_tel=id, numero=data.numero, descripcion=data.descripcion)
+            if actualizado:
+                coordinacion.publicar("contactos", tipo="telefonos")
+            return actualizado
+
+        telefono = await coordinacion.ejecutar_exclusivo(actualizar)
         if not telefono:
             return JSONResponse({"error": "No encontrado"}, status_code=404)
         
-        # 🔄 GUARDAR EN GITHUB
-        tels = contactos.obtener_telefonos()
-        gh.guardar_telefonos_github(tels)
-        print(f"✅ Teléfono actualizado en GitHub")
+        # 🔄 GUARDAR EN GITHUB (segundo plano)
+        programar_sync_github("telefonos")
         
         return JSONResponse(content={"ok": True, "telefono": telefono})
     except Exception as e:
@@ -954,15 +1348,18 @@ async def actualizar_telefono(id: str, data: Telefono):
 @app.delete("/telefonos/{id}")
 async def eliminar_telefono(id: str):
     try:
-        tels = contactos.obtener_telefonos()
-        if not any(t.get("id") == id for t in tels):
+        def eliminar():
+            ok = contactos.eliminar_telefono(id)
+            if ok:
+                coordinacion.publicar("contactos", tipo="telefonos")
+            return ok
+
+        eliminado = await coordinacion.ejecutar_exclusivo(eliminar)
+        if not eliminado:
             return JSONResponse({"error": "No encontrado"}, status_code=404)
-        contactos.eliminar_telefono(id)
         
-        # 🔄 GUARDAR EN GITHUB
-        tels_actualizado = contactos.obtener_telefonos()
-        gh.guardar_telefonos_github(tels_actualizado)
-        print(f"✅ Teléfono eliminado de GitHub")
+        # 🔄 GUARDAR EN GITHUB (segundo plano)
+        programar_sync_github("telefonos")
         
         return JSONResponse(content={"ok": True, "mensaje": "Eliminado"})
     except Exception as e:
@@ -982,19 +1379,17 @@ async def actualizar_imagen_producto(data: list[dict]):
         }
     ]
     """
-    global productos_api
-    
     if not data or not isinstance(data, list):
         return JSONResponse(
             {"ok": False, "error": "Se esperaba una lista de productos"},
             status_code=400
         )
     
-    print(f"\n{'='*60}")
-    print(f"🖼️ ACTUALIZAR IMÁGENES")
-    print(f"   Productos recibidos: {len(data)}")
+    log.info("Actualizar imágenes: %d productos recibidos", len(data))
     
     actualizados = 0
+    cambios = {}  # Codigo -> copia del producto con la imagen nueva (la versión vigente no se toca)
+    catalogo = productos_module.vigente()
     
     for item in data:
         codigo = item.get("Codigo")
@@ -1003,26 +1398,23 @@ async def actualizar_imagen_producto(data: list[dict]):
         if not codigo or not nueva_img:
             continue
         
-        # Buscar producto
-        for prod in productos_api:
-            if prod.get("Codigo") == codigo:
-                # Actualizar imagen
-                if "imagen" not in prod:
-                    prod["imagen"] = {}
-                
-                prod["imagen"]["existe"] = nueva_img.get("existe", False)
-                prod["imagen"]["url_github"] = nueva_img.get("url_github")
-                prod["imagen"]["fuente"] = "manual"
-                actualizados += 1
-                print(f"   ✅ {codigo}: Imagen actualizada")
-                break
+        prod = cambios.get(codigo) or catalogo.buscar(codigo)
+        if not prod:
+            continue
+        
+        cambios[codigo] = {**prod, "imagen": {
+            **(prod.get("imagen") or {}),
+            "existe": nueva_img.get("existe", False),
+            "url_github": nueva_img.get("url_github"),
+            "fuente": "manual",
+        }}
+        actualizados += 1
     
-    # Guardar en GitHub
+    # Publicar la nueva versión y guardar en GitHub
     if actualizados > 0:
-        gh.guardar_productos_github(productos_api)
-        print(f"✅ {actualizados} productos actualizados en GitHub")
-    
-    print(f"{'='*60}\n")
+        version = await publicar_productos(cambios=cambios)
+        await asyncio.to_thread(gh.guardar_productos_github, list(version.productos))
+        log.info("%d productos actualizados en GitHub", actualizados)
     
     return {
         "ok": True,
@@ -1034,7 +1426,7 @@ async def actualizar_imagen_producto(data: list[dict]):
 async def progreso_detallado():
     """Muestra progreso detallado del procesamiento"""
     try:
-        productos = gh.cargar_productos_github()
+        productos = await asyncio.to_thread(gh.cargar_productos_github)
         con_imagen = len([p for p in productos if p.get('imagen', {}).get('url_github')])
         total = len(productos)
         
@@ -1058,7 +1450,7 @@ async def obtener_todas_imagenes():
     """
     try:
         # Cargar productos desde GitHub
-        productos = gh.cargar_productos_github()
+        productos = await asyncio.to_thread(gh.cargar_productos_github)
         
         # Transformar a formato { "CODIGO": { existe, url_github, fuente } }
         resultado = {}
@@ -1074,21 +1466,104 @@ async def obtener_todas_imagenes():
                     "fuente": imagen.get("fuente", "")
                 }
         
-        total = len(resultado)
-        con_imagen = sum(1 for v in resultado.values() if v.get("existe"))
-        
-        print(f"✅ GET /api/productos/todas-imagenes")
-        print(f"   Total: {total} productos")
-        print(f"   Con imagen: {con_imagen}")
+        bitacora.debug_muestreado(log, "todas_imagenes", "GET /api/productos/todas-imagenes: %d productos", len(resultado))
         
-        return resultado
+        return RespuestaJSON(resultado)
     
     except Exception as e:
-        print(f"❌ Error obteniendo todas las imágenes: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error obteniendo todas las imágenes: %s", e)
         return {}
 
+# =============================
+# 📈 MÉTRICAS (formato Prometheus)
+# =============================
+# Los indicadores se calculan al momento de exponer: no cuestan nada por request
+metricas.Indicador("catalogo_productos", "Productos en memoria", funcion=lambda: len(productos_module.vigente()))
+metricas.Indicador("catalogo_version", "Número de la versión vigente del catálogo", funcion=lambda: productos_module.vigente().numero)
+metricas.Indicador(
+    "catalogo_productos_con_imagen", "Productos con imagen en memoria",
+    funcion=lambda: sum(1 for p in productos_module.vigente() if (p.get("imagen") or {}).get("url_github"))
+)
+metricas.Indicador("imagenes_proceso_activo", "1 si el procesamiento de imágenes está corriendo", funcion=lambda: int(proceso_activo))
+metricas.Indicador(
+    "escrituras_pendientes", "Escrituras encoladas o en curso por tipo", ("cola",),
+    funcion=lambda: {
+        "sync_github": sum(1 for t in _sync_github_tareas.values() if not t.done()),
+        "backup_contactos": len(contactos.pendientes_backup),
+        "backup_en_curso": len(gestor_backups._en_curso),
+    }
+)
+metricas.Indicador("mensajes_en_memoria", "Mensajes en memoria", funcion=lambda: len(mensajes))
+metricas.Indicador("sse_conexiones", "Conexiones de tiempo real abiertas", funcion=tiempo_real.total_conexiones)
+
+@app.get("/metrics")
+async def exponer_metricas():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metricas.exponer_todo(), media_type=metricas.TIPO_CONTENIDO)
+
+# =============================
+# 🔬 PERFILADO (solo admin)
+# =============================
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def _es_admin(request: Request):
+    """Requiere la cabecera X-Admin-Token; sin ADMIN_TOKEN configurado todo queda deshabilitado"""
+    token = request.headers.get("x-admin-token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def _no_autorizado():
+    return JSONResponse({"ok": False, "error": "No autorizado"}, status_code=403)
+
+@app.get("/debug/perfil/cpu")
+async def perfil_cpu(request: Request, segundos: float = 10, intervalo_ms: float = 5):
+    """Perfil de CPU por muestreo en formato folded (flamegraph.pl / speedscope)"""
+    if not _es_admin(request):
+        return _no_autorizado()
+    try:
+        plegado = await asyncio.to_thread(perfilador.perfilar_cpu, segundos, max(intervalo_ms, 1) / 1000)
+    except RuntimeError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=409)
+    nombre = f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    return Response(
+        plegado,
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
+@app.get("/debug/perfil/bloqueos")
+async def perfil_bloqueos(request: Request):
+    """Últimos bloqueos del event loop con la pila que los causó"""
+    if not _es_admin(request):
+        return _no_autorizado()
+    return {
+        "umbral_ms": round(perfilador.UMBRAL_BLOQUEO * 1000),
+        "bloqueos": list(perfilador.bloqueos)
+    }
+
+@app.post("/debug/perfil/memoria/iniciar")
+async def perfil_memoria_iniciar(request: Request):
+    if not _es_admin(request):
+        return _no_autorizado()
+    await asyncio.to_thread(perfilador.iniciar_memoria)
+    return {"ok": True, "mensaje": "tracemalloc activo"}
+
+@app.get("/debug/perfil/memoria")
+async def perfil_memoria(request: Request, top: int = 25):
+    """Top de asignaciones y cambios desde el snapshot anterior"""
+    if not _es_admin(request):
+        return _no_autorizado()
+    resultado = await asyncio.to_thread(perfilador.snapshot_memoria, min(max(top, 1), 200))
+    if resultado is None:
+        return JSONResponse({"ok": False, "error": "tracemalloc no está activo"}, status_code=409)
+    return resultado
+
+@app.post("/debug/perfil/memoria/detener")
+async def perfil_memoria_detener(request: Request):
+    if not _es_admin(request):
+        return _no_autorizado()
+    perfilador.detener_memoria()
+    return {"ok": True, "mensaje": "tracemalloc detenido"}
+
 # =============================
 # 🔍 DEBUG
 # =============================
@@ -1101,13 +1576,11 @@ async def debug_contactos_estado():
         
         dirs_arch = []
         if os.path.exists(contactos.DIRECCIONES_FILE):
-            with open(contactos.DIRECCIONES_FILE, "r", encoding="utf-8") as f:
-                dirs_arch = json.load(f)
+            dirs_arch = codec_json.leer_archivo(contactos.DIRECCIONES_FILE)
         
         tels_arch = []
         if os.path.exists(contactos.TELEFONOS_FILE):
-            with open(contactos.TELEFONOS_FILE, "r", encoding="utf-8") as f:
-                tels_arch = json.load(f)
+            tels_arch = codec_json.leer_archivo(contactos.TELEFONOS_FILE)
         
         return {
             "timestamp": datetime.now().isoformat(),
@@ -1133,7 +1606,7 @@ async def debug_contactos_estado():
 async def progreso_imagenes():
 
     try:
-        productos = gh.cargar_productos_github()
+        productos = await asyncio.to_thread(gh.cargar_productos_github)
         total = len(productos)
         con_imagen = len([p for p in productos if p.get('imagen', {}).get('url_github')])
         sin_imagen = total - con_imagen
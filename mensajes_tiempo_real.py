@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+# =============================
+# ⚙️ Configuración
+# =============================
+MAX_EVENTOS_PENDIENTES = 100  # Por conexión; si el cliente no consume se descartan los más viejos
+INTERVALO_PING = 25  # Segundos entre comentarios keep-alive (evita que proxies corten la conexión)
+
+# =============================
+# 🧠 Estado global
+# =============================
+suscriptores: dict[str, set[asyncio.Queue]] = {}
+
+# =============================
+# 📡 Suscripciones
+# =============================
+
+def suscribir(usuario):
+    """Registra una nueva conexión para el usuario y devuelve su cola de eventos"""
+    cola = asyncio.Queue(maxsize=MAX_EVENTOS_PENDIENTES)
+    suscriptores.setdefault(usuario, set()).add(cola)
+    return cola
+
+
+def desuscribir(usuario, cola):
+    """Elimina la conexión del usuario"""
+    colas = suscriptores.get(usuario)
+    if not colas:
+        return
+    colas.discard(cola)
+    if not colas:
+        del suscriptores[usuario]
+
+
+def total_conexiones():
+    """Número de conexiones abiertas (todas las pestañas de todos los usuarios)"""
+    return sum(len(colas) for colas in suscriptores.values())
+
+
+def publicar(usuario, evento, datos, id_evento=None):
+    """Envía un evento a todas las conexiones abiertas del usuario (no bloquea)"""
+    if not usuario:
+        return
+    for cola in list(suscriptores.get(usuario, ())):
+        if cola.full():
+            try:
+                cola.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        cola.put_nowait((evento, datos, id_evento))
+
+
+# =============================
+# 🔧 Formato Server-Sent Events
+# =============================
+
+def formatear_evento(evento, datos, id_evento=None):
+    """Serializa un evento en formato text/event-stream"""
+    lineas = []
+    if id_evento is not None:
+        lineas.append(f"id: {id_evento}")
+    lineas.append(f"event: {evento}")
+    lineas.append(f"data: {json.dumps(datos, ensure_ascii=False)}")
+    return "\n".join(lineas) + "\n\n"
+
+
+async def flujo_eventos(usuario, request, eventos_iniciales=()):
+    """
+    Generador para StreamingResponse: primero envía los eventos iniciales
+    (evento, datos, id) y luego todo lo publicado para el usuario hasta
+    que se desconecte
+    """
+    cola = suscribir(usuario)
+    try:
+        for evento, datos, id_evento in eventos_iniciales:
+            yield formatear_evento(evento, datos, id_evento)
+
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                evento, datos, id_evento = await asyncio.wait_for(cola.get(), timeout=INTERVALO_PING)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield formatear_evento(evento, datos, id_evento)
+    finally:
+        desuscribir(usuario, cola)
@@ -0,0 +1,207 @@
+import time
+import threading
+from bisect import bisect_left
+
+# =============================
+# ⚙️ Configuración
+# =============================
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# =============================
+# 🧠 Registro global
+# =============================
+_registro: list = []
+_lock = threading.Lock()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# =============================
+# 📊 Tipos de métrica
+# =============================
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: dict[tuple, object] = {}
+        with _lock:
+            _registro.append(self)
+
+    def _clave(self, etiquetas):
+        return tuple(etiquetas.get(n, "") for n in self.etiquetas)
+
+    def _muestras(self):
+        """Lista de (sufijo, valores_etiquetas, etiqueta_extra, valor)"""
+        with _lock:
+            return [("", clave, None, valor) for clave, valor in self._valores.items()]
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for sufijo, clave, extra, valor in self._muestras():
+            lineas.append(f"{self.nombre}{sufijo}{_formatear_etiquetas(self.etiquetas, clave, extra)} {_numero(valor)}")
+        return "\n".join(lineas)
+
+
+class Contador(_Metrica):
+    """Valor que solo crece (peticiones, errores, imágenes procesadas)"""
+    tipo = "counter"
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with _lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+
+class Indicador(_Metrica):
+    """Valor que sube y baja. Con 'funcion' se calcula al momento de exponer."""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def fijar(self, valor, **etiquetas):
+        with _lock:
+            self._valores[self._clave(etiquetas)] = valor
+
+    def sumar(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with _lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def _muestras(self):
+        if self.funcion is None:
+            return super()._muestras()
+        try:
+            valor = self.funcion()
+        except Exception:
+            return []
+        if isinstance(valor, dict):
+            return [("", (k,) if not isinstance(k, tuple) else k, None, v) for k, v in valor.items()]
+        return [("", (), None, valor)]
+
+
+class Histograma(_Metrica):
+    """Distribución por buckets acumulativos (latencias)"""
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        indice = bisect_left(self.buckets, valor)
+        with _lock:
+            datos = self._valores.get(clave)
+            if datos is None:
+                # [conteos por bucket (no acumulados) + overflow, suma, total]
+                datos = self._valores[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            datos[0][indice] += 1
+            datos[1] += valor
+            datos[2] += 1
+
+    def _muestras(self):
+        with _lock:
+            copia = [(clave, list(d[0]), d[1], d[2]) for clave, d in self._valores.items()]
+        muestras = []
+        for clave, conteos, suma, total in copia:
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += n
+                muestras.append(("_bucket", clave, ("le", _numero(limite)), acumulado))
+            muestras.append(("_sum", clave, None, suma))
+            muestras.append(("_count", clave, None, total))
+        return muestras
+
+
+def exponer_todo():
+    """Texto en formato de exposición de Prometheus"""
+    with _lock:
+        metricas = list(_registro)
+    return "\n".join(m.exponer() for m in metricas) + "\n"
+
+
+# =============================
+# 📈 Métricas de la API
+# =============================
+PETICIONES = Contador("http_peticiones_total", "Peticiones HTTP atendidas", ("metodo", "ruta", "codigo"))
+DURACION = Histograma("http_duracion_segundos", "Latencia de peticiones HTTP", ("metodo", "ruta"))
+EN_CURSO = Indicador("http_en_curso", "Peticiones HTTP en curso")
+EN_CURSO.fijar(0)
+
+GITHUB_PETICIONES = Contador("github_peticiones_total", "Llamadas a la API de GitHub", ("operacion", "resultado"))
+GITHUB_DURACION = Histograma("github_duracion_segundos", "Latencia de llamadas a GitHub", ("operacion",))
+
+IMAGENES_PROCESADAS = Contador("imagenes_procesadas_total", "Productos procesados por el buscador de imágenes", ("resultado",))
+
+
+def registrar_github(operacion, inicio, resultado):
+    """Registra una llamada a GitHub iniciada en 'inicio' (time.perf_counter())"""
+    GITHUB_DURACION.observar(time.perf_counter() - inicio, operacion=operacion)
+    GITHUB_PETICIONES.incrementar(operacion=operacion, resultado=str(resultado))
+
+
+# =============================
+# 🧩 Middleware ASGI
+# =============================
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware): cuenta peticiones por
+    ruta/método/código y mide su latencia. La ruta se etiqueta con el nombre
+    del endpoint para no crear una serie por cada URL distinta.
+    """
+
+    def __init__(self, app, excluir=("/metrics",), sin_latencia=()):
+        self.app = app
+        self.excluir = set(excluir)
+        self.sin_latencia = set(sin_latencia)  # Endpoints de larga duración (SSE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluir:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        codigo = 500
+        EN_CURSO.sumar(1)
+
+        async def send_con_metricas(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_con_metricas)
+        finally:
+            EN_CURSO.sumar(-1)
+            endpoint = scope.get("endpoint")
+            ruta = getattr(endpoint, "__name__", type(endpoint).__name__) if endpoint else "sin_ruta"
+            metodo = scope["method"]
+            PETICIONES.incrementar(metodo=metodo, ruta=ruta, codigo=codigo)
+            if ruta not in self.sin_latencia:
+                DURACION.observar(time.perf_counter() - inicio, metodo=metodo, ruta=ruta)
@@ -0,0 +1,214 @@
+import os
+import gzip
+import time
+import asyncio
+import mimetypes
+import threading
+from email.utils import formatdate
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+import codec_json
+
+# brotli es opcional: si no está instalado solo se sirve gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# =============================
+# ⚙️ Configuración
+# =============================
+INTERVALO_REVISION = 2  # Segundos entre revisiones de mtime de un mismo archivo
+MAX_TAMANO_CACHE = 2 * 1024 * 1024  # Archivos más grandes se sirven sin caché
+MIN_TAMANO_COMPRIMIR = 1024
+CACHE_PAGINAS = "no-cache"  # El navegador revalida con ETag (304 sin cuerpo)
+CACHE_ESTATICOS = f"public, max-age={int(os.getenv('CACHE_ESTATICOS_SEGUNDOS', '600'))}"
+
+TIPOS_COMPRIMIBLES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# =============================
+# 🧠 Estado global
+# =============================
+# ruta -> {mtime, tamano, revisado, tipo, etag, modificado, variantes{codificacion: bytes}}
+_cache: dict[str, dict] = {}
+_lock = threading.Lock()
+
+# =============================
+# 🔧 Carga y compresión
+# =============================
+
+def _tipo_contenido(ruta):
+    tipo = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    if tipo.startswith("text/") or tipo in ("application/javascript", "application/json"):
+        tipo += "; charset=utf-8"
+    return tipo
+
+
+def _comprimir(cuerpo, tipo):
+    """Precalcula las variantes comprimidas (una sola vez por versión del archivo)"""
+    variantes = {"identity": cuerpo}
+    if len(cuerpo) < MIN_TAMANO_COMPRIMIR or not tipo.startswith(TIPOS_COMPRIMIBLES):
+        return variantes
+
+    gz = gzip.compress(cuerpo, compresslevel=9, mtime=0)
+    if len(gz) < len(cuerpo):
+        variantes["gzip"] = gz
+    if brotli:
+        br = brotli.compress(cuerpo, quality=11)
+        if len(br) < len(cuerpo):
+            variantes["br"] = br
+    return variantes
+
+
+def cargar(ruta):
+    """Lee el archivo si cambió desde la última vez (mtime/tamaño). None si no existe."""
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        with _lock:
+            _cache.pop(ruta, None)
+        return None
+
+    with _lock:
+        entrada = _cache.get(ruta)
+        if entrada and entrada["mtime"] == st.st_mtime_ns and entrada["tamano"] == st.st_size:
+            entrada["revisado"] = time.monotonic()
+            return entrada
+
+    if st.st_size > MAX_TAMANO_CACHE:
+        return None
+
+    with open(ruta, "rb") as f:
+        cuerpo = f.read()
+    tipo = _tipo_contenido(ruta)
+    entrada = {
+        "mtime": st.st_mtime_ns,
+        "tamano": st.st_size,
+        "revisado": time.monotonic(),
+        "tipo": tipo,
+        "etag": f"{codec_json.checksum(cuerpo)}-{len(cuerpo):x}",
+        "modificado": formatdate(st.st_mtime, usegmt=True),
+        "variantes": _comprimir(cuerpo, tipo),
+    }
+    with _lock:
+        _cache[ruta] = entrada
+    return entrada
+
+
+async def obtener(ruta):
+    """Entrada en caché sin tocar disco si se revisó hace poco; si no, revisa en un hilo"""
+    entrada = _cache.get(ruta)
+    if entrada and time.monotonic() - entrada["revisado"] < INTERVALO_REVISION:
+        return entrada
+    return await asyncio.to_thread(cargar, ruta)
+
+
+def invalidar(ruta=None):
+    """Descarta una ruta (o todas) de la caché"""
+    with _lock:
+        if ruta is None:
+            _cache.clear()
+        else:
+            _cache.pop(ruta, None)
+
+
+# =============================
+# 📤 Respuestas
+# =============================
+
+def _acepta(accept_encoding, codificacion):
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if nombre.strip().lower() != codificacion:
+            continue
+        parametros = parametros.replace(" ", "")
+        if parametros.startswith("q="):
+            try:
+                return float(parametros[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def _elegir_variante(entrada, accept_encoding):
+    variantes = entrada["variantes"]
+    for codificacion in ("br", "gzip"):
+        if codificacion in variantes and _acepta(accept_encoding, codificacion):
+            return codificacion, variantes[codificacion]
+    return "identity", variantes["identity"]
+
+
+def _etag_coincide(if_none_match, entrada):
+    if not if_none_match:
+        return False
+    for etag in if_none_match.split(","):
+        etag = etag.strip()
+        if etag == "*":
+            return True
+        # Se compara la parte base: las variantes comprimidas comparten contenido
+        etag = etag.removeprefix("W/").strip('"')
+        if etag.split(".")[0] == entrada["etag"]:
+            return True
+    return False
+
+
+def construir_respuesta(entrada, headers_peticion, cache_control=CACHE_PAGINAS, headers_extra=None):
+    """Response con la mejor codificación aceptada, ETag y 304 si el cliente ya la tiene"""
+    codificacion, cuerpo = _elegir_variante(entrada, headers_peticion.get("accept-encoding", ""))
+    etag = entrada["etag"] if codificacion == "identity" else f"{entrada['etag']}.{codificacion}"
+    headers = {
+        "ETag": f'"{etag}"',
+        "Last-Modified": entrada["modificado"],
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if headers_extra:
+        headers.update(headers_extra)
+
+    if _etag_coincide(headers_peticion.get("if-none-match"), entrada):
+        return Response(status_code=304, headers=headers)
+
+    if codificacion != "identity":
+        headers["Content-Encoding"] = codificacion
+    return Response(cuerpo, media_type=entrada["tipo"], headers=headers)
+
+
+async def responder(request, ruta, cache_control=CACHE_PAGINAS, headers_extra=None):
+    """Sirve un archivo desde la caché; None si no existe"""
+    entrada = await obtener(ruta)
+    if entrada is None:
+        return None
+    return construir_respuesta(entrada, request.headers, cache_control, headers_extra)
+
+
+# =============================
+# 📁 /static con caché
+# =============================
+
+class StaticFilesCacheados(StaticFiles):
+    """StaticFiles que sirve desde memoria, precomprimido y con ETag"""
+
+    def __init__(self, *args, cache_control=CACHE_ESTATICOS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+        self._rutas: dict[str, str] = {}  # path pedido -> ruta ya validada por lookup_path
+
+    async def get_response(self, path, scope):
+        if scope["method"] in ("GET", "HEAD"):
+            ruta = self._rutas.get(path)
+            if ruta is None:
+                ruta, st = await asyncio.to_thread(self.lookup_path, path)
+                if st is not None and os.path.isfile(ruta):
+                    self._rutas[path] = ruta
+                else:
+                    ruta = None
+            if ruta:
+                entrada = await obtener(ruta)
+                if entrada is not None:
+                    return construir_respuesta(entrada, Headers(scope=scope), self.cache_control)
+                self._rutas.pop(path, None)
+        return await super().get_response(path, scope)
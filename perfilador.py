@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+
+import bitacora
+
+log = bitacora.obtener_logger("perfil")
+
+# =============================
+# ⚙️ Configuración
+# =============================
+UMBRAL_BLOQUEO = int(os.getenv("UMBRAL_BLOQUEO_MS", "250")) / 1000  # Loop sin responder más de esto = bloqueo
+INTERVALO_LATIDO = 0.05
+MAX_BLOQUEOS = 50
+MAX_SEGUNDOS_PERFIL = 60
+
+_lock_perfil = threading.Lock()  # Un solo perfil de CPU a la vez
+
+# =============================
+# 🔥 Perfil de CPU por muestreo
+# =============================
+
+def _pila_plegada(frame):
+    """Pila en formato 'folded' (raíz primero, separada por ';')"""
+    partes = []
+    while frame is not None:
+        codigo = frame.f_code
+        partes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+def perfilar_cpu(segundos=10, intervalo=0.005):
+    """
+    Muestrea las pilas de todos los hilos cada 'intervalo' durante 'segundos'.
+    Devuelve texto en formato folded (compatible con flamegraph.pl y speedscope).
+    """
+    segundos = max(0.1, min(float(segundos), MAX_SEGUNDOS_PERFIL))
+    if not _lock_perfil.acquire(blocking=False):
+        raise RuntimeError("Ya hay un perfil de CPU en curso")
+
+    try:
+        propio = threading.get_ident()
+        nombres = {t.ident: t.name for t in threading.enumerate()}
+        muestras = Counter()
+        fin = time.monotonic() + segundos
+        while time.monotonic() < fin:
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                hilo = nombres.get(ident) or f"hilo-{ident}"
+                muestras[f"{hilo};{_pila_plegada(frame)}"] += 1
+            time.sleep(intervalo)
+            if len(nombres) != threading.active_count():
+                nombres = {t.ident: t.name for t in threading.enumerate()}
+    finally:
+        _lock_perfil.release()
+
+    log.info("Perfil de CPU: %.1fs, %d pilas distintas", segundos, len(muestras))
+    return "".join(f"{pila} {n}\n" for pila, n in muestras.most_common())
+
+
+# =============================
+# ⏱️ Detector de bloqueos del event loop
+# =============================
+bloqueos: deque = deque(maxlen=MAX_BLOQUEOS)
+_vigilante = None
+
+
+class VigilanteLoop:
+    """
+    Una tarea del loop actualiza un latido; un hilo aparte revisa que el
+    latido avance. Si el loop no responde en UMBRAL_BLOQUEO se captura la
+    pila del hilo del loop: ahí está la llamada bloqueante.
+    """
+
+    def __init__(self, umbral=UMBRAL_BLOQUEO):
+        self.umbral = umbral
+        self.latido = time.monotonic()
+        self.hilo_loop = None
+        self._detener = threading.Event()
+        self._tarea = None
+
+    async def _latir(self):
+        while not self._detener.is_set():
+            self.latido = time.monotonic()
+            await asyncio.sleep(INTERVALO_LATIDO)
+
+    def _vigilar(self):
+        reportado = None
+        en_curso = None
+        while not self._detener.wait(INTERVALO_LATIDO):
+            latido = self.latido
+            if en_curso is not None and latido != reportado:
+                # El loop volvió a responder: duración total del bloqueo
+                en_curso["bloqueado_ms"] = round((latido - reportado) * 1000)
+                en_curso = None
+            retraso = time.monotonic() - latido
+            if retraso < self.umbral or reportado == latido:
+                continue
+            # Un reporte por bloqueo (hasta que el latido vuelva a avanzar)
+            reportado = latido
+            frame = sys._current_frames().get(self.hilo_loop)
+            pila = "".join(traceback.format_stack(frame)) if frame else ""
+            en_curso = {
+                "fecha": datetime.now().isoformat(),
+                "bloqueado_ms": round(retraso * 1000),
+                "pila": pila,
+            }
+            bloqueos.append(en_curso)
+            log.warning("Event loop bloqueado más de %.0f ms\n%s", retraso * 1000, pila)
+
+    def iniciar(self):
+        self.hilo_loop = threading.get_ident()
+        self._tarea = asyncio.get_running_loop().create_task(self._latir())
+        threading.Thread(target=self._vigilar, name="vigilante-loop", daemon=True).start()
+
+    def detener(self):
+        self._detener.set()
+        if self._tarea:
+            self._tarea.cancel()
+
+
+def iniciar_vigilante(umbral=UMBRAL_BLOQUEO):
+    """Inicia el detector de bloqueos (llamar desde el event loop)"""
+    global _vigilante
+    if _vigilante is None and umbral > 0:
+        _vigilante = VigilanteLoop(umbral)
+        _vigilante.iniciar()
+    return _vigilante
+
+
+def detener_vigilante():
+    global _vigilante
+    if _vigilante:
+        _vigilante.detener()
+        _vigilante = None
+
+
+# =============================
+# 🧠 Memoria (tracemalloc)
+# =============================
+_snapshot_anterior = None
+
+
+def iniciar_memoria(marcos=10):
+    """Activa tracemalloc (tiene costo: solo mientras se investiga)"""
+    global _snapshot_anterior
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(marcos)
+    _snapshot_anterior = tracemalloc.take_snapshot()
+
+
+def detener_memoria():
+    global _snapshot_anterior
+    _snapshot_anterior = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def snapshot_memoria(top=25, agrupar="lineno"):
+    """Top de asignaciones actuales y diferencia contra el snapshot anterior"""
+    global _snapshot_anterior
+    if not tracemalloc.is_tracing():
+        return None
+
+    actual = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    usado, pico = tracemalloc.get_traced_memory()
+    resultado = {
+        "usado_mb": round(usado / 1024 / 1024, 2),
+        "pico_mb": round(pico / 1024 / 1024, 2),
+        "top": [
+            {"ubicacion": str(s.traceback), "kb": round(s.size / 1024, 1), "bloques": s.count}
+            for s in actual.statistics(agrupar)[:top]
+        ],
+    }
+    if _snapshot_anterior is not None:
+        resultado["cambios"] = [
+            {"ubicacion": str(d.traceback), "kb_diferencia": round(d.size_diff / 1024, 1), "bloques_diferencia": d.count_diff}
+            for d in actual.compare_to(_snapshot_anterior, agrupar)[:top]
+        ]
+    _snapshot_anterior = actual
+    return resultado
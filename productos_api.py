@@ -1,7 +1,16 @@
 import os
 import json
+import math
+import time
 import threading
-from datetime import datetime
+from types import MappingProxyType
+
+import codec_json
+import escritura_segura
+import gestor_backups
+import bitacora
+
+log = bitacora.obtener_logger("productos")
 
 # =============================
 # 📁 Configuración de archivos
@@ -13,179 +22,365 @@ BACKUP_DIR = os.path.join(SCRIPT_DIR, "backups")
 # Crear directorio de backups si no existe
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+# Registro de cambios para sincronización incremental de los clientes
+MAX_VERSIONES_CAMBIOS = int(os.getenv("MAX_VERSIONES_CAMBIOS", "50"))
+MAX_PRODUCTOS_CAMBIOS = int(os.getenv("MAX_PRODUCTOS_CAMBIOS", "5000"))  # Suma de todas las versiones del registro
+
+# =============================
+# 📚 Versiones del catálogo
+# =============================
+
+class Cambio:
+    """Diferencia entre la versión 'base' y la versión 'numero'"""
+    __slots__ = ("base", "numero", "actualizados", "eliminados")
+
+    def __init__(self, base, numero, actualizados, eliminados):
+        self.base = base
+        self.numero = numero
+        self.actualizados = MappingProxyType(actualizados)  # Codigo -> producto nuevo o modificado
+        self.eliminados = tuple(eliminados)
+
+    def __len__(self):
+        return len(self.actualizados) + len(self.eliminados)
+
+
+class VersionCatalogo:
+    """
+    Foto inmutable del catálogo. Nunca se modifica después de publicarse:
+    cada cambio crea una versión nueva (copy-on-write) y la publica
+    reemplazando la referencia global. Quien obtiene una versión con
+    vigente() la recorre sin locks ni copias, y sigue siendo válida
+    mientras la tenga aunque ya se haya publicado otra.
+    
+    Los productos (dicts) tampoco se modifican en su lugar: para cambiar
+    uno se publica una versión con un dict nuevo (ver reemplazar_productos).
+    """
+    __slots__ = ("numero", "productos", "indice", "publicada", "cambios")
+
+    def __init__(self, numero, productos):
+        self.numero = numero
+        self.productos = tuple(productos)
+        self.indice = MappingProxyType({
+            p.get("Codigo"): p for p in self.productos if isinstance(p, dict) and p.get("Codigo")
+        })
+        self.publicada = time.time()
+        self.cambios = ()  # Registro de Cambio que termina en esta versión
+
+    def __len__(self):
+        return len(self.productos)
+
+    def __iter__(self):
+        return iter(self.productos)
+
+    def buscar(self, codigo):
+        return self.indice.get(codigo)
+
+
 # =============================
 # 🧠 Estado global
 # =============================
-productos_api = []
-lock = threading.RLock()  # Lock para evitar condiciones de carrera
+_vigente = VersionCatalogo(0, ())
+_lock_escritores = threading.Lock()  # Solo entre escritores: los lectores nunca lo toman
+_lock_guardado = threading.Lock()  # Serializa las escrituras a productos.json
+
+
+def vigente():
+    """Versión actual del catálogo (lectura sin lock ni copia)"""
+    return _vigente
+
+
+def siguiente_numero(minimo=0):
+    """
+    Número para la próxima versión: milisegundos desde epoch, siempre mayor
+    que la vigente y que 'minimo'. Así sigue creciendo entre reinicios y los
+    clientes pueden comparar versiones de distintos procesos.
+    """
+    return max(time.time_ns() // 1_000_000, _vigente.numero + 1, minimo + 1)
+
+
+def _diferencias(base, nueva):
+    """(actualizados, eliminados) entre dos versiones; None si son más de MAX_PRODUCTOS_CAMBIOS"""
+    anterior = base.indice
+    actualizados = {}
+    for codigo, producto in nueva.indice.items():
+        previo = anterior.get(codigo)
+        if previo is not producto and previo != producto:
+            actualizados[codigo] = producto
+            if len(actualizados) > MAX_PRODUCTOS_CAMBIOS:
+                return None
+    eliminados = [codigo for codigo in anterior if codigo not in nueva.indice]
+    if len(actualizados) + len(eliminados) > MAX_PRODUCTOS_CAMBIOS:
+        return None
+    return actualizados, eliminados
+
+
+def _encadenar(base, nueva, diferencias):
+    """Agrega la diferencia al registro (acotado por versiones y por productos)"""
+    if diferencias is None:
+        return ()  # Cambio demasiado grande: quien tenga una versión anterior descarga todo
+    cambios = base.cambios + (Cambio(base.numero, nueva.numero, *diferencias),)
+    total = sum(len(c) for c in cambios)
+    while cambios and (len(cambios) > MAX_VERSIONES_CAMBIOS or total > MAX_PRODUCTOS_CAMBIOS):
+        total -= len(cambios[0])
+        cambios = cambios[1:]
+    return cambios
+
+
+def publicar(productos, numero=None):
+    """
+    Publica 'productos' como la nueva versión vigente y la devuelve. Con
+    'numero' (versión decidida por otro worker) se ignora si no es más
+    nueva que la vigente.
+    """
+    global _vigente
+    with _lock_escritores:
+        base = _vigente
+        if numero is not None and numero <= base.numero:
+            return base
+        version = VersionCatalogo(numero or siguiente_numero(), productos if isinstance(productos, (list, tuple)) else ())
+        version.cambios = _encadenar(base, version, _diferencias(base, version))
+        _vigente = version  # Intercambio atómico de la referencia
+    log.debug("Catálogo v%d publicado: %d productos", version.numero, len(version))
+    return version
+
+
+def reemplazar_productos(cambios):
+    """
+    Publica una versión nueva a partir de la vigente con los productos de
+    'cambios' ({Codigo: producto nuevo}) en lugar de los anteriores. Se
+    hace bajo el lock de escritores para no perder cambios concurrentes.
+    """
+    global _vigente
+    with _lock_escritores:
+        base = _vigente
+        productos = [cambios.get(p.get("Codigo"), p) if isinstance(p, dict) else p for p in base.productos]
+        version = VersionCatalogo(siguiente_numero(), productos)
+        aplicados = {codigo: p for codigo, p in cambios.items() if codigo in base.indice}
+        version.cambios = _encadenar(base, version, (aplicados, ()))
+        _vigente = version
+    return version
+
+
+def cambios_desde(desde):
+    """
+    Cambios acumulados desde la versión 'desde' hasta la vigente:
+    (versión, {Codigo: producto}, eliminados). None si 'desde' no es una
+    versión publicada aquí con cambios encadenados hasta la vigente (registro
+    recortado, versión de antes de un reinicio o desconocida): el cliente
+    tiene que descargar el catálogo completo.
+    """
+    version = _vigente
+    if desde == version.numero:
+        return version, {}, ()
+    inicio = next((i for i, c in enumerate(version.cambios) if c.base == desde), None)
+    if inicio is None:
+        return None
+    pendientes = version.cambios[inicio:]
+    encadenados = all(a.numero == b.base for a, b in zip(pendientes, pendientes[1:]))
+    if not encadenados or pendientes[-1].numero != version.numero:
+        return None
+
+    actualizados = {}
+    eliminados = set()
+    for cambio in pendientes:
+        for codigo in cambio.eliminados:
+            actualizados.pop(codigo, None)
+            eliminados.add(codigo)
+        for codigo, producto in cambio.actualizados.items():
+            actualizados[codigo] = producto
+            eliminados.discard(codigo)
+    return version, actualizados, tuple(eliminados)
+
 
 # =============================
 # 📝 Funciones de persistencia
 # =============================
 
-def crear_backup():
-    """Crea un backup de productos.json antes de guardarlo"""
-    if os.path.exists(PRODUCTOS_FILE):
+def crear_backup(productos):
+    """
+    Punto de restauración de 'productos' (incremental y comprimido, ver
+    gestor_backups). Se crea siempre y antes de volver: es el catálogo que
+    se va a sobrescribir y no puede saltarse por el intervalo mínimo.
+    """
+    gestor_backups.respaldar("productos", list(productos), clave="Codigo", forzar=True)
+
+
+def _productos_en_disco():
+    """Lo guardado hoy en productos.json, o None si no hay o no se puede leer"""
+    if not os.path.exists(PRODUCTOS_FILE) or not os.path.getsize(PRODUCTOS_FILE):
+        return None
+    try:
+        datos = codec_json.leer_archivo(PRODUCTOS_FILE)
+        return datos if isinstance(datos, list) else None
+    except Exception as e:
+        log.warning("No se pudo leer productos.json para respaldarlo: %s", e)
+        return None
+
+
+def _leer_archivo():
+    if not os.path.exists(PRODUCTOS_FILE):
+        log.info("productos.json no existe - se creará en primer guardado")
+        return []
+    try:
+        tamano = os.path.getsize(PRODUCTOS_FILE)
+        if not tamano:
+            log.warning("productos.json vacío")
+            return []
+        
+        datos = codec_json.leer_archivo(PRODUCTOS_FILE)  # Verifica el checksum antes de parsear
+        productos = datos if isinstance(datos, list) else []
+        log.info("Cargados %d productos (%d bytes)", len(productos), tamano)
+        return productos
+        
+    except escritura_segura.ArchivoCorrupto as e:
+        log.error("productos.json dañado: %s", e)
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(BACKUP_DIR, f"productos_backup_{timestamp}.json")
-            
-            with open(PRODUCTOS_FILE, "r", encoding="utf-8") as f:
-                backup_data = f.read()
-            
-            with open(backup_path, "w", encoding="utf-8") as f:
-                f.write(backup_data)
-            
-            print(f"💾 Backup creado: {backup_path}")
+            productos = gestor_backups.restaurar("productos")
+            log.warning("Restaurados %d productos del último backup", len(productos))
+            return productos
         except Exception as e:
-            print(f"⚠️ Error creando backup: {e}")
+            log.error("No se pudo restaurar el backup de productos: %s", e)
+    except json.JSONDecodeError as e:
+        log.error("Error de JSON en productos.json: %s", e)
+    except Exception as e:
+        log.error("Error al cargar productos: %s", e)
+    return []
 
 
 def cargar_productos_api():
     """
     Carga los productos desde productos.json al iniciar la API
     """
-    global productos_api
-    
-    print(f"\n{'='*70}")
-    print(f"🔍 INICIANDO CARGA DE PRODUCTOS")
-    print(f"   Ruta buscada: {PRODUCTOS_FILE}")
-    print(f"   Existe: {os.path.exists(PRODUCTOS_FILE)}")
-    
-    with lock:
-        if os.path.exists(PRODUCTOS_FILE):
-            try:
-                with open(PRODUCTOS_FILE, "r", encoding="utf-8") as f:
-                    contenido = f.read()
-                    print(f"   Tamaño del archivo: {len(contenido)} bytes")
-                    
-                    if not contenido.strip():
-                        print(f"   ⚠️ Archivo vacío")
-                        productos_api = []
-                    else:
-                        datos = json.loads(contenido)
-                        productos_api = datos if isinstance(datos, list) else []
-                
-                print(f"✅ Cargados {len(productos_api)} productos")
-                if productos_api:
-                    print(f"   Primer producto: {productos_api[0].get('Codigo', 'N/A')} - {productos_api[0].get('Nombre', 'N/A')}")
-                    print(f"   Campos disponibles: {list(productos_api[0].keys())}")
-                
-            except json.JSONDecodeError as e:
-                print(f"❌ Error de JSON: {e}")
-                productos_api = []
-            except Exception as e:
-                print(f"❌ Error al cargar: {e}")
-                productos_api = []
-        else:
-            productos_api = []
-            print(f"⚠️ Archivo no existe - se creará en primer guardado")
-    
-    print(f"{'='*70}\n")
+    log.debug("Cargando productos desde %s", PRODUCTOS_FILE)
+    return publicar(_leer_archivo())
 
 
-def guardar_productos_api():
+def guardar_productos_api(anterior=None):
     """
-    Guarda la lista de productos en productos.json de forma SEGURA
+    Guarda la versión vigente en productos.json de forma SEGURA.
+    'anterior' es la versión que reemplaza (p. ej. antes de limpiar); sin
+    ella se respalda lo que hay en productos.json antes de sobrescribirlo.
     """
-    global productos_api
-    
-    print(f"\n{'='*70}")
-    print(f"💾 GUARDANDO PRODUCTOS")
-    print(f"   Total a guardar: {len(productos_api)}")
-    
-    with lock:
-        try:
-            # 1️⃣ Crear backup de lo anterior
-            crear_backup()
-            
-            # 2️⃣ Guardar a archivo temporal primero
-            temp_file = PRODUCTOS_FILE + ".tmp"
-            
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(productos_api, f, indent=2, ensure_ascii=False)
-            
-            print(f"   ✅ Escrito a archivo temporal")
-            
-            # 3️⃣ Verificar que el temporal se escribió correctamente
-            with open(temp_file, "r", encoding="utf-8") as f:
-                verificacion = json.load(f)
+    try:
+        with _lock_guardado:
+            version = _vigente
             
-            print(f"   ✅ Verificación de temporal OK ({len(verificacion)} items)")
+            # 1️⃣ Punto de restauración de lo anterior
+            previos = anterior.productos if anterior is not None else _productos_en_disco()
+            if previos and tuple(previos) != version.productos:
+                crear_backup(previos)
             
-            # 4️⃣ Reemplazar archivo original
-            if os.path.exists(PRODUCTOS_FILE):
-                os.remove(PRODUCTOS_FILE)
-            
-            os.rename(temp_file, PRODUCTOS_FILE)
-            print(f"   ✅ Archivo reemplazado exitosamente")
-            
-            # 5️⃣ Verificación final
-            with open(PRODUCTOS_FILE, "r", encoding="utf-8") as f:
-                verificacion_final = json.load(f)
-            
-            print(f"✅ GUARDADO EXITOSO: {len(verificacion_final)} productos en {PRODUCTOS_FILE}")
-            
-            # 6️⃣ Info del archivo
-            size_mb = os.path.getsize(PRODUCTOS_FILE) / (1024 * 1024)
-            print(f"   Tamaño: {size_mb:.2f} MB")
-            
-        except Exception as e:
-            print(f"❌ ERROR AL GUARDAR: {e}")
-            # Limpiar temporal si falló
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            raise
-    
-    print(f"{'='*70}\n")
+            # 2️⃣ Escritura atómica con checksum
+            contenido = codec_json.escribir_archivo(PRODUCTOS_FILE, version.productos, con_checksum=True)
+        
+        log.info("Guardados %d productos (v%d, %.2f MB)", len(version), version.numero, len(contenido) / (1024 * 1024))
+        
+    except Exception as e:
+        log.error("Error al guardar productos: %s", e)
+        raise
 
 
 def obtener_productos_api():
     """
-    Devuelve una COPIA de la lista de productos (thread-safe)
+    Productos de la versión vigente (tupla de solo lectura, sin copiar)
     """
-    with lock:
-        return productos_api.copy() if productos_api else []
+    return _vigente.productos
+
+
+# =============================
+# 🧾 Cotización de carritos
+# =============================
+
+def _a_numero(valor, defecto=0.0):
+    """float finito o 'defecto' (None, texto, inf y nan no son cantidades ni precios)"""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return defecto
+    return numero if math.isfinite(numero) else defecto
 
 
-def actualizar_productos_api(nueva_lista):
+def _agrupar_lineas(lineas):
     """
-    Actualiza la lista de productos de forma segura
+    Suma las cantidades de las líneas con el mismo Codigo (conserva el
+    orden y el primer Precio visto): la existencia se aplica al total del
+    producto, no a cada línea. Devuelve (líneas agrupadas, n inválidas):
+    las que no son dict o no tienen un Codigo de texto o número.
     """
-    global productos_api
-    
-    print(f"\n{'='*70}")
-    print(f"🔄 ACTUALIZANDO PRODUCTOS")
-    print(f"   Anterior: {len(productos_api)} items")
-    print(f"   Nuevo: {len(nueva_lista)} items")
-    
-    with lock:
-        productos_api = nueva_lista if isinstance(nueva_lista, list) else []
-        print(f"   ✅ Variable global actualizada")
-    
-    # Guardar inmediatamente
-    guardar_productos_api()
-    
-    print(f"{'='*70}\n")
+    agrupadas = {}
+    invalidas = 0
+    for linea in lineas or []:
+        codigo = linea.get("Codigo") if isinstance(linea, dict) else None
+        if not isinstance(codigo, (str, int)) or isinstance(codigo, bool):
+            invalidas += 1
+            continue
+        cantidad = max(0, int(_a_numero(linea.get("cantidad"), 1)))
+        actual = agrupadas.get(codigo)
+        if actual is None:
+            agrupadas[codigo] = actual = {"Codigo": codigo, "cantidad": 0}
+        actual["cantidad"] += cantidad
+        if "Precio" in linea and "Precio" not in actual:
+            actual["Precio"] = linea["Precio"]
+    return agrupadas.values(), invalidas
 
 
-def limpiar_productos():
-    """Limpia todos los productos y guarda"""
-    global productos_api
+def cotizar_carrito(lineas):
+    """
+    Valida un carrito completo contra el catálogo en una sola pasada:
+    precio vigente, cantidad acotada a la existencia y totales.
+    
+    lineas: [{Codigo, cantidad, Precio?}, ...] (Precio = el que vio el cliente)
+    Devuelve {lineas, total, articulos, ajustes, valido}; 'ajustes' lista
+    cada diferencia encontrada (invalida, no_existe, precio, existencia).
+    """
+    indice = _vigente.indice
+    agrupadas, invalidas = _agrupar_lineas(lineas)
+    
+    resultado = []
+    ajustes = [{"Codigo": None, "tipo": "invalida"} for _ in range(invalidas)]
+    total = 0.0
+    articulos = 0
     
-    with lock:
-        productos_api = []
+    for linea in agrupadas:
+        codigo = linea["Codigo"]
+        solicitada = linea["cantidad"]
+        producto = indice.get(codigo)
+        
+        if not producto:
+            ajustes.append({"Codigo": codigo, "tipo": "no_existe"})
+            continue
+        
+        precio = _a_numero(producto.get("Precio"))
+        existencia = max(0, int(_a_numero(producto.get("Existencia"))))
+        cantidad = min(solicitada, existencia)
+        
+        if "Precio" in linea and abs(_a_numero(linea.get("Precio")) - precio) > 0.005:
+            ajustes.append({"Codigo": codigo, "tipo": "precio", "anterior": linea.get("Precio"), "actual": precio})
+        if cantidad != solicitada:
+            ajustes.append({"Codigo": codigo, "tipo": "existencia", "solicitada": solicitada, "disponible": existencia})
+        
+        subtotal = round(precio * cantidad, 2)
+        total += subtotal
+        articulos += cantidad
+        resultado.append({
+            "Codigo": codigo,
+            "Nombre": producto.get("Nombre"),
+            "Precio": precio,
+            "Existencia": existencia,
+            "cantidad": cantidad,
+            "subtotal": subtotal
+        })
     
-    guardar_productos_api()
-    print(f"🗑️ Productos limpiados y guardados")
+    return {
+        "lineas": resultado,
+        "total": round(total, 2),
+        "articulos": articulos,
+        "ajustes": ajustes,
+        "valido": not ajustes
+    }
 
 
 # =============================
 # 🧹 Inicialización automática
 # =============================
-print(f"\n{'#'*70}")
-print(f"# MÓDULO productos_api INICIALIZADO")
-print(f"# Ruta: {SCRIPT_DIR}")
-print(f"# Archivo: {PRODUCTOS_FILE}")
-print(f"# Backups: {BACKUP_DIR}")
-print(f"{'#'*70}\n")
\ No newline at end of file
+log.debug("Módulo inicializado: archivo=%s backups=%s", PRODUCTOS_FILE, BACKUP_DIR)
\ No newline at end of file
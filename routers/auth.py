@@ -1,10 +1,16 @@
-# en tu main o nuevo archivo routers/auth.py
-from fastapi import FastAPI, HTTPException, Depends, Header
-from pydantic import BaseModel, EmailStr
-from auth_utils import hash_password, verify_password, create_token, decode_token
-import models_user
+# routers/auth.py (main.py lo incluye con app.include_router)
+import asyncio
+from typing import List, Optional
 
-app = FastAPI(...)  # ya tienes esto
+from fastapi import APIRouter, HTTPException, Depends, Header
+from pydantic import BaseModel, EmailStr, FiniteFloat
+from backend.auth_utils import (
+    hash_password_async, verify_password_async, create_token, decode_token, HashSaturado
+)
+from backend import models_user
+import productos_api as productos_module
+
+router = APIRouter()
 
 class RegistroRequest(BaseModel):
     nombre: str
@@ -15,22 +21,37 @@ class LoginRequest(BaseModel):
     correo: EmailStr
     password: str
 
-@app.post("/auth/registro")
+def _servicio_saturado():
+    return HTTPException(
+        status_code=503,
+        detail="Servicio ocupado, intenta de nuevo en unos segundos",
+        headers={"Retry-After": "2"}
+    )
+
+@router.post("/auth/registro")
 async def registro(req: RegistroRequest):
     if models_user.obtener_usuario(req.correo):
         raise HTTPException(status_code=400, detail="Correo ya registrado")
-    hashed = hash_password(req.password)
-    ok = models_user.crear_usuario(req.correo, req.nombre, hashed)
+    try:
+        hashed = await hash_password_async(req.password)
+    except HashSaturado:
+        raise _servicio_saturado()
+    # La escritura (lock entre workers + fsync) no corre en el event loop
+    ok = await asyncio.to_thread(models_user.crear_usuario, req.correo, req.nombre, hashed)
     if not ok:
         raise HTTPException(status_code=500, detail="No se pudo crear usuario")
     token = create_token({"correo": req.correo, "nombre": req.nombre})
     return {"token": token, "nombre": req.nombre}
 
-@app.post("/auth/login")
+@router.post("/auth/login")
 async def login(req: LoginRequest):
     u = models_user.obtener_usuario(req.correo)
-    if not u or not verify_password(req.password, u["password"]):
-        raise HTTPException(status_code=401, detail="Credenciales invlidas")
+    try:
+        valido = bool(u) and await verify_password_async(req.password, u["password"])
+    except HashSaturado:
+        raise _servicio_saturado()
+    if not valido:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
     token = create_token({"correo": req.correo, "nombre": u["nombre"]})
     return {"token": token, "nombre": u["nombre"]}
 
@@ -40,26 +61,62 @@ def get_current_user(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="Falta cabecera Authorization")
     parts = authorization.split()
     if len(parts) != 2 or parts[0].lower() != "bearer":
-        raise HTTPException(status_code=401, detail="Formato Authorization invlido")
+        raise HTTPException(status_code=401, detail="Formato Authorization inválido")
     payload = decode_token(parts[1])
     if not payload or "correo" not in payload:
-        raise HTTPException(status_code=401, detail="Token invlido")
+        raise HTTPException(status_code=401, detail="Token inválido")
     return payload
 
 # Endpoints para carrito persistente
-from typing import List, Any
-
-@app.get("/usuario/carrito")
+@router.get("/usuario/carrito")
 async def obtener_carrito_usuario(user=Depends(get_current_user)):
     correo = user["correo"]
-    carrito = models_user.obtener_carrito(correo)
+    carrito = await asyncio.to_thread(models_user.obtener_carrito, correo)
     return {"carrito": carrito}
 
-@app.post("/usuario/carrito")
+@router.post("/usuario/carrito")
 async def guardar_carrito_usuario(payload: dict, user=Depends(get_current_user)):
     # payload expected: { "carrito": [ {Codigo, Nombre, Precio, Existencia, cantidad}, ... ] }
     correo = user["correo"]
-    ok = models_user.guardar_carrito(correo, payload.get("carrito", []))
+    # Temporal + fsync + os.replace del archivo del carrito: fuera del event loop
+    ok = await asyncio.to_thread(models_user.guardar_carrito, correo, payload.get("carrito", []))
     if not ok:
         raise HTTPException(status_code=500, detail="No se pudo guardar carrito")
     return {"mensaje": "Carrito guardado"}
+
+@router.patch("/usuario/carrito")
+async def actualizar_linea_carrito_usuario(payload: dict, user=Depends(get_current_user)):
+    # payload expected: { "Codigo": "ABC", "cantidad": 2, ...campos opcionales }
+    # cantidad <= 0 elimina la línea
+    codigo = payload.get("Codigo")
+    if not codigo:
+        raise HTTPException(status_code=400, detail="Falta el campo 'Codigo'")
+    try:
+        cantidad = int(payload.get("cantidad", 1))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cantidad inválida")
+    datos = {k: v for k, v in payload.items() if k not in ("Codigo", "cantidad")}
+    carrito = await asyncio.to_thread(models_user.actualizar_linea_carrito, user["correo"], codigo, cantidad, datos)
+    if carrito is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return {"carrito": carrito}
+
+class LineaCotizacion(BaseModel):
+    Codigo: str
+    cantidad: FiniteFloat = 1  # inf / nan se rechazan con 422
+    Precio: Optional[FiniteFloat] = None  # El precio que vio el cliente
+
+class CotizarRequest(BaseModel):
+    carrito: Optional[List[LineaCotizacion]] = None
+
+@router.post("/usuario/carrito/cotizar")
+async def cotizar_carrito_usuario(req: Optional[CotizarRequest] = None, authorization: str = Header(None)):
+    # Con carrito se cotiza ese (no hace falta sesión: precios y existencias
+    # son públicos); sin carrito se cotiza el guardado del usuario del token
+    if req is not None and req.carrito is not None:
+        carrito = [linea.model_dump(exclude_none=True) for linea in req.carrito]
+    else:
+        carrito = await asyncio.to_thread(models_user.obtener_carrito, get_current_user(authorization)["correo"])
+    if not isinstance(carrito, list):
+        raise HTTPException(status_code=400, detail="El carrito debe ser una lista")
+    return productos_module.cotizar_carrito(carrito)
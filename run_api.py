@@ -1,12 +1,17 @@
 ﻿import uvicorn
 import os
 
+import coordinacion
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 10000))
 
+    # WEB_CONCURRENCY > 1: un proceso por núcleo; comparten estado por
+    # data/compartido (ver coordinacion.py)
     uvicorn.run(
         "main:app",
         host="0.0.0.0",  # Necesario para Render
         port=port,
+        workers=coordinacion.WORKERS,
         reload=False     # Render NO permite reload
     )
@@ -1,8 +1,10 @@
 ﻿// ======================
 // Variables
 // ======================
+// Requiere /static/rejilla-virtual.js (y opcionalmente catalogo-local.js)
 let productos = [];
 let productosFiltrados = [];
+const productosPorCodigo = new Map(); // Codigo -> producto
 let paginaActual = 0;
 const productosPorPagina = 12;
 
@@ -28,6 +30,7 @@ async function cargarProductos() {
         const res = await fetch("/producto");
         if (!res.ok) throw new Error("No hay productos disponibles");
         productos = await res.json();
+        indexarProductos();
         productosFiltrados = [...productos];
         paginaActual = 0;
         mostrarPagina();
@@ -37,42 +40,51 @@ async function cargarProductos() {
     }
 }
 
-// Mostrar productos en la página
-function mostrarPagina() {
-    contenedor.innerHTML = "";
-    if (!productosFiltrados || productosFiltrados.length === 0) {
-        contenedor.innerHTML = "<p style='text-align:center; font-weight:bold;'>No se encontraron productos</p>";
-        return;
-    }
+function indexarProductos() {
+    productosPorCodigo.clear();
+    productos.forEach(p => productosPorCodigo.set(p.Codigo, p));
+}
 
-    const inicio = paginaActual * productosPorPagina;
-    const fin = Math.min(inicio + productosPorPagina, productosFiltrados.length);
-    const lista = productosFiltrados.slice(inicio, fin);
-
-    lista.forEach(p => {
-        const card = document.createElement("div");
-        card.className = "producto-card";
-        card.innerHTML = `
-            <div><b>Código:</b> ${p.Codigo}</div>
-            <div><b>Nombre:</b> ${p.Nombre}</div>
-            <div><b>Precio:</b> $${p.Precio.toFixed(2)}</div>
+function escaparHTML(valor) {
+    return String(valor ?? "").replace(/[&<>"']/g, c => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" })[c]);
+}
+
+// 'i' es la posición en productosFiltrados: el Codigo conserva su tipo (texto o número)
+function tarjetaProducto(p, i) {
+    return `<div class="producto-card" data-i="${i}">
+            <div><b>Código:</b> ${escaparHTML(p.Codigo)}</div>
+            <div><b>Nombre:</b> ${escaparHTML(p.Nombre)}</div>
+            <div><b>Precio:</b> $${Number(p.Precio).toFixed(2)}</div>
             <div><b>Existencia:</b> ${p.Existencia}</div>
             <button class="btn-agregar">Agregar al carrito</button>
-        `;
-        contenedor.appendChild(card);
+        </div>`;
+}
 
-        // Evento seguro
-        card.querySelector(".btn-agregar").addEventListener("click", () => {
-            agregarAlCarrito(p.Codigo);
-        });
-    });
+// Solo se pintan las tarjetas visibles; la posición define la "página"
+const rejilla = new RejillaVirtual(contenedor, {
+    tarjeta: tarjetaProducto,
+    alCambiar: primero => {
+        const ultimo = Math.min(productosFiltrados.length - 1, primero + rejilla.columnas() - 1);
+        paginaActual = Math.max(0, Math.floor(ultimo / productosPorPagina));
+    }
+});
+
+// Mostrar productos en la página
+function mostrarPagina(opciones) {
+    rejilla.mostrar(productosFiltrados, opciones);
+}
+
+function irAPagina(pagina) {
+    const ultima = Math.max(0, Math.ceil(productosFiltrados.length / productosPorPagina) - 1);
+    paginaActual = Math.min(Math.max(0, pagina), ultima);
+    rejilla.irA(paginaActual * productosPorPagina);
 }
 
 // ======================
 // Carrito
 // ======================
 function agregarAlCarrito(codigo) {
-    const producto = productos.find(p => p.Codigo === codigo);
+    const producto = productosPorCodigo.get(codigo);
     if (!producto) return;
 
     const existente = carrito.find(p => p.Codigo === codigo);
@@ -149,22 +161,50 @@ carritoIcon.addEventListener("click", () => {
 });
 cerrarCarritoBtn.addEventListener("click", cerrarCarrito);
 
+// Agregar al carrito: un solo listener para todas las tarjetas
+contenedor.addEventListener("click", e => {
+    const boton = e.target.closest(".btn-agregar");
+    if (!boton) return;
+    const producto = productosFiltrados[Number(boton.closest(".producto-card").dataset.i)];
+    if (producto) agregarAlCarrito(producto.Codigo);
+});
+
 // Paginación
-document.getElementById("inicio").addEventListener("click", () => { paginaActual = 0; mostrarPagina(); });
-document.getElementById("atras").addEventListener("click", () => { if (paginaActual > 0) paginaActual--; mostrarPagina(); });
-document.getElementById("siguiente").addEventListener("click", () => { if ((paginaActual + 1) * productosPorPagina < productosFiltrados.length) paginaActual++; mostrarPagina(); });
+document.getElementById("inicio").addEventListener("click", () => irAPagina(0));
+document.getElementById("atras").addEventListener("click", () => irAPagina(paginaActual - 1));
+document.getElementById("siguiente").addEventListener("click", () => irAPagina(paginaActual + 1));
 
 // Búsqueda
-function filtrarProductos() {
+function aplicarFiltro() {
     const filtro = busquedaInput.value.toLowerCase();
     productosFiltrados = productos.filter(p =>
-        (p.Codigo || "").toLowerCase().includes(filtro) ||
-        (p.Nombre || "").toLowerCase().includes(filtro)
+        String(p.Codigo ?? "").toLowerCase().includes(filtro) ||
+        String(p.Nombre ?? "").toLowerCase().includes(filtro)
     );
+}
+
+function filtrarProductos() {
+    aplicarFiltro();
     paginaActual = 0;
     mostrarPagina();
 }
 
+// Cambios del catálogo bajados por el service worker (catalogo-local.js)
+async function refrescarProductos() {
+    try {
+        const res = await fetch("/producto");
+        if (!res.ok) return;
+        const datos = await res.json();
+        if (!Array.isArray(datos)) return;
+        productos = datos;
+        indexarProductos();
+        aplicarFiltro();
+        mostrarPagina({ conservarScroll: true });
+    } catch (err) {
+        console.warn("No se pudo refrescar el catálogo:", err.message);
+    }
+}
+
 btnBuscar.addEventListener("click", filtrarProductos);
 busquedaInput.addEventListener("keypress", e => {
     if (e.key === "Enter") filtrarProductos();
@@ -174,3 +214,4 @@ busquedaInput.addEventListener("keypress", e => {
 // Inicializar
 // ======================
 cargarProductos();
+if (typeof CatalogoLocal !== "undefined") CatalogoLocal.alActualizar(refrescarProductos);
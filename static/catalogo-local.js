@@ -0,0 +1,24 @@
+// ======================
+// Catálogo local (service worker)
+// ======================
+// Registra /sw.js, que guarda el catálogo en IndexedDB y responde /producto
+// desde ahí. Cuando el service worker baja cambios del servidor avisa con
+// un mensaje; la página vuelve a pedir /producto (ya sin ir a la red).
+const CatalogoLocal = {
+    registrar() {
+        if (!("serviceWorker" in navigator)) return false;
+        navigator.serviceWorker.register("/sw.js").catch(err => {
+            console.warn("Service worker no registrado:", err);
+        });
+        return true;
+    },
+
+    alActualizar(fn) {
+        if (!("serviceWorker" in navigator)) return;
+        navigator.serviceWorker.addEventListener("message", e => {
+            if (e.data && e.data.tipo === "catalogo-actualizado") fn(e.data.version);
+        });
+    },
+};
+
+CatalogoLocal.registrar();
@@ -0,0 +1,54 @@
+// ======================
+// Mensajes del chat por cursor
+// ======================
+// /api/mensajes/recibir devuelve en X-Cursor el último seq entregado y con
+// ?since=<cursor> solo los mensajes posteriores. Aquí se guarda ese cursor
+// (y los ids ya entregados): cada refresco o evento "mensaje" pide solo lo
+// nuevo para agregarlo al final, sin volver a bajar todo el historial.
+//
+//   const chat = new MensajesChat(() => usuario.correo);
+//   chat.reiniciar();                    // Al cambiar de conversación
+//   const nuevos = await chat.nuevos();  // Mensajes no entregados, en orden
+class MensajesChat {
+    constructor(correo) {
+        this.correo = correo;  // fn() -> correo del usuario actual
+        this.generacion = 0;
+        this.reiniciar();
+    }
+
+    reiniciar() {
+        this.cursor = 0;
+        this.vistos = new Set();
+        this.cola = Promise.resolve();
+        this.generacion++;  // Las consultas en curso de antes se descartan
+    }
+
+    nuevos() {
+        // Una consulta a la vez: la siguiente sale con el cursor ya avanzado
+        const generacion = this.generacion;
+        const consulta = this.cola.then(() => this._traer(generacion));
+        this.cola = consulta.catch(() => null);
+        return consulta;
+    }
+
+    async _traer(generacion) {
+        const nuevos = [];
+        let hayMas = true;
+        while (hayMas && generacion === this.generacion) {
+            const res = await fetch(`/api/mensajes/recibir?usuario=${encodeURIComponent(this.correo())}&since=${this.cursor}`);
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            const lote = await res.json();
+            if (generacion !== this.generacion) break;
+
+            this.cursor = parseInt(res.headers.get("X-Cursor")) || this.cursor;
+            hayMas = res.headers.get("X-Hay-Mas") === "1";
+            for (const m of lote) {
+                const id = m.id ?? m.seq;
+                if (this.vistos.has(id)) continue;
+                this.vistos.add(id);
+                nuevos.push(m);
+            }
+        }
+        return generacion === this.generacion ? nuevos : [];
+    }
+}
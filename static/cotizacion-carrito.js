@@ -0,0 +1,57 @@
+// ======================
+// Cotización del carrito en el servidor
+// ======================
+// Antes de cerrar la compra el carrito local se valida contra el catálogo
+// vigente (POST /usuario/carrito/cotizar): precio actual, cantidad acotada
+// a la existencia y productos que ya no existen.
+//
+//   const revisado = await CotizacionCarrito.revisar(carrito);
+//   if (revisado) { carrito = revisado.carrito; ...; CotizacionCarrito.mostrarAviso(div, revisado.aviso); }
+const CotizacionCarrito = {
+    async revisar(carrito) {
+        if (!carrito.length) return null;
+        try {
+            const res = await fetch("/usuario/carrito/cotizar", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({
+                    carrito: carrito.map(p => ({ Codigo: String(p.Codigo), cantidad: p.cantidad, Precio: p.Precio })),
+                }),
+            });
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            const cotizacion = await res.json();
+            return { carrito: this.aplicar(carrito, cotizacion), aviso: this.describir(carrito, cotizacion.ajustes) };
+        } catch (err) {
+            console.warn("No se pudo cotizar el carrito:", err);
+            return null;
+        }
+    },
+
+    aplicar(carrito, cotizacion) {
+        // Conserva los datos locales de cada línea (imagen, etc.) con precio y cantidad del servidor
+        const locales = new Map(carrito.map(p => [String(p.Codigo), p]));
+        return cotizacion.lineas
+            .filter(l => l.cantidad > 0)
+            .map(l => ({ ...locales.get(String(l.Codigo)), Precio: l.Precio, Existencia: l.Existencia, cantidad: l.cantidad }));
+    },
+
+    describir(carrito, ajustes) {
+        const nombres = new Map(carrito.map(p => [String(p.Codigo), p.Nombre || p.Codigo]));
+        return ajustes.map(a => {
+            const nombre = nombres.get(String(a.Codigo)) || "Un producto";
+            if (a.tipo === "no_existe") return `${nombre} ya no está disponible`;
+            if (a.tipo === "precio") return `${nombre} cambió de precio a $${Number(a.actual).toFixed(2)}`;
+            if (a.tipo === "existencia") return `${nombre}: solo hay ${a.disponible} en existencia`;
+            return null;
+        }).filter(Boolean).join(". ");
+    },
+
+    mostrarAviso(contenedor, aviso) {
+        if (!aviso) return;
+        const p = document.createElement("p");
+        p.className = "carrito-aviso";
+        p.style.color = "#c0392b";
+        p.textContent = `⚠️ ${aviso}`;
+        contenedor.prepend(p);
+    },
+};
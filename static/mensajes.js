@@ -16,12 +16,16 @@ async function enviarMensaje(tipo, mensaje) {
     console.log(data);
 }
 
-// Funcin para recibir mensajes del admin
+// ltimo mensaje recibido (cabecera X-Cursor): cada consulta trae solo los posteriores
+let cursorMensajes = 0;
+
+// Funcin para recibir mensajes del admin (solo los nuevos, se agregan al final)
 async function recibirMensajes() {
-    const response = await fetch(`/api/mensajes/recibir?usuario=${usuario.correo}`);
+    const response = await fetch(`/api/mensajes/recibir?usuario=${encodeURIComponent(usuario.correo)}&since=${cursorMensajes}`);
+    if (!response.ok) return;
     const mensajes = await response.json();
+    cursorMensajes = parseInt(response.headers.get('X-Cursor')) || cursorMensajes;
     const contenedor = document.getElementById('mensajes');
-    contenedor.innerHTML = '';
     mensajes.forEach(m => {
         const div = document.createElement('div');
         div.classList.add('mensaje-admin');
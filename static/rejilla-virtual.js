@@ -0,0 +1,181 @@
+// ======================
+// Rejilla virtual de productos
+// ======================
+// Solo existen en el DOM las filas visibles (más unas de margen); el resto
+// del alto lo ocupan dos espaciadores. Así el costo de pintar no depende
+// del tamaño del catálogo. El contenedor conserva su CSS grid: las columnas
+// se leen de grid-template-columns y el alto de fila se mide en la página.
+//
+//   const rejilla = new RejillaVirtual(contenedor, { tarjeta: (p, i) => "<div ...>" });
+//   rejilla.mostrar(lista);
+//
+// Las imágenes van como <img data-src> y se cargan al acercarse al viewport.
+class RejillaVirtual {
+    constructor(contenedor, { tarjeta, filasExtra = 4, vacio = "No se encontraron productos", alCambiar = null }) {
+        this.contenedor = contenedor;
+        this.tarjeta = tarjeta;
+        this.filasExtra = filasExtra;
+        this.vacio = vacio;
+        this.alCambiar = alCambiar;  // fn(primerIndiceVisible)
+        this.lista = [];
+        this.altoFila = 0;
+        this.a = 0;  // Rango pintado [a, b)
+        this.b = 0;
+        this.pendiente = false;
+        this.plantilla = document.createElement("template");
+
+        this.imagenes = "IntersectionObserver" in window ?
+            new IntersectionObserver(entradas => entradas.forEach(e => {
+                if (!e.isIntersecting) return;
+                this.imagenes.unobserve(e.target);
+                e.target.src = e.target.dataset.src;
+            }), { rootMargin: "300px 0px" }) :
+            null;
+
+        const programar = () => {
+            if (this.pendiente) return;
+            this.pendiente = true;
+            requestAnimationFrame(() => {
+                this.pendiente = false;
+                this.actualizar();
+            });
+        };
+        window.addEventListener("scroll", programar, { passive: true });
+        window.addEventListener("resize", () => {
+            this.altoFila = 0;  // Cambian columnas y alto: volver a medir
+            programar();
+        });
+    }
+
+    mostrar(lista, { conservarScroll = false } = {}) {
+        this.lista = lista || [];
+        this.a = this.b = 0;
+        this.altoFila = 0;
+        this.contenedor.innerHTML = "";
+        if (!this.lista.length) {
+            this.contenedor.innerHTML = `<p style='grid-column:1/-1; text-align:center; font-weight:bold;'>${this.vacio}</p>`;
+            return;
+        }
+        this.arriba = this._espaciador();
+        this.abajo = this._espaciador();
+        this.contenedor.append(this.arriba, this.abajo);
+        // Una búsqueda nueva vuelve al inicio de la lista si ya se había bajado
+        if (!conservarScroll && this.contenedor.getBoundingClientRect().top < this._margenSuperior()) this.irA(0);
+        this.actualizar();
+    }
+
+    irA(indice) {
+        const fila = Math.floor(Math.max(0, indice) / this.columnas());
+        const top = this.contenedor.getBoundingClientRect().top + window.scrollY;
+        window.scrollTo(0, Math.max(0, top - this._margenSuperior() + fila * (this.altoFila || 0)));
+        this.actualizar();
+    }
+
+    _margenSuperior() {
+        // Un encabezado fijo (sticky) tapa el inicio del contenedor
+        const encabezado = document.querySelector("header");
+        return encabezado && getComputedStyle(encabezado).position === "sticky" ? encabezado.offsetHeight : 0;
+    }
+
+    primerVisible() {
+        // Índice del primer producto de la primera fila que se ve bajo el encabezado
+        if (!this.altoFila) return 0;
+        const top = this.contenedor.getBoundingClientRect().top - this._margenSuperior();
+        return Math.min(this.lista.length - 1, Math.max(0, Math.floor((1 - top) / this.altoFila)) * this.columnas());
+    }
+
+    columnas() {
+        const columnas = getComputedStyle(this.contenedor).gridTemplateColumns.split(" ").filter(Boolean).length;
+        return Math.max(1, columnas);
+    }
+
+    actualizar() {
+        const n = this.lista.length;
+        if (!n || !this.arriba) return;
+        const columnas = this.columnas();
+        const filas = Math.ceil(n / columnas);
+
+        if (!this.altoFila) {
+            // Pintar unas filas para medir; luego se calcula el rango real
+            this._pintar(0, Math.min(n, columnas * 3), columnas, filas);
+            this.altoFila = this._medir(columnas);
+            if (!this.altoFila) return;
+        }
+
+        const top = this.contenedor.getBoundingClientRect().top;
+        const desde = Math.max(0, Math.floor(-top / this.altoFila) - this.filasExtra);
+        const hasta = Math.min(filas, Math.ceil((window.innerHeight - top) / this.altoFila) + this.filasExtra);
+        this._pintar(Math.min(desde, hasta) * columnas, Math.min(n, Math.max(desde, hasta) * columnas), columnas, filas);
+        if (this.alCambiar) this.alCambiar(this.primerVisible());
+    }
+
+    _espaciador() {
+        const div = document.createElement("div");
+        div.style.gridColumn = "1 / -1";
+        div.style.display = "none";
+        return div;
+    }
+
+    _medir(columnas) {
+        const tarjetas = this._tarjetas();
+        if (!tarjetas.length) return 0;
+        const filas = Math.ceil(tarjetas.length / columnas);
+        if (filas < 2) {
+            const hueco = parseFloat(getComputedStyle(this.contenedor).rowGap) || 0;
+            return tarjetas[0].offsetHeight + hueco;
+        }
+        const primera = tarjetas[0].offsetTop;
+        const ultima = tarjetas[(filas - 1) * columnas].offsetTop;
+        return (ultima - primera) / (filas - 1);
+    }
+
+    _tarjetas() {
+        const tarjetas = [];
+        for (let el = this.arriba.nextElementSibling; el && el !== this.abajo; el = el.nextElementSibling) tarjetas.push(el);
+        return tarjetas;
+    }
+
+    _crear(desde, hasta) {
+        let html = "";
+        for (let i = desde; i < hasta; i++) html += this.tarjeta(this.lista[i], i);
+        this.plantilla.innerHTML = html;
+        const fragmento = document.importNode(this.plantilla.content, true);
+        fragmento.querySelectorAll("img[data-src]").forEach(img => {
+            if (this.imagenes) this.imagenes.observe(img);
+            else img.src = img.dataset.src;
+        });
+        return fragmento;
+    }
+
+    _quitar(el) {
+        if (this.imagenes) el.querySelectorAll("img[data-src]").forEach(img => this.imagenes.unobserve(img));
+        el.remove();
+    }
+
+    _pintar(a, b, columnas, filas) {
+        if (a === this.a && b === this.b) return;
+        if (a >= this.b || b <= this.a || this.a === this.b) {
+            this._tarjetas().forEach(el => this._quitar(el));
+            this.abajo.before(this._crear(a, b));
+        } else {
+            // Reutilizar las tarjetas que siguen visibles: solo se agregan/quitan bordes
+            for (; this.a < a; this.a++) this._quitar(this.arriba.nextElementSibling);
+            for (; this.b > b; this.b--) this._quitar(this.abajo.previousElementSibling);
+            if (a < this.a) this.arriba.after(this._crear(a, this.a));
+            if (b > this.b) this.abajo.before(this._crear(this.b, b));
+        }
+        this.a = a;
+        this.b = b;
+
+        const hueco = parseFloat(getComputedStyle(this.contenedor).rowGap) || 0;
+        const filasArriba = a / columnas;
+        const filasAbajo = filas - Math.ceil(b / columnas);
+        this._ajustar(this.arriba, filasArriba * this.altoFila - hueco);
+        this._ajustar(this.abajo, filasAbajo * this.altoFila - hueco);
+    }
+
+    _ajustar(espaciador, alto) {
+        espaciador.style.display = alto > 0 ? "" : "none";
+        espaciador.style.height = `${Math.max(0, alto)}px`;
+    }
+}
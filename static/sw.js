@@ -0,0 +1,209 @@
+// ======================
+// Service worker de la tienda
+// ======================
+// - /producto se responde desde IndexedDB (al instante, también sin red) y
+//   en segundo plano se pide al servidor solo lo que cambió desde la versión
+//   guardada (/api/productos/cambios). Si hubo cambios se avisa a las páginas.
+// - Páginas: red primero, copia en caché si no hay conexión.
+// - /static: se sirve la copia en caché y se actualiza en segundo plano.
+// Todo lo demás (API, login, mensajes) pasa directo a la red.
+
+const CACHE_PAGINAS = "ferre-paginas-v1";
+const PAGINAS = ["/", "/mobile", "/desktop"];
+const DB_NOMBRE = "ferre-calvillito";
+const DB_STORE = "catalogo";
+const CLAVE_CATALOGO = "actual";
+const MIN_ENTRE_SINCRONIZACIONES = 5000;  // ms: recargas seguidas no repiten la consulta
+
+self.addEventListener("install", () => self.skipWaiting());
+
+self.addEventListener("activate", event => {
+    event.waitUntil((async () => {
+        const nombres = await caches.keys();
+        await Promise.all(nombres.filter(n => n.startsWith("ferre-") && n !== CACHE_PAGINAS).map(n => caches.delete(n)));
+        await self.clients.claim();
+        // Primera instalación: dejar el catálogo listo para la próxima visita
+        if (!(await leerCatalogo())) await descargarCompleto(null).catch(() => null);
+    })());
+});
+
+self.addEventListener("fetch", event => {
+    const peticion = event.request;
+    if (peticion.method !== "GET") return;
+    const url = new URL(peticion.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname === "/producto") {
+        event.respondWith(responderCatalogo(event));
+    } else if (peticion.mode === "navigate" && PAGINAS.includes(url.pathname)) {
+        event.respondWith(redPrimero(peticion));
+    } else if (url.pathname.startsWith("/static/")) {
+        event.respondWith(cachePrimero(event));
+    }
+});
+
+// ======================
+// IndexedDB
+// ======================
+let db = null;
+
+function abrirDB() {
+    if (db) return db;
+    db = new Promise((resolve, reject) => {
+        const req = indexedDB.open(DB_NOMBRE, 1);
+        req.onupgradeneeded = () => req.result.createObjectStore(DB_STORE);
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => { db = null; reject(req.error); };
+    });
+    return db;
+}
+
+async function leerCatalogo() {
+    try {
+        const conexion = await abrirDB();
+        return await new Promise((resolve, reject) => {
+            const req = conexion.transaction(DB_STORE).objectStore(DB_STORE).get(CLAVE_CATALOGO);
+            req.onsuccess = () => resolve(req.result || null);
+            req.onerror = () => reject(req.error);
+        });
+    } catch (err) {
+        console.warn("No se pudo leer el catálogo local:", err);
+        return null;
+    }
+}
+
+async function guardarCatalogo(catalogo) {
+    try {
+        const conexion = await abrirDB();
+        await new Promise((resolve, reject) => {
+            const tx = conexion.transaction(DB_STORE, "readwrite");
+            tx.objectStore(DB_STORE).put(catalogo, CLAVE_CATALOGO);
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+        });
+    } catch (err) {
+        console.warn("No se pudo guardar el catálogo local:", err);
+    }
+}
+
+// ======================
+// Catálogo
+// ======================
+let sincronizando = null;  // Una sola sincronización a la vez
+let ultimaSincronizacion = 0;
+
+function respuestaCatalogo(catalogo) {
+    return new Response(JSON.stringify(catalogo.productos), {
+        headers: {
+            "Content-Type": "application/json; charset=utf-8",
+            "X-Catalogo-Version": String(catalogo.version || 0),
+            "X-Catalogo-Origen": "local",
+        },
+    });
+}
+
+async function descargarCompleto(anterior) {
+    const headers = anterior && anterior.etag ? { "If-None-Match": anterior.etag } : {};
+    const res = await fetch("/producto", { headers, cache: "no-store" });
+    if (res.status === 304) return anterior;
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const productos = await res.json();
+    const catalogo = {
+        version: parseInt(res.headers.get("X-Catalogo-Version")) || 0,
+        etag: res.headers.get("ETag"),
+        productos: Array.isArray(productos) ? productos : [],
+        guardado: Date.now(),
+    };
+    await guardarCatalogo(catalogo);
+    return catalogo;
+}
+
+function aplicarCambios(catalogo, cambios) {
+    const porCodigo = new Map(catalogo.productos.map(p => [p.Codigo, p]));
+    cambios.eliminados.forEach(codigo => porCodigo.delete(codigo));
+    cambios.actualizados.forEach(p => porCodigo.set(p.Codigo, p));
+    return {
+        version: cambios.version,
+        etag: null,  // El ETag corresponde a la descarga completa anterior
+        productos: [...porCodigo.values()],
+        guardado: Date.now(),
+    };
+}
+
+async function sincronizar(local) {
+    const res = await fetch(`/api/productos/cambios?desde=${local.version || 0}`, { cache: "no-store" });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const cambios = await res.json();
+
+    if (cambios.resync) {
+        const catalogo = await descargarCompleto(local);
+        return catalogo !== local ? catalogo : null;
+    }
+    if (!cambios.actualizados.length && !cambios.eliminados.length) {
+        if (cambios.version !== local.version) await guardarCatalogo({ ...local, version: cambios.version });
+        return null;
+    }
+    const catalogo = aplicarCambios(local, cambios);
+    await guardarCatalogo(catalogo);
+    return catalogo;
+}
+
+function sincronizarEnFondo(local) {
+    if (!sincronizando && Date.now() - ultimaSincronizacion > MIN_ENTRE_SINCRONIZACIONES) {
+        ultimaSincronizacion = Date.now();
+        sincronizando = sincronizar(local)
+            .then(async catalogo => {
+                if (!catalogo) return;
+                const paginas = await self.clients.matchAll({ type: "window" });
+                paginas.forEach(p => p.postMessage({ tipo: "catalogo-actualizado", version: catalogo.version }));
+            })
+            .catch(err => console.warn("Catálogo sin sincronizar (¿sin conexión?):", err.message))
+            .finally(() => { sincronizando = null; });
+    }
+    return sincronizando;
+}
+
+async function responderCatalogo(event) {
+    const local = await leerCatalogo();
+    if (local) {
+        // Mientras se sincroniza, la página ya pinta lo guardado
+        const pendiente = sincronizarEnFondo(local);
+        if (pendiente) event.waitUntil(pendiente);
+        return respuestaCatalogo(local);
+    }
+    try {
+        return respuestaCatalogo(await descargarCompleto(null));
+    } catch (err) {
+        return fetch(event.request);
+    }
+}
+
+// ======================
+// Páginas y estáticos
+// ======================
+async function redPrimero(peticion) {
+    const cache = await caches.open(CACHE_PAGINAS);
+    try {
+        const res = await fetch(peticion);
+        if (res.ok) cache.put(peticion, res.clone());
+        return res;
+    } catch (err) {
+        const copia = await cache.match(peticion);
+        if (copia) return copia;
+        throw err;
+    }
+}
+
+async function cachePrimero(event) {
+    const cache = await caches.open(CACHE_PAGINAS);
+    const copia = await cache.match(event.request);
+    const red = fetch(event.request).then(res => {
+        if (res.ok) cache.put(event.request, res.clone());
+        return res;
+    });
+    if (copia) {
+        event.waitUntil(red.catch(() => null));
+        return copia;
+    }
+    return red;
+}
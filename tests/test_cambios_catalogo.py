@@ -0,0 +1,52 @@
+import pytest
+
+import productos_api
+
+A = {"Codigo": "A", "Nombre": "Martillo"}
+B = {"Codigo": "B", "Nombre": "Clavos"}
+C = {"Codigo": "C", "Nombre": "Pinzas"}
+
+
+@pytest.fixture(autouse=True)
+def catalogo():
+    anterior = productos_api.vigente().productos
+    yield
+    productos_api.publicar(list(anterior))
+
+
+def test_cambios_encadenados_desde_una_version_publicada():
+    v1 = productos_api.publicar([A, B])
+    productos_api.publicar([A])
+    v3 = productos_api.publicar([A, C])
+    version, actualizados, eliminados = productos_api.cambios_desde(v1.numero)
+    assert version is v3
+    assert actualizados == {"C": C}
+    assert eliminados == ("B",)
+
+
+def test_version_al_dia_no_tiene_cambios():
+    v = productos_api.publicar([A])
+    assert productos_api.cambios_desde(v.numero) == (v, {}, ())
+
+
+@pytest.mark.parametrize("desplazamiento", [-1, 1, 500])
+def test_version_desconocida_pide_descarga_completa(desplazamiento):
+    # Versión que este proceso nunca publicó (p. ej. de antes de un reinicio)
+    base = productos_api.vigente().numero + 10_000
+    v1 = productos_api.publicar([A, B], numero=base)
+    productos_api.publicar([A], numero=base + 1000)
+    productos_api.publicar([A, C], numero=base + 2000)
+    assert productos_api.cambios_desde(v1.numero + desplazamiento) is None
+
+
+def test_version_mayor_que_la_vigente_pide_descarga_completa():
+    v = productos_api.publicar([A])
+    assert productos_api.cambios_desde(v.numero + 1) is None
+
+
+def test_cadena_rota_por_un_cambio_grande_pide_descarga_completa(monkeypatch):
+    monkeypatch.setattr(productos_api, "MAX_PRODUCTOS_CAMBIOS", 1)
+    v1 = productos_api.publicar([A])
+    productos_api.publicar([A, B, C])  # Demasiados cambios: se reinicia el registro
+    productos_api.publicar([A, B])
+    assert productos_api.cambios_desde(v1.numero) is None
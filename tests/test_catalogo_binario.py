@@ -0,0 +1,31 @@
+import catalogo_binario
+
+PRODUCTOS = [
+    {"Codigo": "A-1", "Nombre": "Martillo", "Precio": 120.5, "Existencia": 3,
+     "imagen": {"existe": True, "url_github": "https://x/a.jpg", "fuente": "github"}},
+    {"Codigo": None, "Nombre": None, "Precio": None, "Existencia": None, "imagen": None},
+    {"Codigo": "B-2", "Nombre": "Llave ñandú 🔧", "Precio": 2**53 + 1, "Existencia": 2**63},
+    {"Codigo": "C-3", "Nombre": "Tornillo", "Precio": -(2**60), "Existencia": -(2**63), "Extra": {"a": [1]}},
+    {"Nombre": "Sin código", "Precio": 7, "imagen": {"existe": False, "url_github": None}},
+]
+
+
+def test_ida_y_vuelta_exacta(tmp_path):
+    ruta = str(tmp_path / "productos.fcat")
+    catalogo_binario.escribir(PRODUCTOS, ruta)
+    with catalogo_binario.abrir(ruta) as catalogo:
+        assert catalogo.a_lista() == PRODUCTOS
+        assert list(catalogo) == PRODUCTOS
+        assert catalogo.buscar("B-2") == PRODUCTOS[2]
+    for original, leido in zip(PRODUCTOS, catalogo_binario.cargar_si_vigente(ruta, str(tmp_path / "no-existe.json"))):
+        assert list(leido) == list(original)
+        assert type(leido.get("Precio")) is type(original.get("Precio"))
+
+
+def test_snapshot_ilegible_se_ignora(tmp_path):
+    ruta = tmp_path / "productos.fcat"
+    catalogo_binario.escribir(PRODUCTOS, str(ruta))
+    datos = bytearray(ruta.read_bytes())
+    datos[-40:] = b"\xff" * 40  # Cadenas dañadas: UTF-8 inválido
+    ruta.write_bytes(bytes(datos))
+    assert catalogo_binario.cargar_si_vigente(str(ruta), str(tmp_path / "no-existe.json")) is None
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import pytest
+
+import coordinacion
+
+fcntl = pytest.importorskip("fcntl")
+
+
+@pytest.fixture
+def diario(tmp_path, monkeypatch):
+    d = coordinacion.Diario(str(tmp_path / "diario.jsonl"))
+    monkeypatch.setattr(coordinacion, "_diario", d)
+    monkeypatch.setattr(coordinacion, "_manejadores", {})
+    yield d
+    d.cerrar()
+
+
+def test_seccion_exclusiva_no_frena_el_loop_mientras_espera_el_flock(diario):
+    otro_worker = open(diario._lock.name, "a+b")  # Otro proceso tendría su propio archivo abierto
+    fcntl.flock(otro_worker, fcntl.LOCK_EX)
+
+    async def correr():
+        coordinacion._loop = asyncio.get_running_loop()
+        seccion = asyncio.create_task(coordinacion.ejecutar_exclusivo(lambda: "hecho"))
+        latidos = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            latidos += 1
+        assert not seccion.done()
+        fcntl.flock(otro_worker, fcntl.LOCK_UN)
+        return latidos, await seccion
+
+    try:
+        assert asyncio.run(correr()) == (5, "hecho")
+    finally:
+        otro_worker.close()
+        coordinacion._loop = None
+
+
+def test_manejadores_en_hilo_agendan_en_el_loop(diario):
+    hilos = []
+
+    @coordinacion.manejador("prueba")
+    def _al_probar(ev, reproduciendo):
+        coordinacion.en_loop(lambda: hilos.append(threading.get_ident()))
+
+    async def correr():
+        coordinacion._loop = asyncio.get_running_loop()
+        n = await coordinacion.ejecutar_exclusivo(coordinacion.publicar, "prueba")
+        await asyncio.sleep(0)
+        return n
+
+    try:
+        assert asyncio.run(correr()) == 1
+    finally:
+        coordinacion._loop = None
+    assert hilos == [threading.get_ident()]
+
+
+def test_hilos_se_excluyen_entre_si(diario):
+    dentro = []
+    maximo = []
+
+    def seccion():
+        dentro.append(1)
+        maximo.append(len(dentro))
+        threading.Event().wait(0.01)
+        dentro.pop()
+
+    hilos = [threading.Thread(target=coordinacion._en_exclusivo, args=(seccion, ())) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert max(maximo) == 1
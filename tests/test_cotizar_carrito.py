@@ -0,0 +1,67 @@
+import pytest
+
+import productos_api
+
+CATALOGO = [
+    {"Codigo": "A", "Nombre": "Martillo", "Precio": 100.0, "Existencia": 5},
+    {"Codigo": "B", "Nombre": "Clavos", "Precio": 2.5, "Existencia": 0},
+]
+
+
+@pytest.fixture(autouse=True)
+def catalogo():
+    anterior = productos_api.vigente().productos
+    productos_api.publicar(CATALOGO)
+    yield
+    productos_api.publicar(list(anterior))
+
+
+def test_lineas_duplicadas_se_suman_antes_de_acotar_a_la_existencia():
+    r = productos_api.cotizar_carrito([{"Codigo": "A", "cantidad": 4}, {"Codigo": "A", "cantidad": 4}])
+    assert [(l["Codigo"], l["cantidad"]) for l in r["lineas"]] == [("A", 5)]
+    assert r["articulos"] == 5
+    assert r["ajustes"] == [{"Codigo": "A", "tipo": "existencia", "solicitada": 8, "disponible": 5}]
+
+
+@pytest.mark.parametrize("cantidad", ["inf", "-inf", "nan", float("inf"), None, "x"])
+def test_cantidades_no_finitas_no_fallan(cantidad):
+    r = productos_api.cotizar_carrito([{"Codigo": "A", "cantidad": cantidad}])
+    assert r["lineas"][0]["cantidad"] == 1
+
+
+def test_lineas_que_no_son_dict_se_reportan():
+    r = productos_api.cotizar_carrito(["A", None, {"Codigo": ["A"]}, {"Codigo": "A", "cantidad": 1}])
+    assert [a["tipo"] for a in r["ajustes"]] == ["invalida"] * 3
+    assert r["total"] == 100.0
+    assert not r["valido"]
+
+
+def test_precio_distinto_y_producto_inexistente():
+    r = productos_api.cotizar_carrito([{"Codigo": "A", "cantidad": 1, "Precio": 90}, {"Codigo": "Z", "cantidad": 1}])
+    assert {a["tipo"] for a in r["ajustes"]} == {"precio", "no_existe"}
+
+
+def test_endpoint_valida_lineas():
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    pytest.importorskip("passlib")
+    pytest.importorskip("jwt")
+    pytest.importorskip("email_validator")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routers import auth
+
+    app = FastAPI()
+    app.include_router(auth.router)
+    cliente = TestClient(app)
+
+    for cuerpo in ({"carrito": [{"Codigo": "A", "cantidad": "inf"}]},
+                   {"carrito": [{"Codigo": "A", "cantidad": "nan"}]},
+                   {"carrito": ["A"]}):
+        assert cliente.post("/usuario/carrito/cotizar", json=cuerpo).status_code == 422
+
+    res = cliente.post("/usuario/carrito/cotizar", json={"carrito": [
+        {"Codigo": "A", "cantidad": 3}, {"Codigo": "A", "cantidad": 3},
+    ]})
+    assert res.status_code == 200
+    assert res.json()["lineas"][0]["cantidad"] == 5
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import codec_json
+import contactos_persistencia
+import escritura_segura
+
+
+def test_archivo_con_checksum_sigue_siendo_json_plano(tmp_path):
+    ruta = str(tmp_path / "datos.json")
+    codec_json.escribir_archivo(ruta, [1, 2, 3], con_checksum=True)
+    assert json.loads((tmp_path / "datos.json").read_text()) == [1, 2, 3]
+    assert (tmp_path / "datos.json.crc").read_text() == f"{escritura_segura.checksum(b'[1,2,3]')} 7\n"
+    assert escritura_segura.leer_bytes(ruta) == b"[1,2,3]"
+    assert escritura_segura.verificar(ruta) is True
+
+
+def test_archivo_sin_sidecar_se_lee_sin_verificar(tmp_path):
+    ruta = tmp_path / "datos.json"
+    ruta.write_bytes(b"[1]")
+    assert escritura_segura.leer_bytes(str(ruta)) == b"[1]"
+    assert escritura_segura.verificar(str(ruta)) is None
+
+
+def test_encabezado_del_formato_anterior_se_quita(tmp_path):
+    ruta = tmp_path / "datos.json"
+    ruta.write_bytes(b"#crc32 00000000 3\n[1]")
+    assert codec_json.leer_archivo(str(ruta)) == [1]
+
+
+def test_truncado_se_detecta(tmp_path):
+    ruta = tmp_path / "datos.json"
+    escritura_segura.escribir_bytes(str(ruta), b'[{"id":"a"},{"id":"b"}]', con_checksum=True)
+    ruta.write_bytes(ruta.read_bytes()[:-5])
+    with pytest.raises(escritura_segura.ArchivoCorrupto):
+        escritura_segura.leer_bytes(str(ruta))
+    with pytest.raises(escritura_segura.ArchivoCorrupto):
+        codec_json.leer_archivo(str(ruta))
+
+
+def test_entre_reemplazos_el_sidecar_acepta_ambos_contenidos(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "datos.json")
+    escritura_segura.escribir_bytes(ruta, b"[1]", con_checksum=True)
+    vistos = []
+    reemplazar = escritura_segura._reemplazar
+
+    def reemplazar_y_leer(destino, *partes):
+        reemplazar(destino, *partes)
+        vistos.append(escritura_segura.leer_bytes(ruta))  # Un lector en cada paso
+
+    monkeypatch.setattr(escritura_segura, "_reemplazar", reemplazar_y_leer)
+    escritura_segura.escribir_bytes(ruta, b"[1,2]", con_checksum=True)
+    assert vistos == [b"[1]", b"[1,2]", b"[1,2]"]
+
+
+def test_escribir_sin_checksum_borra_el_sidecar(tmp_path):
+    ruta = tmp_path / "datos.json"
+    escritura_segura.escribir_bytes(str(ruta), b"[1]", con_checksum=True)
+    escritura_segura.escribir_bytes(str(ruta), b"[2]")
+    assert not (tmp_path / "datos.json.crc").exists()
+    assert escritura_segura.leer_bytes(str(ruta)) == b"[2]"
+
+
+def test_archivo_danado_no_se_parsea_y_se_restaura_el_backup(tmp_path, monkeypatch):
+    ruta = tmp_path / "direcciones.json"
+    codec_json.escribir_archivo(str(ruta), [{"id": "a"}], con_checksum=True)
+    ruta.write_bytes(codec_json.dumps([{"id": "x"}]))
+
+    def parsear(data):
+        raise AssertionError("no debía parsear un archivo que no coincide con su checksum")
+
+    monkeypatch.setattr(codec_json, "loads", parsear)
+    monkeypatch.setattr(contactos_persistencia.gestor_backups, "restaurar", lambda nombre: [{"id": "backup"}])
+    datos = contactos_persistencia._cargar_archivo(str(ruta), tipo="dirección", nombre_backup="direcciones")
+    assert datos == [{"id": "backup"}]
@@ -0,0 +1,58 @@
+import time
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import github_persistence as gh
+
+N = 16
+
+
+class _Respuesta:
+    status_code = 200
+    content = b'[{"Codigo": "A", "Nombre": "Martillo"}]'
+
+
+@pytest.fixture
+def github_lento(tmp_path, monkeypatch):
+    llamadas = []
+
+    def get(url, **kwargs):
+        llamadas.append(url)
+        time.sleep(0.2)  # Descarga lenta: las demás llamadas llegan mientras tanto
+        return _Respuesta()
+
+    monkeypatch.setattr(gh, "GITHUB_TOKEN", "token")
+    monkeypatch.setattr(gh, "GITHUB_OWNER", "dueno")
+    monkeypatch.setattr(gh, "GITHUB_REPO", "repo")
+    monkeypatch.setattr(gh.requests, "get", get)
+    gh.inicializar_github(str(tmp_path))
+    return llamadas
+
+
+def test_llamadas_concurrentes_hacen_una_sola_descarga(github_lento):
+    salida = threading.Barrier(N)
+    resultados = [None] * N
+
+    def cargar(i):
+        salida.wait()
+        resultados[i] = gh.cargar_productos_github()
+
+    hilos = [threading.Thread(target=cargar, args=(i,)) for i in range(N)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert len(github_lento) == 1
+    assert all(r == [{"Codigo": "A", "Nombre": "Martillo"}] for r in resultados)
+    assert not gh._vuelos
+
+
+def test_llamadas_seguidas_vuelven_a_descargar(github_lento):
+    gh.cargar_productos_github()
+    gh.cargar_productos_github()
+    assert len(github_lento) == 2
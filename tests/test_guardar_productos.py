@@ -0,0 +1,32 @@
+import pytest
+
+import gestor_backups
+import productos_api
+
+CATALOGO = [{"Codigo": "A", "Nombre": "Martillo"}, {"Codigo": "B", "Nombre": "Clavos"}]
+
+
+@pytest.fixture
+def aislado(tmp_path, monkeypatch):
+    monkeypatch.setattr(productos_api, "PRODUCTOS_FILE", str(tmp_path / "productos.json"))
+    monkeypatch.setattr(gestor_backups, "BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setattr(gestor_backups, "_ultimo_full", {})
+    monkeypatch.setattr(gestor_backups, "_ultimo_backup", {})
+    anterior = productos_api.vigente().productos
+    yield
+    productos_api.publicar(list(anterior))
+
+
+def test_limpiar_deja_punto_de_restauracion_del_catalogo_anterior(aislado):
+    anterior = productos_api.publicar(CATALOGO)
+    productos_api.publicar([])
+    productos_api.guardar_productos_api(anterior)
+    assert gestor_backups.restaurar("productos") == CATALOGO
+
+
+def test_sin_version_anterior_se_respalda_el_archivo(aislado):
+    productos_api.publicar(CATALOGO)
+    productos_api.guardar_productos_api()
+    productos_api.publicar(CATALOGO[:1])
+    productos_api.guardar_productos_api()
+    assert gestor_backups.restaurar("productos") == CATALOGO
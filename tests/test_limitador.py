@@ -0,0 +1,98 @@
+import asyncio
+
+import limitador
+
+
+def _app_lenta(llamadas, liberar):
+    """App ASGI que responde con encabezados propios de cada cliente (como CORS y Sesión)"""
+    async def app(scope, receive, send):
+        llamadas.append(scope)
+        await liberar.wait()
+        headers = dict(scope["headers"])
+        respuesta = [(b"content-type", b"application/json")]
+        if b"origin" in headers:
+            respuesta.append((b"access-control-allow-origin", headers[b"origin"]))
+        if b"cookie" in headers:
+            respuesta.append((b"set-cookie", headers[b"cookie"]))
+        await send({"type": "http.response.start", "status": 200, "headers": respuesta})
+        await send({"type": "http.response.body", "body": b"[]"})
+    return app
+
+
+def _scope(ip, headers):
+    return {"type": "http", "method": "GET", "path": "/producto", "query_string": b"",
+            "client": (ip, 1234), "headers": list(headers.items())}
+
+
+async def _pedir(middleware, scope):
+    mensajes = []
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    await middleware(scope, receive, send)
+    return dict(mensajes[0]["headers"])
+
+
+def _dos_clientes(headers_a, headers_b):
+    async def correr():
+        llamadas, liberar = [], asyncio.Event()
+        middleware = limitador.MiddlewareLimitador(_app_lenta(llamadas, liberar), reglas={
+            "/producto": limitador.Regla(agrupar=True),
+        })
+        a = asyncio.create_task(_pedir(middleware, _scope("10.0.0.1", headers_a)))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(_pedir(middleware, _scope("10.0.0.2", headers_b)))
+        await asyncio.sleep(0)
+        liberar.set()
+        return await a, await b, len(llamadas)
+    return asyncio.run(correr())
+
+
+def test_agrupada_no_recibe_cookie_ni_cors_de_otro_cliente():
+    a, b, llamadas = _dos_clientes(
+        {b"origin": b"https://a.example", b"cookie": b"session=de-a"},
+        {b"origin": b"https://b.example"},
+    )
+    assert a[b"set-cookie"] == b"session=de-a"
+    assert a[b"access-control-allow-origin"] == b"https://a.example"
+    assert b"set-cookie" not in b
+    assert b.get(b"access-control-allow-origin") == b"https://b.example"
+    assert llamadas == 2
+
+
+def test_mismo_origen_se_agrupa_sin_cookie_ajena():
+    a, b, llamadas = _dos_clientes(
+        {b"origin": b"https://a.example", b"cookie": b"session=de-a"},
+        {b"origin": b"https://a.example"},
+    )
+    assert llamadas == 1
+    assert a[b"set-cookie"] == b"session=de-a"
+    assert b"set-cookie" not in b
+
+
+def _scope_proxy(xff):
+    return {"type": "http", "client": ("10.9.9.9", 1234), "headers": [(b"x-forwarded-for", xff)]}
+
+
+def test_cliente_es_el_salto_que_agrego_el_proxy(monkeypatch):
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 1)
+    assert limitador._cliente(_scope_proxy(b"203.0.113.7")) == "203.0.113.7"
+    # Lo que el cliente mande a la izquierda no cambia su cubeta
+    assert limitador._cliente(_scope_proxy(b"1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert limitador._cliente(_scope_proxy(b"5.6.7.8, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_varios_proxies_confiables(monkeypatch):
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 2)
+    assert limitador._cliente(_scope_proxy(b"1.2.3.4, 203.0.113.7, 10.0.0.5")) == "203.0.113.7"
+
+
+def test_sin_proxy_se_usa_la_conexion(monkeypatch):
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 0)
+    assert limitador._cliente(_scope_proxy(b"203.0.113.7")) == "10.9.9.9"
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 1)
+    assert limitador._cliente({"type": "http", "client": ("10.9.9.9", 1), "headers": []}) == "10.9.9.9"
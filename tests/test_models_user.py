@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from backend import models_user
+
+
+@pytest.fixture(autouse=True)
+def aislado(tmp_path, monkeypatch):
+    monkeypatch.setattr(models_user, "DB_USERS", str(tmp_path / "data_users.json"))
+    monkeypatch.setattr(models_user, "CARRITOS_DIR", str(tmp_path / "carritos"))
+    monkeypatch.setattr(models_user, "_cache", None)
+    monkeypatch.setattr(models_user, "_firma", None)
+
+
+def _registrar_desde_otro_worker(correo):
+    # Otro proceso con su propia caché: lee el archivo, agrega y lo reemplaza
+    with open(models_user.DB_USERS, encoding="utf-8") as f:
+        data = json.load(f)
+    data[correo] = {"nombre": "Otro", "password": "x"}
+    models_user._escribir_json(models_user.DB_USERS, data, indent=2)
+
+
+def test_registro_de_otro_worker_no_se_pierde():
+    assert models_user.crear_usuario("a@x.com", "A", "h")
+    _registrar_desde_otro_worker("b@x.com")
+    assert models_user.crear_usuario("c@x.com", "C", "h")
+
+    with open(models_user.DB_USERS, encoding="utf-8") as f:
+        assert set(json.load(f)) == {"a@x.com", "b@x.com", "c@x.com"}
+    assert models_user.obtener_usuario("b@x.com")["nombre"] == "Otro"
+
+
+def test_correo_registrado_por_otro_worker_se_rechaza():
+    models_user.crear_usuario("a@x.com", "A", "h")
+    _registrar_desde_otro_worker("b@x.com")
+    assert models_user.crear_usuario("b@x.com", "B", "h") is False
@@ -0,0 +1,131 @@
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+
+import bitacora
+import escritura_segura
+
+log = bitacora.obtener_logger("usuarios")
+
+# =============================
+# 📁 Configuración de archivos
+# =============================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+USUARIOS_FILE = os.path.join(SCRIPT_DIR, "usuarios.jsonl")  # Un usuario por línea (solo se agrega)
+USUARIOS_JSON_ANTERIOR = os.path.join(SCRIPT_DIR, "usuarios.json")  # Formato anterior (lista completa)
+
+# =============================
+# 🧠 Estado global
+# =============================
+usuarios: dict[str, dict] = {}  # email normalizado -> usuario
+_cargado = False
+_lock_carga = threading.Lock()
+_lock_registro = asyncio.Lock()  # Serializa altas concurrentes (mismo event loop)
+
+# =============================
+# 🔧 Funciones auxiliares
+# =============================
+
+def _clave(email):
+    return (email or "").strip().lower()
+
+
+def _anexar(usuario):
+    """Agrega una línea al archivo y hace fsync (una sola escritura pequeña)"""
+    linea = json.dumps(usuario, ensure_ascii=False) + "\n"
+    with open(USUARIOS_FILE, "a", encoding="utf-8") as f:
+        f.write(linea)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _migrar_formato_anterior():
+    """Convierte usuarios.json (lista) al archivo por líneas una única vez"""
+    try:
+        with open(USUARIOS_JSON_ANTERIOR, "r", encoding="utf-8") as f:
+            anteriores = json.load(f)
+    except Exception as e:
+        log.warning("No se pudo leer %s: %s", USUARIOS_JSON_ANTERIOR, e)
+        return
+
+    lineas = [
+        json.dumps(u, ensure_ascii=False) + "\n"
+        for u in (anteriores if isinstance(anteriores, list) else [])
+        if isinstance(u, dict) and u.get("email")
+    ]
+    escritura_segura.escribir_texto(USUARIOS_FILE, "".join(lineas))
+    log.info("usuarios.json migrado a %s", os.path.basename(USUARIOS_FILE))
+
+
+# =============================
+# 📥 Carga
+# =============================
+
+def cargar_usuarios():
+    """Carga el índice de usuarios por email (una sola vez)"""
+    global _cargado
+    with _lock_carga:
+        if _cargado:
+            return usuarios
+
+        if not os.path.exists(USUARIOS_FILE) and os.path.exists(USUARIOS_JSON_ANTERIOR):
+            _migrar_formato_anterior()
+
+        if os.path.exists(USUARIOS_FILE):
+            with open(USUARIOS_FILE, "r", encoding="utf-8") as f:
+                for num, linea in enumerate(f, 1):
+                    if not linea.strip():
+                        continue
+                    try:
+                        u = json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Una línea truncada por un corte a media escritura no invalida las demás
+                        log.warning("Línea %d inválida en %s", num, os.path.basename(USUARIOS_FILE))
+                        continue
+                    usuarios[_clave(u.get("email"))] = u
+
+        _cargado = True
+        log.info("Usuarios OAuth cargados: %d", len(usuarios))
+        return usuarios
+
+
+def obtener_usuario(email):
+    """Devuelve el usuario por email o None (O(1))"""
+    cargar_usuarios()
+    return usuarios.get(_clave(email))
+
+
+# =============================
+# 📝 Registro
+# =============================
+
+async def registrar_si_nuevo(nombre, email, foto=""):
+    """
+    Registra al usuario si su email no existe. Devuelve True si se agregó.
+    La escritura va a un hilo para no bloquear el event loop.
+    """
+    clave = _clave(email)
+    if not clave:
+        return False
+
+    if not _cargado:
+        await asyncio.to_thread(cargar_usuarios)
+    if clave in usuarios:
+        return False
+
+    async with _lock_registro:
+        if clave in usuarios:
+            return False
+        usuario = {
+            "nombre": nombre,
+            "email": email,
+            "foto": foto or "",
+            "fecha_registro": datetime.now().isoformat()
+        }
+        await asyncio.to_thread(_anexar, usuario)
+        usuarios[clave] = usuario
+
+    log.info("Usuario OAuth registrado: %s", email)
+    return True